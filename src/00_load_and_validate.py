@@ -4,19 +4,26 @@
 #   - Load raw Delhi AQI CSV data
 #   - Validate structure
 #   - Report missingness
+#   - Write the raw data-quality profile (coverage + gaps)
 # ============================================================
 
 import pandas as pd
 from pathlib import Path
 
+import data_profile
+from instrument import StageMetrics
+
 # --- Paths ---------------------------------------------------
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 DATA_RAW = PROJECT_ROOT / "data" / "raw"
+PROFILE_DIR = PROJECT_ROOT / "data" / "interim" / "profile"
 
 DL_DATA_PATH = DATA_RAW / "dl_data.csv"
 DL_DETAILS_PATH = DATA_RAW / "dl_details.csv"
 LOCS_PRED_PATH = DATA_RAW / "locs_pred.csv"
 
+stage_metrics = StageMetrics("00_load_and_validate")
+
 # --- Load data ----------------------------------------------
 print("Loading raw data...")
 
@@ -51,26 +58,30 @@ actual_pollutants = set(dl_data.columns) & expected_pollutants
 print("Pollutant columns found:", actual_pollutants)
 assert len(actual_pollutants) >= 5, "Too few pollutant columns found"
 
+# --- Data-quality profile -----------------------------------
+print("\nBuilding data-quality profile...")
+
+coverage = data_profile.coverage_from_wide(dl_data, sorted(actual_pollutants))
+gaps = data_profile.gaps_from_wide(dl_data, sorted(actual_pollutants))
+
+cov_path, gap_path = data_profile.save_profile(coverage, gaps, "raw", PROFILE_DIR)
+print("Saved profile to:", cov_path.parent)
+
 # --- Missing data report ------------------------------------
 print("\nMissing data summary (percent):")
 
-missing_pct = (
-    dl_data[sorted(actual_pollutants)]
-    .isna()
-    .mean()
-    .mul(100)
-    .round(2)
-)
+missing_pct = data_profile.missing_by(coverage, "pollutant")["missing_pct"]
 
 print(missing_pct)
 
+print("\nGap type distribution:")
+print(data_profile.gap_type_counts(gaps))
+
 # --- Per-station missingness --------------------------------
 print("\nTop 5 stations by total missing values:")
 
 station_missing = (
-    dl_data
-    .groupby("station_id")[sorted(actual_pollutants)]
-    .apply(lambda x: x.isna().sum().sum())
+    data_profile.missing_by(coverage, "station_id")["missing"]
     .sort_values(ascending=False)
     .head(5)
 )
@@ -78,3 +89,5 @@ station_missing = (
 print(station_missing)
 
 print("\nValidation complete. No data modified.")
+
+stage_metrics.close(rows=len(dl_data))
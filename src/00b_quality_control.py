@@ -0,0 +1,170 @@
+# ============================================================
+# 00b_quality_control.py
+# Flag raw sensor faults before gap analysis
+#   - bounds   : negative or above a physical maximum
+#   - flatline : the same value repeated for FLATLINE_HOURS or
+#                more consecutive hours (stuck sensor)
+#   - spike    : Hampel-style outlier against a centred rolling
+#                median; the spread is the rolling median of the
+#                absolute deviations (scaled MAD), floored per
+#                pollutant so quiet series are not over-flagged.
+#                The value must also stand out from both adjacent
+#                hours, so rush-hour peaks and episode onsets that
+#                build up over several hours are kept
+#
+# All checks run on one (hour × station·pollutant) grid, so every
+# station and pollutant is handled by the same array operations.
+# Flagged values become NaN in data/interim/dl_data_qc.csv, which
+# 01_gap_analysis.py and the 01_* fitting stages read instead of
+# the raw file; every removed value is listed with its reason in
+# data/interim/qc_flags.csv.
+# ============================================================
+
+import pandas as pd
+import numpy as np
+from pathlib import Path
+
+from instrument import StageMetrics
+
+# ---------------- CONFIG ----------------
+DATA_FILE = "data/raw/dl_data.csv"
+OUT_FILE = "data/interim/dl_data_qc.csv"
+FLAGS_FILE = "data/interim/qc_flags.csv"
+SUMMARY_FILE = "data/interim/qc_summary.csv"
+
+POLLUTANTS = ["pm2.5", "pm10", "nox", "so2", "co", "o3"]
+
+# Physical upper bounds (µg/m³; CO in mg/m³); lenient, meant for
+# error codes and unit slips rather than real episodes
+MAX_VALUE = {"pm2.5": 2000, "pm10": 3000, "nox": 2000, "so2": 1000, "co": 100, "o3": 1000}
+
+FLATLINE_HOURS = 12
+
+SPIKE_WINDOW = 25           # hours, centred
+SPIKE_MIN_PERIODS = 12
+SPIKE_K = 6.0               # flagged beyond K scaled MADs from the rolling median
+MAD_FLOOR = {"pm2.5": 5.0, "pm10": 10.0, "nox": 5.0, "so2": 1.0, "co": 0.1, "o3": 5.0}
+
+# Reason codes, in the order the checks are applied
+REASONS = ["negative", "above_max", "flatline", "spike"]
+# ---------------------------------------
+
+stage_metrics = StageMetrics("00b_quality_control")
+
+print("Loading raw data...")
+df = pd.read_csv(DATA_FILE, parse_dates=["datetime"])
+pollutants = [p for p in POLLUTANTS if p in df.columns]
+
+# ------------------------------------------------
+# (hour × station·pollutant) grid
+# ------------------------------------------------
+with stage_metrics.phase("grid"):
+    hours = pd.date_range(df["datetime"].min(), df["datetime"].max(), freq="h")
+    station_ids = np.sort(df["station_id"].unique())
+    n_st = len(station_ids)
+
+    t_idx = hours.get_indexer(df["datetime"])
+    s_idx = np.searchsorted(station_ids, df["station_id"].values)
+
+    # Column c = pollutant (c // n_st), station (c % n_st)
+    V = np.full((len(hours), len(pollutants) * n_st), np.nan)
+    for k, p in enumerate(pollutants):
+        V[t_idx, k * n_st + s_idx] = df[p].values
+
+    col_max = np.repeat([MAX_VALUE[p] for p in pollutants], n_st)
+    col_floor = np.repeat([MAD_FLOOR[p] for p in pollutants], n_st)
+
+print(f"Grid: {len(hours):,} hours × {n_st} stations × {len(pollutants)} pollutants")
+
+# 0 = kept, otherwise 1 + index into REASONS
+reason = np.zeros(V.shape, dtype=np.int8)
+observed = ~np.isnan(V)
+
+# ------------------------------------------------
+# Physical bounds
+# ------------------------------------------------
+with stage_metrics.phase("bounds"):
+    reason[observed & (V < 0)] = 1 + REASONS.index("negative")
+    reason[observed & (V > col_max)] = 1 + REASONS.index("above_max")
+
+# ------------------------------------------------
+# Flatlines: runs of identical values down each column
+# ------------------------------------------------
+with stage_metrics.phase("flatline"):
+    W = np.where(reason == 0, V, np.nan)
+    Wc = W.T.ravel()                      # column-major: each series contiguous
+
+    starts = np.ones(Wc.shape, dtype=bool)
+    starts[1:] = Wc[1:] != Wc[:-1]        # NaN != NaN, so gaps break runs
+    starts[::len(hours)] = True           # a run never crosses into the next column
+
+    run_id = np.cumsum(starts) - 1
+    run_len = np.bincount(run_id)[run_id]
+    stuck = (run_len >= FLATLINE_HOURS) & ~np.isnan(Wc)
+
+    reason[stuck.reshape(W.shape[1], len(hours)).T] = 1 + REASONS.index("flatline")
+
+# ------------------------------------------------
+# Spikes: centred rolling median / MAD on what is left
+# ------------------------------------------------
+with stage_metrics.phase("spike"):
+    W = pd.DataFrame(np.where(reason == 0, V, np.nan))
+    roll = dict(window=SPIKE_WINDOW, center=True, min_periods=SPIKE_MIN_PERIODS)
+
+    med = W.rolling(**roll).median()
+    dev = (W - med).abs()
+    mad = dev.rolling(**roll).median().values * 1.4826
+
+    limit = SPIKE_K * np.fmax(mad, col_floor)
+    x = W.values
+    jump = np.fmin(np.abs(x - W.shift(1).values), np.abs(x - W.shift(-1).values))
+
+    # NaN compares False: values without both neighbours are never spikes
+    spike = (dev.values > limit) & (jump > limit)
+    reason[spike] = 1 + REASONS.index("spike")
+    del W, med, dev, mad, x, jump
+
+# ------------------------------------------------
+# Apply: flagged values → NaN, in the raw row order
+# ------------------------------------------------
+flag_frames = []
+summary = []
+out = df.copy()
+
+for k, p in enumerate(pollutants):
+    r = reason[t_idx, k * n_st + s_idx]
+    flagged = r > 0
+
+    flag_frames.append(pd.DataFrame({
+        "station_id": df["station_id"].values[flagged],
+        "datetime": df["datetime"].values[flagged],
+        "pollutant": p,
+        "value": df[p].values[flagged],
+        "reason": np.array(REASONS)[r[flagged] - 1],
+    }))
+    out.loc[flagged, p] = np.nan
+
+    counts = np.bincount(r, minlength=len(REASONS) + 1)
+    summary.append({
+        "pollutant": p,
+        "observed": int(df[p].notna().sum()),
+        **{name: int(counts[i + 1]) for i, name in enumerate(REASONS)},
+        "flagged_pct": 100 * flagged.sum() / max(1, df[p].notna().sum()),
+    })
+
+flags = pd.concat(flag_frames, ignore_index=True)
+summary = pd.DataFrame(summary)
+
+Path(OUT_FILE).parent.mkdir(parents=True, exist_ok=True)
+out.to_csv(OUT_FILE, index=False)
+flags.to_csv(FLAGS_FILE, index=False)
+summary.to_csv(SUMMARY_FILE, index=False)
+
+print("\nQC flags by pollutant:")
+print(summary.to_string(index=False))
+print("\nSaved QC data →", OUT_FILE)
+print("Saved flags   →", FLAGS_FILE)
+
+for name in REASONS:
+    stage_metrics.count(f"flagged_{name}", int(summary[name].sum()))
+stage_metrics.close(rows=len(df))
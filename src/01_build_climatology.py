@@ -0,0 +1,42 @@
+# ============================================================
+# 01_build_climatology.py
+# Station climatology cube (month × hour-of-week medians) used
+# by 02_imputation.py when too few neighbours report for IDW /
+# kriging on a long gap
+# ============================================================
+
+import pandas as pd
+import numpy as np
+
+from climatology import Climatology, CLIMATOLOGY_FILE
+from instrument import StageMetrics
+
+# ---------------- CONFIG ----------------
+DATA_FILE = "data/interim/dl_data_trimmed.csv"
+OUT_FILE = CLIMATOLOGY_FILE
+
+POLLUTANTS = ["pm2.5", "pm10", "nox", "so2", "co", "o3"]
+# ---------------------------------------
+
+stage_metrics = StageMetrics("01_build_climatology")
+
+print("Loading data...")
+df = pd.read_csv(DATA_FILE, parse_dates=["datetime"])
+
+print("Building climatology cube...")
+with stage_metrics.phase("build"):
+    clim = Climatology.build(df, POLLUTANTS)
+
+clim.save(OUT_FILE)
+
+print(f"\nStations: {len(clim.station_ids)}   cube: {clim.cube.shape}, "
+      f"{clim.cube.nbytes / 1e6:.1f} MB")
+for i, p in enumerate(POLLUTANTS):
+    missing = np.isnan(clim.cube[i]).all(axis=(1, 2)).sum()
+    print(f"  {p:6s} median of cells: {np.nanmedian(clim.cube[i]):8.2f}   "
+          f"stations without data: {missing}")
+
+print("Saved:", OUT_FILE)
+
+stage_metrics.count("stations", len(clim.station_ids))
+stage_metrics.close(rows=len(df))
@@ -1,10 +1,13 @@
 # ============================================================
 # 01_gap_analysis.py
 # Purpose:
+#   - Read the QC-cleaned data (faults already NaN)
 #   - Remove structural missing data (pre-station start)
 #   - Detect consecutive missing-value gaps
 #   - Classify gaps into short / medium / long
 #   - NO imputation performed here
+#   - Runs on one station shard when AQI_SHARD is set
+#     (see run_sharded.py)
 # ============================================================
 
 import pandas as pd
@@ -12,14 +15,16 @@ import numpy as np
 from pathlib import Path
 from tqdm import tqdm
 
+from instrument import StageMetrics
+from sharding import filter_stations, shard_path
+
 # --- Paths ---------------------------------------------------
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
-DATA_RAW = PROJECT_ROOT / "data" / "raw"
 DATA_INTERIM = PROJECT_ROOT / "data" / "interim"
 
 DATA_INTERIM.mkdir(parents=True, exist_ok=True)
 
-DL_DATA_PATH = DATA_RAW / "dl_data.csv"
+DL_DATA_PATH = DATA_INTERIM / "dl_data_qc.csv"      # after 00b_quality_control.py
 OUT_GAP_SUMMARY = DATA_INTERIM / "gap_summary.csv"
 OUT_TRIMMED_DATA = DATA_INTERIM / "dl_data_trimmed.csv"
 
@@ -29,9 +34,12 @@ POLLUTANTS = ["pm2.5", "pm10", "nox", "so2", "co", "o3"]
 SHORT_GAP_HOURS = 6
 MEDIUM_GAP_HOURS = 72
 
+stage_metrics = StageMetrics("01_gap_analysis")
+
 # --- Load data ----------------------------------------------
 print("Loading data...")
 df = pd.read_csv(DL_DATA_PATH, parse_dates=["datetime"])
+df = filter_stations(df)
 
 print("Rows before trimming:", len(df))
 
@@ -68,7 +76,7 @@ df_trimmed = pd.concat(trimmed_frames, ignore_index=True)
 print("Rows after trimming:", len(df_trimmed))
 
 # Save trimmed data (still unfilled)
-df_trimmed.to_csv(OUT_TRIMMED_DATA, index=False)
+df_trimmed.to_csv(shard_path(OUT_TRIMMED_DATA), index=False)
 print("Saved trimmed data to:", OUT_TRIMMED_DATA)
 
 # --- Gap detection ------------------------------------------
@@ -96,6 +104,7 @@ for station_id, sdf in tqdm(df_trimmed.groupby("station_id"), desc="Gap analysis
                 gap_type = "medium"
             else:
                 gap_type = "long"
+            stage_metrics.count(f"{gap_type}_gaps")
 
             gap_records.append({
                 "station_id": station_id,
@@ -109,7 +118,7 @@ for station_id, sdf in tqdm(df_trimmed.groupby("station_id"), desc="Gap analysis
 gap_df = pd.DataFrame(gap_records)
 
 # --- Save gap summary ---------------------------------------
-gap_df.to_csv(OUT_GAP_SUMMARY, index=False)
+gap_df.to_csv(shard_path(OUT_GAP_SUMMARY), index=False)
 
 print("Saved gap summary to:", OUT_GAP_SUMMARY)
 
@@ -119,3 +128,5 @@ print(gap_df["gap_type"].value_counts())
 
 print("\nGap analysis complete.")
 print("No imputation performed.")
+
+stage_metrics.close(rows=len(df))
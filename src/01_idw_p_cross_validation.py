@@ -4,27 +4,34 @@
 # for each pollutant
 # ============================================================
 
+import os
+
 import pandas as pd
 import numpy as np
 from scipy.spatial.distance import cdist
 from tqdm import tqdm
 
+from instrument import StageMetrics
+
 # ---------------- CONFIG ----------------
-DATA_FILE = "data/raw/dl_data.csv"
+DATA_FILE = "data/interim/dl_data_qc.csv"
 STATIONS_FILE = "data/raw/dl_details.csv"
 OUT_FILE = "data/interim/idw_p_values.csv"
 
 POLLUTANTS = ["pm2.5", "pm10", "nox", "so2", "co", "o3"]
-P_VALUES = np.round(np.arange(0.2, 2.01, 0.01), 2)
+P_STEP = float(os.environ.get("AQI_IDW_P_STEP", "0.01"))
+P_VALUES = np.round(np.arange(0.2, 2.0 + P_STEP / 2, P_STEP), 2)
 
 N_NEIGHBORS = 5
 HIST_DAYS = 30
-MAX_TIMESTAMPS = 200   # subsampling for speed
+MAX_TIMESTAMPS = int(os.environ.get("AQI_IDW_MAX_TIMESTAMPS", "200"))   # subsampling for speed
 RANDOM_SEED = 42
 # ----------------------------------------
 
 np.random.seed(RANDOM_SEED)
 
+stage_metrics = StageMetrics("01_idw_p_cross_validation")
+
 print("Loading data...")
 df = pd.read_csv(DATA_FILE, parse_dates=["datetime"])
 stations = pd.read_csv(STATIONS_FILE)
@@ -115,3 +122,5 @@ out.to_csv(OUT_FILE, index=False)
 
 print("\nOptimized IDW p-values saved to:", OUT_FILE)
 print(out)
+
+stage_metrics.close(rows=len(df))
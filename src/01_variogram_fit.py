@@ -0,0 +1,101 @@
+# ============================================================
+# 01_variogram_fit.py
+# Fit a variogram per pollutant for ordinary kriging
+#   - Empirical semivariance from station pairs, pooled over a
+#     sample of hours
+#   - Best of spherical / exponential / gaussian by weighted
+#     least squares
+#   - Leave-one-station-out kriging RMSE for comparison with the
+#     IDW cross-validation in 01_idw_p_cross_validation.py
+# ============================================================
+
+import pandas as pd
+import numpy as np
+
+from instrument import StageMetrics
+from kriging import empirical_variogram, fit_variogram, OrdinaryKriging, VARIOGRAM_FILE
+
+# ---------------- CONFIG ----------------
+DATA_FILE = "data/interim/dl_data_qc.csv"
+STATIONS_FILE = "data/raw/dl_details.csv"
+OUT_FILE = VARIOGRAM_FILE
+
+POLLUTANTS = ["pm2.5", "pm10", "nox", "so2", "co", "o3"]
+
+MAX_HOURS = 5000       # hours pooled into the empirical variogram
+MAX_CV_HOURS = 200     # hours used for the leave-one-out check
+N_NEIGHBORS = 5
+RANDOM_SEED = 42
+# ----------------------------------------
+
+rng = np.random.default_rng(RANDOM_SEED)
+
+stage_metrics = StageMetrics("01_variogram_fit")
+
+print("Loading data...")
+df = pd.read_csv(DATA_FILE, parse_dates=["datetime"])
+stations = pd.read_csv(STATIONS_FILE).set_index("station_id")
+
+station_ids = np.sort(df["station_id"].unique())
+station_ids = station_ids[np.isin(station_ids, stations.index)]
+coords = stations.loc[station_ids, ["lon", "lat"]].values
+
+# ---------------- Fit ----------------
+results = []
+
+for pollutant in POLLUTANTS:
+    print(f"\nFitting variogram for {pollutant.upper()}")
+
+    X = (
+        df.pivot_table(index="datetime", columns="station_id", values=pollutant)
+        .reindex(columns=station_ids)
+        .values
+    )
+    # Hours with at least two stations carry pair information
+    X = X[(~np.isnan(X)).sum(axis=1) >= 2]
+    if len(X) == 0:
+        print("  no overlapping observations, skipped")
+        continue
+
+    sample = X[rng.choice(len(X), size=min(MAX_HOURS, len(X)), replace=False)]
+
+    with stage_metrics.phase("empirical"):
+        emp = empirical_variogram(sample, coords)
+    params = fit_variogram(emp)
+    print(f"  {params['model']}: nugget={params['nugget']:.3f} "
+          f"psill={params['psill']:.3f} range={params['range']:.4f}")
+
+    # ---- Leave-one-station-out check ----
+    with stage_metrics.phase("cross_validation"):
+        ok = OrdinaryKriging(coords, params, min_points=N_NEIGHBORS)
+        cv = X[rng.choice(len(X), size=min(MAX_CV_HOURS, len(X)), replace=False)]
+        errors = []
+        for s in range(len(station_ids)):
+            has_truth = ~np.isnan(cv[:, s])
+            if not has_truth.any():
+                continue
+            vals = cv[has_truth].copy()
+            truth = vals[:, s].copy()
+            vals[:, s] = np.nan
+            est, _ = ok.predict(vals, coords[s:s + 1], targets_key=s)
+            errors.append(est[:, 0] - truth)
+        errors = np.concatenate(errors) if errors else np.array([])
+        errors = errors[~np.isnan(errors)]
+
+    stage_metrics.count("kriging_factorizations", ok.stats["factorizations"])
+
+    results.append({
+        "pollutant": pollutant,
+        **params,
+        "n_bins": len(emp),
+        "loo_rmse": np.sqrt(np.mean(errors ** 2)) if errors.size else np.nan,
+    })
+
+# ---------------- Save results ----------------
+out = pd.DataFrame(results)
+out.to_csv(OUT_FILE, index=False)
+
+print("\nVariogram parameters saved to:", OUT_FILE)
+print(out)
+
+stage_metrics.close(rows=len(df))
@@ -1,19 +1,40 @@
 # ============================================================
 # 02_imputation.py
 # Hybrid imputation for Delhi AQI data
+#   AQI_INTERPOLATOR=kriging fills long gaps with ordinary
+#   kriging instead of IDW
+#   Long-gap hours with fewer than N_NEIGHBORS reporting
+#   stations fall back to the station climatology cube
+#   (01_build_climatology.py), scaled by any that do report
+#   Runs on one station shard when AQI_SHARD is set; neighbour
+#   values then come from the shard exchange (run_sharded.py)
+#   Each finished pollutant × station is checkpointed under
+#   CHECKPOINT_DIR; a restarted run skips those and the output is
+#   merged from the partitions, so results never pile up in RAM
 # ============================================================
 
+import os
+from pathlib import Path
+
 import pandas as pd
 import numpy as np
-from scipy.spatial.distance import cdist
-from pykalman import KalmanFilter
 from tqdm import tqdm
 
+import data_profile
+import sharding
+from checkpoint import UnitCheckpoint, fingerprint
+from climatology import Climatology, CLIMATOLOGY_FILE
+from imputation import find_nan_blocks, kalman_fill, idw_predict, KALMAN_PAD
+from instrument import StageMetrics
+from kriging import OrdinaryKriging, load_variograms, VARIOGRAM_FILE
+from sharding import filter_stations, shard_path, load_exchange, active as sharded
+
 # ---------------- CONFIG ----------------
 DATA_FILE = "data/interim/dl_data_trimmed.csv"
 STATIONS_FILE = "data/raw/dl_details.csv"
 P_FILE = "data/interim/idw_p_values.csv"
 OUT_FILE = "data/interim/dl_data_imputed.csv"
+CHECKPOINT_DIR = "data/interim/checkpoints/02_imputation"
 
 POLLUTANTS = ["pm2.5", "pm10", "nox", "so2", "co", "o3"]
 
@@ -21,12 +42,24 @@ SHORT_GAP_HRS = 6
 MEDIUM_GAP_HRS = 72
 MIN_P_CLIP = 0.2
 N_NEIGHBORS = 5
+INTERPOLATOR = os.environ.get("AQI_INTERPOLATOR", "idw")   # "idw" | "kriging"
 # ---------------------------------------
 
+stage_metrics = StageMetrics("02_imputation")
+
 print("Loading data...")
 df = pd.read_csv(DATA_FILE, parse_dates=["datetime"])
+df = filter_stations(df)
 stations = pd.read_csv(STATIONS_FILE)
+exchange = load_exchange()
 p_vals = pd.read_csv(P_FILE).set_index("pollutant")["best_p"].to_dict()
+variograms = load_variograms(VARIOGRAM_FILE) if INTERPOLATOR == "kriging" else {}
+
+if Path(CLIMATOLOGY_FILE).exists():
+    clim = Climatology.load(CLIMATOLOGY_FILE)
+else:
+    clim = None
+    print(f"No climatology cube at {CLIMATOLOGY_FILE}; sparse long-gap hours stay NaN")
 
 df = df.merge(
     stations[["station_id", "lon", "lat"]],
@@ -36,122 +69,195 @@ df = df.merge(
 
 df = df.sort_values(["station_id", "datetime"]).reset_index(drop=True)
 
-# ---------------- Helpers ----------------
-
-def find_nan_blocks(series):
-    is_na = series.isna().values
-    blocks = []
-    i = 0
-    while i < len(is_na):
-        if is_na[i]:
-            j = i
-            while j < len(is_na) and is_na[j]:
-                j += 1
-            blocks.append((i, j, j - i))
-            i = j
-        else:
-            i += 1
-    return blocks
-
+# ---------------- Checkpoint ----------------
+# Partitions are only reused for the same inputs, code and settings
+src_dir = Path(__file__).resolve().parent
+ckpt = UnitCheckpoint(shard_path(CHECKPOINT_DIR), fingerprint(
+    [DATA_FILE, STATIONS_FILE, P_FILE, CLIMATOLOGY_FILE, VARIOGRAM_FILE]
+    + ([sharding.SHARD_DIR / sharding.MANIFEST_FILE] if sharded() else []),
+    [src_dir / f for f in ("02_imputation.py", "imputation.py", "kriging.py", "climatology.py")],
+    {"interpolator": INTERPOLATOR, "short": SHORT_GAP_HRS, "medium": MEDIUM_GAP_HRS,
+     "min_p": MIN_P_CLIP, "neighbors": N_NEIGHBORS, "shard": sharding.SHARD},
+))
 
-def kalman_fill(values):
-    obs = values[~np.isnan(values)]
-    if len(obs) == 0:
-        return values
+station_ids = np.sort(df["station_id"].unique())
+units = [(p, sid) for p in POLLUTANTS for sid in station_ids]
 
-    kf = KalmanFilter(
-        initial_state_mean=np.mean(obs),
-        observation_covariance=1.0,
-        transition_covariance=0.01
-    )
+def unit_key(pollutant, station_id):
+    return f"{pollutant}/{station_id}"
 
-    filled, _ = kf.smooth(values)
-    return filled.flatten()
-
-
-def idw_predict(target_row, others_df, p):
-    coords_t = target_row[["lon", "lat"]].values.reshape(1, -1)
-    coords_o = others_df[["lon", "lat"]].values
-    vals = others_df["val"].values
-
-    dists = cdist(coords_t, coords_o)[0]
-    idx = np.argsort(dists)[:N_NEIGHBORS]
-
-    d = np.maximum(dists[idx], 1e-3)
-    w = 1.0 / (d ** p)
-
-    return np.sum(w * vals[idx]) / np.sum(w)
+def unit_file(pollutant, station_id):
+    return f"{pollutant.replace('.', '')}_{station_id}.csv"
 
 # ---------------- Imputation ----------------
 
 print("Starting hybrid imputation...")
-out_frames = []
 
 for pollutant in POLLUTANTS:
     print(f"\nImputing {pollutant.upper()}")
 
+    if all(ckpt.is_done(unit_key(pollutant, sid)) for sid in station_ids):
+        print("  all stations checkpointed")
+        continue
+
     p_used = max(p_vals.get(pollutant, 1.0), MIN_P_CLIP)
 
     df_p = df[["station_id", "datetime", "lon", "lat", pollutant]].copy()
     df_p = df_p.rename(columns={pollutant: "val"})
 
+    # Observed values of every station, for long-gap neighbour reads
+    if exchange is None:
+        nbr_p = df_p
+    else:
+        nbr_p = exchange.long(pollutant).merge(
+            stations[["station_id", "lon", "lat"]], on="station_id", how="left"
+        )
+
+    if INTERPOLATOR == "kriging":
+        # Observed values as (hour × station); the kriging solve is
+        # shared by every gap hour with the same reporting stations
+        if exchange is None:
+            wide = df_p.pivot(index="datetime", columns="station_id", values="val")
+        else:
+            wide = exchange.frame(pollutant)
+        station_col = {sid: i for i, sid in enumerate(wide.columns)}
+        krig = OrdinaryKriging(
+            stations.set_index("station_id").loc[wide.columns, ["lon", "lat"]].values,
+            variograms[pollutant],
+            min_points=N_NEIGHBORS
+        )
+
     for station_id, g in tqdm(df_p.groupby("station_id"), desc="Stations"):
+        unit = unit_key(pollutant, station_id)
+        if ckpt.is_done(unit):
+            stage_metrics.count("units_resumed")
+            continue
+
         g = g.sort_values("datetime").reset_index(drop=True)
 
         first_valid = g["val"].first_valid_index()
         if first_valid is None:
+            ckpt.save(unit, None)
             continue
 
         g.loc[:first_valid - 1, "val"] = np.nan
 
         nan_blocks = find_nan_blocks(g["val"])
 
+        # Every gap is bounded by original observations, so one linear
+        # pass over the unfilled series gives each short gap the same
+        # values as interpolating after earlier fills. Assignment stays
+        # in gap order so Kalman windows see the same partial fills.
+        interpolated = None
+
         for start, end, length in nan_blocks:
             if start < first_valid:
                 continue
 
             if length <= SHORT_GAP_HRS:
-                g.loc[start:end - 1, "val"] = g["val"].interpolate().iloc[start:end]
+                stage_metrics.count("short_gaps")
+                with stage_metrics.phase("short_gap"):
+                    if interpolated is None:
+                        interpolated = g["val"].interpolate().values
+                    g.loc[start:end - 1, "val"] = interpolated[start:end]
 
             elif length <= MEDIUM_GAP_HRS:
-                window_start = max(0, start - 10)
-                window_end = min(len(g), end + 10)
-                segment = g["val"].iloc[window_start:window_end].values
-                filled = kalman_fill(segment)
-                g.loc[start:end - 1, "val"] = filled[
-                    (start - window_start):(end - window_start)
-                ]
-
-            else:
-                for idx in range(start, end):
-                    t = g.loc[idx, "datetime"]
-                    snap = df_p[
-                        (df_p["datetime"] == t) &
-                        (df_p["station_id"] != station_id) &
-                        (~df_p["val"].isna())
+                stage_metrics.count("medium_gaps")
+                with stage_metrics.phase("medium_gap"):
+                    window_start = max(0, start - KALMAN_PAD)
+                    window_end = min(len(g), end + KALMAN_PAD)
+                    segment = g["val"].iloc[window_start:window_end].values
+                    filled = kalman_fill(segment)
+                    g.loc[start:end - 1, "val"] = filled[
+                        (start - window_start):(end - window_start)
                     ]
 
-                    if len(snap) < N_NEIGHBORS:
+            else:
+                stage_metrics.count("long_gaps")
+                with stage_metrics.phase("long_gap"):
+                    if INTERPOLATOR == "kriging":
+                        # The target station is NaN throughout its own gap
+                        col = station_col[station_id]
+                        snap_vals = wide.loc[g["datetime"].iloc[start:end]].values
+                        est, _ = krig.predict(snap_vals, krig.coords[col:col + 1], targets_key=col)
+                        est = est[:, 0]
+
+                        sparse = np.isnan(est)
+                        if clim is not None and sparse.any():
+                            est[sparse] = clim.estimate(
+                                pollutant, station_id,
+                                g["datetime"].values[start:end][sparse],
+                                wide.columns.values, snap_vals[sparse]
+                            )
+                            stage_metrics.count("long_gap_hours_climatology",
+                                                int((sparse & ~np.isnan(est)).sum()))
+
+                        g.loc[start:end - 1, "val"] = est
+                        stage_metrics.count("long_gap_hours_unfilled", int(np.isnan(est).sum()))
                         continue
 
-                    try:
-                        g.at[idx, "val"] = idw_predict(
-                            g.loc[idx:idx],
-                            snap,
-                            p_used
-                        )
-                    except Exception:
-                        pass
+                    for idx in range(start, end):
+                        t = g.loc[idx, "datetime"]
+                        snap = nbr_p[
+                            (nbr_p["datetime"] == t) &
+                            (nbr_p["station_id"] != station_id) &
+                            (~nbr_p["val"].isna())
+                        ]
+
+                        if len(snap) < N_NEIGHBORS:
+                            est = np.nan
+                            if clim is not None:
+                                est = clim.estimate(
+                                    pollutant, station_id, [t],
+                                    snap["station_id"].values, snap["val"].values[None, :]
+                                )[0]
+                            if np.isnan(est):
+                                stage_metrics.count("long_gap_hours_unfilled")
+                            else:
+                                stage_metrics.count("long_gap_hours_climatology")
+                                g.at[idx, "val"] = est
+                            continue
+
+                        try:
+                            g.at[idx, "val"] = idw_predict(
+                                g.loc[idx:idx],
+                                snap,
+                                p_used,
+                                N_NEIGHBORS
+                            )
+                        except Exception:
+                            pass
 
         g["pollutant"] = pollutant
-        out_frames.append(g)
+        with stage_metrics.phase("checkpoint"):
+            ckpt.save(unit, unit_file(pollutant, station_id), g.rename(columns={"val": "value"}))
 
 # ---------------- Save ----------------
 
-final_df = pd.concat(out_frames)
-final_df = final_df.rename(columns={"val": "value"})
-
-final_df.to_csv(OUT_FILE, index=False)
+keys = [unit_key(p, sid) for p, sid in units]
+with stage_metrics.phase("merge"):
+    ckpt.merge(keys, shard_path(OUT_FILE))
 
 print("\nImputation complete.")
 print("Saved to:", OUT_FILE)
+
+# Post-imputation data-quality profile (read by 02b / 02c), one
+# partition at a time; sharded runs write it once after the merge
+if not sharded():
+    coverage, gaps = [], []
+    for path in ckpt.partitions(keys):
+        part = pd.read_csv(path, parse_dates=["datetime"])
+        coverage.append(data_profile.coverage_from_long(part))
+        gaps.append(data_profile.gaps_from_long(part))
+
+    cov_keys = ["station_id", "pollutant", "year", "month"]
+    gap_keys = ["station_id", "pollutant", "gap_type"]
+    data_profile.save_profile(
+        pd.concat(coverage).sort_values(cov_keys).reset_index(drop=True),
+        pd.concat(gaps).sort_values(gap_keys).reset_index(drop=True),
+        "imputed"
+    )
+
+ckpt.clear()
+
+stage_metrics.close(rows=len(df))
@@ -1,20 +1,28 @@
-import pandas as pd
+import data_profile
+from instrument import StageMetrics
 
-df = pd.read_csv(
-    "data/interim/dl_data_imputed.csv",
-    parse_dates=["datetime"]
-)
+stage_metrics = StageMetrics("02b_validate_imputation")
+
+# Answered from the post-imputation profile written by 02_imputation.py,
+# not by rescanning dl_data_imputed.csv
+coverage = data_profile.load_coverage("imputed")
+gaps = data_profile.load_gaps("imputed")
 
-print("Rows:", len(df))
-print("Stations:", df["station_id"].nunique())
+rows = int(coverage["n_hours"].sum())
+print("Rows:", rows)
+print("Stations:", coverage["station_id"].nunique())
 
-missing_pct = df["value"].isna().mean() * 100
+missing_pct = (1 - coverage["n_obs"].sum() / rows) * 100
 print(f"\nOverall missing % after imputation: {missing_pct:.2f}%")
 
 print("\nTop 5 stations by missing %:")
 print(
-    df.groupby("station_id")["value"]
-      .apply(lambda x: x.isna().mean() * 100)
+    data_profile.missing_by(coverage, "station_id")["missing_pct"]
       .sort_values(ascending=False)
       .head()
 )
+
+print("\nRemaining gaps by type:")
+print(data_profile.gap_type_counts(gaps))
+
+stage_metrics.close(rows=rows)
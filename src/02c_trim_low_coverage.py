@@ -4,6 +4,10 @@
 # ============================================================
 
 import pandas as pd
+from pathlib import Path
+
+import data_profile
+from instrument import StageMetrics
 
 # ---------------- CONFIG ----------------
 INPUT_FILE = "data/interim/dl_data_imputed.csv"
@@ -12,6 +16,8 @@ OUTPUT_FILE = "data/processed/dl_data_final.csv"
 MIN_YEARLY_COVERAGE = 0.80   # 80%
 # ---------------------------------------
 
+stage_metrics = StageMetrics("02c_trim_low_coverage")
+
 print("Loading imputed data...")
 df = pd.read_csv(INPUT_FILE, parse_dates=["datetime"])
 
@@ -20,12 +26,15 @@ df["year"] = df["datetime"].dt.year
 
 print("Computing yearly coverage per station...")
 
-# Coverage per station-year
-coverage = (
-    df.groupby(["station_id", "year"])["value"]
-      .apply(lambda x: x.notna().mean())
-      .reset_index(name="coverage")
-)
+# Coverage per station-year, looked up from the post-imputation profile
+cov_path, _ = data_profile.profile_paths("imputed")
+if cov_path.exists() and cov_path.stat().st_mtime >= Path(INPUT_FILE).stat().st_mtime:
+    profile = data_profile.load_coverage("imputed")
+else:
+    print("Profile missing or stale, building it from the imputed data...")
+    profile = data_profile.coverage_from_long(df)
+
+coverage = data_profile.yearly_coverage(profile)
 
 # Identify valid station-years
 valid_station_years = coverage[
@@ -59,3 +68,5 @@ print(f"Remaining missing %: {missing_pct:.2f}%")
 df_final.to_csv(OUTPUT_FILE, index=False)
 
 print("\nTrimmed dataset saved to:", OUTPUT_FILE)
+
+stage_metrics.close(rows=len(df))
@@ -0,0 +1,242 @@
+# ============================================================
+# 02d_evaluate_imputation_holdout.py
+# Masked-holdout accuracy of the imputation methods
+#   - Hides known observations in synthetic gaps of controlled
+#     lengths (only hours whose true value is known)
+#   - Fills them with linear interpolation, Kalman smoothing
+#     and IDW, exactly as 02_imputation.py would
+#   - Reports error by method × gap length
+#   - Sweeps SHORT_GAP_HRS / MEDIUM_GAP_HRS candidates
+#
+# All gaps of one length are evaluated together with numpy;
+# pollutants run in parallel worker processes.
+# ============================================================
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+import numpy as np
+from scipy.spatial.distance import cdist
+
+from imputation import (
+    linear_fill_batch, kalman_smooth_batch, idw_fill_batch,
+    KALMAN_PAD
+)
+from instrument import StageMetrics
+
+# ---------------- CONFIG ----------------
+DATA_FILE = "data/interim/dl_data_trimmed.csv"
+STATIONS_FILE = "data/raw/dl_details.csv"
+P_FILE = "data/interim/idw_p_values.csv"
+GAP_SUMMARY_FILE = "data/interim/gap_summary.csv"
+
+OUT_DIR = Path("outputs/imputation_holdout")
+OUT_ERRORS = OUT_DIR / "holdout_errors.csv"
+OUT_SWEEP = OUT_DIR / "threshold_sweep.csv"
+
+POLLUTANTS = ["pm2.5", "pm10", "nox", "so2", "co", "o3"]
+
+GAP_LENGTHS = [1, 2, 3, 4, 6, 9, 12, 18, 24, 36, 48, 72, 96, 120, 168]
+GAPS_PER_LENGTH = int(os.environ.get("AQI_HOLDOUT_GAPS", "2000"))
+SHORT_CANDIDATES = [1, 2, 3, 4, 6, 9, 12, 18, 24]
+MEDIUM_CANDIDATES = [12, 24, 36, 48, 72, 96, 120, 168]
+
+MIN_P_CLIP = 0.2
+IDW_CHUNK_CELLS = 20_000_000    # (rows × stations) per IDW batch
+N_JOBS = os.cpu_count() or 1
+RANDOM_SEED = 42
+# ---------------------------------------
+
+
+# ---------------- Helpers ----------------
+
+def sample_gaps(observed, length, n_gaps, rng):
+    """
+    Random (start, station) pairs where hours [start-1, start+length]
+    are all observed and a Kalman window fits inside the series.
+    """
+    n_hours, n_st = observed.shape
+    lo, hi = KALMAN_PAD, n_hours - length - KALMAN_PAD
+    if hi <= lo:
+        return np.array([], dtype=int), np.array([], dtype=int)
+
+    csum = np.vstack([np.zeros((1, n_st), dtype=np.int64), np.cumsum(observed, axis=0)])
+
+    n_draw = n_gaps * 20
+    start = rng.integers(lo, hi, n_draw)
+    col = rng.integers(0, n_st, n_draw)
+    full = (csum[start + length + 1, col] - csum[start - 1, col]) == length + 2
+
+    pairs = np.unique(np.stack([start[full], col[full]], axis=1), axis=0)
+    pairs = pairs[rng.permutation(len(pairs))[:n_gaps]]
+    return pairs[:, 0], pairs[:, 1]
+
+
+def error_row(pollutant, method, length, pred, truth):
+    valid = ~np.isnan(pred)
+    err = (pred - truth)[valid]
+    return {
+        "pollutant": pollutant,
+        "method": method,
+        "gap_hours": length,
+        "n_gaps": truth.shape[0],
+        "n_points": int(valid.sum()),
+        "coverage": round(float(valid.mean()), 4) if valid.size else np.nan,
+        "rmse": float(np.sqrt(np.mean(err ** 2))) if err.size else np.nan,
+        "mae": float(np.mean(np.abs(err))) if err.size else np.nan,
+        "bias": float(np.mean(err)) if err.size else np.nan,
+    }
+
+
+def evaluate_pollutant(pollutant, X, dists, p, seed):
+    """Error rows for every method and gap length of one pollutant."""
+    rng = np.random.default_rng(seed)
+    observed = ~np.isnan(X)
+    n_st = X.shape[1]
+    rows = []
+
+    for length in GAP_LENGTHS:
+        start, col = sample_gaps(observed, length, GAPS_PER_LENGTH, rng)
+        if len(start) == 0:
+            continue
+
+        offsets = np.arange(length)
+        hours = start[:, None] + offsets[None, :]           # (n × L)
+        truth = X[hours, col[:, None]]
+
+        # Linear: endpoints are observed by construction
+        pred = linear_fill_batch(X[start - 1, col], X[start + length, col], length)
+        rows.append(error_row(pollutant, "linear", length, pred, truth))
+
+        # Kalman: same ±KALMAN_PAD window as 02_imputation.py
+        win = start[:, None] + np.arange(-KALMAN_PAD, length + KALMAN_PAD)[None, :]
+        windows = X[win, col[:, None]]
+        windows[:, KALMAN_PAD:KALMAN_PAD + length] = np.nan
+        pred = kalman_smooth_batch(windows)[:, KALMAN_PAD:KALMAN_PAD + length]
+        rows.append(error_row(pollutant, "kalman", length, pred, truth))
+
+        # IDW: other stations at each hidden hour
+        flat_hours = hours.ravel()
+        flat_col = np.repeat(col, length)
+        pred = np.empty(flat_hours.size)
+        step = max(1, IDW_CHUNK_CELLS // n_st)
+        for i in range(0, flat_hours.size, step):
+            sl = slice(i, i + step)
+            pred[sl] = idw_fill_batch(X[flat_hours[sl]], flat_col[sl], dists, p)
+        rows.append(error_row(pollutant, "idw", length, pred.reshape(hours.shape), truth))
+
+    return rows
+
+
+def length_weights(gap_summary, pollutant):
+    """
+    Missing hours in real gaps, binned to the nearest GAP_LENGTHS
+    entry (log scale). Uniform when no gap summary is available.
+    """
+    lengths = np.array(GAP_LENGTHS, dtype=float)
+    if gap_summary is None:
+        return pd.Series(1.0, index=GAP_LENGTHS)
+
+    hrs = gap_summary.loc[gap_summary["pollutant"] == pollutant, "gap_hours"].values
+    nearest = np.abs(np.log(hrs[:, None]) - np.log(lengths[None, :])).argmin(axis=1)
+    w = np.bincount(nearest, weights=hrs, minlength=len(lengths))
+    return pd.Series(w, index=GAP_LENGTHS)
+
+
+def threshold_sweep(errors, weights, pollutant):
+    """Weighted RMSE of the 02 rule for every (short, medium) pair."""
+    mse = (
+        errors[errors["pollutant"] == pollutant]
+        .assign(mse=lambda d: d["rmse"] ** 2)
+        .pivot(index="gap_hours", columns="method", values="mse")
+    )
+    w = weights.reindex(mse.index).fillna(0.0)
+
+    rows = []
+    for short in SHORT_CANDIDATES:
+        for medium in MEDIUM_CANDIDATES:
+            if medium < short:
+                continue
+            method = np.where(
+                mse.index <= short, "linear",
+                np.where(mse.index <= medium, "kalman", "idw")
+            )
+            chosen = mse.values[np.arange(len(mse)), mse.columns.get_indexer(method)]
+            ok = ~np.isnan(chosen) & (w.values > 0)
+            rmse = np.sqrt(np.sum(chosen[ok] * w.values[ok]) / np.sum(w.values[ok])) if ok.any() else np.nan
+            rows.append({
+                "pollutant": pollutant,
+                "short_gap_hrs": short,
+                "medium_gap_hrs": medium,
+                "weighted_rmse": rmse,
+            })
+    return rows
+
+
+# ---------------- Main ----------------
+
+if __name__ == "__main__":
+    stage_metrics = StageMetrics("02d_evaluate_imputation_holdout")
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+
+    print("Loading data...")
+    df = pd.read_csv(DATA_FILE, parse_dates=["datetime"])
+    stations = pd.read_csv(STATIONS_FILE).set_index("station_id")
+    p_vals = pd.read_csv(P_FILE).set_index("pollutant")["best_p"].to_dict()
+    gap_summary = pd.read_csv(GAP_SUMMARY_FILE) if Path(GAP_SUMMARY_FILE).exists() else None
+
+    hours = pd.date_range(df["datetime"].min(), df["datetime"].max(), freq="h")
+    station_ids = np.sort(df["station_id"].unique())
+    coords = stations.loc[station_ids, ["lon", "lat"]].values
+    dists = cdist(coords, coords)
+
+    print(f"Evaluating {len(GAP_LENGTHS)} gap lengths × {GAPS_PER_LENGTH} gaps "
+          f"on {N_JOBS} worker(s)...")
+
+    jobs = {}
+    with ProcessPoolExecutor(max_workers=N_JOBS) as pool:
+        for i, pollutant in enumerate(POLLUTANTS):
+            X = (
+                df.pivot(index="datetime", columns="station_id", values=pollutant)
+                .reindex(index=hours, columns=station_ids)
+                .values
+            )
+            p = max(p_vals.get(pollutant, 1.0), MIN_P_CLIP)
+            jobs[pollutant] = pool.submit(
+                evaluate_pollutant, pollutant, X, dists, p, RANDOM_SEED + i
+            )
+
+        errors = pd.DataFrame([row for pollutant in POLLUTANTS
+                               for row in jobs[pollutant].result()])
+
+    sweep = pd.DataFrame([
+        row
+        for pollutant in POLLUTANTS
+        for row in threshold_sweep(errors, length_weights(gap_summary, pollutant), pollutant)
+    ])
+
+    errors.to_csv(OUT_ERRORS, index=False)
+    sweep.to_csv(OUT_SWEEP, index=False)
+
+    # ---------------- Report ----------------
+    print("\nRMSE by method and gap length:")
+    for pollutant in POLLUTANTS:
+        table = (
+            errors[errors["pollutant"] == pollutant]
+            .pivot(index="gap_hours", columns="method", values="rmse")
+            .round(3)
+        )
+        print(f"\n{pollutant.upper()}")
+        print(table)
+
+    best = sweep.loc[sweep.groupby("pollutant")["weighted_rmse"].idxmin()]
+    print("\nBest thresholds per pollutant:")
+    print(best.to_string(index=False))
+
+    print("\nSaved:", OUT_ERRORS)
+    print("Saved:", OUT_SWEEP)
+
+    stage_metrics.count("gaps_evaluated", int(errors.loc[errors["method"] == "linear", "n_gaps"].sum()))
+    stage_metrics.close(rows=len(df))
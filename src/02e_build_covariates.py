@@ -0,0 +1,126 @@
+# ============================================================
+# 02e_build_covariates.py
+# Build the station covariate cache used by 03_feature_engineering
+#   - Reads every source in covariates.COVARIATE_SOURCES
+#     (local weather sites / grids, regional fire counts)
+#   - As-of joins each variable onto one hourly grid covering all
+#     sources, BLOCK_HOURS at a time; period aggregates (daily
+#     fire counts) from the end of their period
+#   - Snaps sites to stations with inverse-distance weights of the
+#     SNAP_NEIGHBORS nearest sites
+#   - Writes (hours × stations) float32 arrays straight to .npy
+#     files, so memory stays bounded by one block
+#
+# No source files → an empty cache, and 03 adds no covariates.
+# ============================================================
+
+import shutil
+
+import pandas as pd
+import numpy as np
+from scipy import sparse
+
+from instrument import StageMetrics
+from spatial_features import neighbor_mean, source_weights
+from covariates import (
+    CACHE_DIR, COVARIATE_SOURCES, SNAP_NEIGHBORS, BLOCK_HOURS, META_COLS,
+    AsOfIndex, available_at, read_source, source_span, split_sites, write_manifest
+)
+
+# ---------------- CONFIG ----------------
+STATIONS_FILE = "data/raw/dl_details.csv"
+# ---------------------------------------
+
+stage_metrics = StageMetrics("02e_build_covariates")
+
+stations = pd.read_csv(STATIONS_FILE)
+station_ids = np.sort(stations["station_id"].unique())
+
+if CACHE_DIR.exists():
+    shutil.rmtree(CACHE_DIR)
+CACHE_DIR.mkdir(parents=True)
+
+# ------------------------------------------------
+# Shared hourly grid: the span of all sources
+# ------------------------------------------------
+spans = {}
+for name, spec in COVARIATE_SOURCES.items():
+    span = source_span(spec["files"])
+    if span is None:
+        print(f"{name}: no files matching {spec['files']}, skipped")
+        continue
+    first, last = available_at(span[0], spec), available_at(span[1], spec)
+    spans[name] = (first, last + pd.Timedelta(hours=spec["tolerance_hours"]))
+
+if not spans:
+    write_manifest(CACHE_DIR, {}, [])
+    print("No covariate sources found; wrote an empty cache:", CACHE_DIR)
+    stage_metrics.close(rows=0)
+    raise SystemExit(0)
+
+t0 = min(s[0] for s in spans.values()).floor("h")
+hours = pd.date_range(t0, max(s[1] for s in spans.values()).floor("h"), freq="h")
+grid_seconds = np.asarray((hours - t0) // pd.Timedelta(seconds=1), dtype=np.int64)
+
+np.save(CACHE_DIR / "hours.npy", hours.values)
+np.save(CACHE_DIR / "station_ids.npy", station_ids)
+print(f"Covariate grid: {len(hours):,} hours × {len(station_ids)} stations "
+      f"({hours[0]} → {hours[-1]})")
+
+# ------------------------------------------------
+# Join + snap, one source and variable at a time
+# ------------------------------------------------
+manifest_sources = {}
+variables = []
+
+for name in spans:
+    spec = COVARIATE_SOURCES[name]
+    print(f"\nSource: {name}")
+
+    with stage_metrics.phase(f"read_{name}"):
+        df = read_source(spec["files"])
+        site_idx, sites = split_sites(df)
+        seconds = np.asarray((available_at(df["datetime"], spec) - t0) // pd.Timedelta(seconds=1),
+                             dtype=np.int64)
+
+    if sites is None:
+        n_sites = 1
+        W = sparse.csr_matrix(np.ones((len(station_ids), 1)))
+        print(f"  regional series, {len(df):,} rows")
+    else:
+        n_sites = len(sites)
+        W = source_weights(stations, station_ids, sites, SNAP_NEIGHBORS)
+        print(f"  {n_sites} sites, {len(df):,} rows")
+
+    tolerance = int(spec["tolerance_hours"] * 3600)
+    source_vars = [c for c in df.columns if c not in META_COLS]
+
+    for var in source_vars:
+        if var in variables:
+            raise ValueError(f"Covariate {var!r} is provided by more than one source")
+
+        with stage_metrics.phase(f"join_{name}"):
+            index = AsOfIndex(site_idx, seconds, df[var].values, n_sites)
+            out = np.lib.format.open_memmap(
+                CACHE_DIR / f"{var}.npy", mode="w+", dtype=np.float32,
+                shape=(len(hours), len(station_ids))
+            )
+            for a in range(0, len(hours), BLOCK_HOURS):
+                joined = index.join(grid_seconds[a:a + BLOCK_HOURS], tolerance)
+                out[a:a + BLOCK_HOURS] = neighbor_mean(joined.astype(np.float64), W)
+
+            coverage = float(np.isfinite(out).mean())
+            out.flush()
+            del out, index
+
+        print(f"  {var:<16} coverage {coverage:.1%}")
+        variables.append(var)
+        stage_metrics.count("covariate_cells", len(hours) * len(station_ids))
+
+    manifest_sources[name] = {**spec, "variables": source_vars, "sites": n_sites, "rows": len(df)}
+    del df, site_idx, seconds
+
+write_manifest(CACHE_DIR, manifest_sources, variables)
+print("\nSaved covariate cache →", CACHE_DIR)
+
+stage_metrics.close(rows=len(hours) * len(station_ids))
@@ -1,13 +1,25 @@
 # ============================================================
 # 03_feature_engineering.py
-# Create temporal, lag, and rolling features (per-pollutant)
+# Create temporal, lag, rolling and spatial-lag features
+# (per-pollutant), plus the covariate feature group cached by
+# 02e_build_covariates.py when one exists
+# Runs on one station shard when AQI_SHARD is set; spatial lags
+# then read neighbour values from the shard exchange
 # ============================================================
 
 import pandas as pd
 import numpy as np
 
+from instrument import StageMetrics
+from spatial_features import (
+    neighbor_weights, spatial_lag_features, grid_positions, SPATIAL_LAGS
+)
+from sharding import filter_stations, shard_path, load_exchange
+from covariates import load_covariates
+
 # ---------------- CONFIG ----------------
 INPUT_FILE = "data/processed/dl_data_final.csv"
+STATIONS_FILE = "data/raw/dl_details.csv"
 OUTPUT_FILE = "data/processed/dl_data_features.csv"
 
 POLLUTANTS = ["pm2.5", "pm10", "nox", "so2", "co", "o3"]
@@ -16,8 +28,12 @@ LAGS = [1, 24, 72]        # hours
 ROLL_WINDOW = 24         # hours
 # ---------------------------------------
 
+stage_metrics = StageMetrics("03_feature_engineering")
+
 print("Loading cleaned data...")
 df = pd.read_csv(INPUT_FILE, parse_dates=["datetime"])
+df = filter_stations(df)
+exchange = load_exchange()
 
 # ------------------------------------------------
 # Pivot LONG → WIDE
@@ -87,21 +103,75 @@ for p in POLLUTANTS:
         .reset_index(level=0, drop=True)
     )
 
+# ------------------------------------------------
+# Spatial-lag features (neighbour stations)
+# ------------------------------------------------
+print("Creating spatial-lag features...")
+
+with stage_metrics.phase("spatial_features"):
+    stations = pd.read_csv(STATIONS_FILE)
+
+    # Scatter rows onto a dense (hour × station) grid once; features are
+    # gathered back with the same positions, so no joins are needed
+    # Sharded: the exchange already holds every station's grid
+    if exchange is None:
+        row, col, station_ids, n_hours = grid_positions(
+            df_wide["station_id"].values, df_wide["datetime"].values
+        )
+    else:
+        row, col = exchange.positions(df_wide["station_id"].values, df_wide["datetime"].values)
+        station_ids = exchange.station_ids
+    W = neighbor_weights(stations, station_ids)
+
+    for p in POLLUTANTS:
+        if exchange is None:
+            if p not in df_wide.columns:
+                continue
+            grid = np.full((n_hours, len(station_ids)), np.nan)
+            grid[row, col] = df_wide[p].values
+        else:
+            grid = exchange.values(p)
+            if grid is None:
+                continue
+
+        for name, feat in spatial_lag_features(grid, W, p, SPATIAL_LAGS).items():
+            df_wide[name] = feat[row, col]
+
+stage_metrics.count("spatial_links", W.nnz)
+
+# ------------------------------------------------
+# Covariates (weather, fire counts): gathered from the cache
+# ------------------------------------------------
+covariates = load_covariates()
+if covariates is not None:
+    print("Adding covariate features:", ", ".join(covariates.variables))
+    with stage_metrics.phase("covariates"):
+        feats = covariates.gather(df_wide["station_id"].values, df_wide["datetime"].values)
+        for name, values in feats.items():
+            df_wide[name] = values
+    stage_metrics.count("covariate_features", len(feats))
+
 # ------------------------------------------------
 # Final cleanup
 # ------------------------------------------------
 print("Finalizing feature table...")
 
-# Drop rows that cannot support lag/rolling features
+# Drop rows that cannot support lag/rolling features: the first min_lag
+# rows of each run of consecutive hours per station. Lags are row shifts,
+# so after a break (a station-year removed by 02c, the gap between
+# dev-sample windows) they would read hours from before it
 min_lag = max(LAGS + [ROLL_WINDOW])
-df_wide = df_wide.groupby("station_id").apply(
-    lambda x: x.iloc[min_lag:]
-).reset_index(drop=True)
+run_start = df_wide.groupby("station_id")["datetime"].diff() != pd.Timedelta(hours=1)
+df_wide = df_wide[
+    df_wide.groupby(run_start.cumsum()).cumcount().values >= min_lag
+].reset_index(drop=True)
 
 print("Final feature table shape:", df_wide.shape)
 
 # Save
-df_wide.to_csv(OUTPUT_FILE, index=False)
+df_wide.to_csv(shard_path(OUTPUT_FILE), index=False)
 
 print("\nFeature engineering complete.")
 print("Saved to:", OUTPUT_FILE)
+
+stage_metrics.close(rows=len(df))
@@ -0,0 +1,78 @@
+# ============================================================
+# 03b_update_rollups.py
+# Fold new hours of dl_data_final.csv into the daily / monthly
+# rollup cube (see rollup_cube.py)
+#   - Nothing is read when the input's content hash matches the
+#     one the cube was last folded from
+#   - Only hours after each station × pollutant watermark are
+#     applied; untouched buckets are not rewritten
+#   - When the input changed, a station × pollutant whose earlier
+#     hours changed (new QC, re-imputation, trimming) is cleared
+#     and folded again
+#   - AQI_ROLLUP_REBUILD=1 rebuilds the cube from scratch
+# ============================================================
+
+import json
+import os
+import shutil
+
+import pandas as pd
+
+from checkpoint import content_digest
+from instrument import StageMetrics
+from rollup_cube import RollupCube, ROLLUP_DIR
+
+# ---------------- CONFIG ----------------
+DATA_FILE = "data/processed/dl_data_final.csv"
+SOURCE_FILE = ROLLUP_DIR / "source.json"    # content hash of the last folded input
+REBUILD = os.environ.get("AQI_ROLLUP_REBUILD", "0") == "1"
+# ---------------------------------------
+
+stage_metrics = StageMetrics("03b_update_rollups")
+
+if REBUILD and ROLLUP_DIR.exists():
+    print("Rebuilding rollup cube from scratch...")
+    shutil.rmtree(ROLLUP_DIR)
+
+cube = RollupCube.load(mode="r+")
+
+previous = json.loads(SOURCE_FILE.read_text()) if SOURCE_FILE.exists() else None
+with stage_metrics.phase("hash"):
+    source = content_digest(DATA_FILE, previous)
+
+applied, rows = 0, 0
+if cube.day0 is not None and previous and previous["sha256"] == source["sha256"]:
+    print(f"{DATA_FILE} unchanged since the last update; nothing to fold")
+else:
+    print("Loading cleaned data...")
+    df = pd.read_csv(
+        DATA_FILE,
+        usecols=["station_id", "datetime", "pollutant", "value"],
+        parse_dates=["datetime"]
+    )
+    rows = len(df)
+
+    # The file is rewritten upstream, so already-folded hours may have changed
+    if cube.day0 is not None:
+        with stage_metrics.phase("verify"):
+            cube.verify(df)
+    with stage_metrics.phase("update"):
+        applied = cube.update(df)
+    del df
+    with stage_metrics.phase("save"):
+        cube.save()
+    SOURCE_FILE.write_text(json.dumps(source, indent=2))
+
+print(f"Applied {applied:,} new hourly values "
+      f"({cube.stats['daily_buckets']:,} daily / {cube.stats['monthly_buckets']:,} monthly buckets touched)")
+if cube.stats["refolded"]:
+    print(f"History changed for {cube.stats['refolded']} station × pollutant series; refolded them")
+if cube.day0 is not None:
+    print(f"Cube covers {len(cube.station_ids)} stations from {cube.day0} "
+          f"({cube.daily['count'].shape[2]} days)")
+print("Saved under:", ROLLUP_DIR)
+
+stage_metrics.count("rows_applied", applied)
+stage_metrics.count("daily_buckets", cube.stats["daily_buckets"])
+stage_metrics.count("series_refolded", cube.stats["refolded"])
+stage_metrics.close(rows=rows)
@@ -3,15 +3,23 @@
 # Train XGBoost models for all 6 pollutants
 # Time-based split (last 60 days)
 # Defensive against object/categorical columns
+# AQI_TRAIN_MODE=incremental continues the current registered
+# booster on new rows instead of retraining (see warm_start.py)
 # ============================================================
 
+import os
+
 import pandas as pd
 import numpy as np
 import xgboost as xgb
 from sklearn.metrics import mean_squared_error, mean_absolute_error
-import joblib
 from pathlib import Path
 
+from instrument import StageMetrics
+from model_registry import ModelRegistry
+import warm_start
+from feature_sets import load_feature_sets, select_features
+
 # ---------------- CONFIG ----------------
 DATA_FILE = "data/processed/dl_data_features.csv"
 OUT_DIR = "models/xgboost"
@@ -26,14 +34,28 @@ XGB_PARAMS = {
     "max_depth": 6,
     "subsample": 0.8,
     "colsample_bytree": 0.8,
-    "n_estimators": 500,
+    "n_estimators": int(os.environ.get("AQI_XGB_TREES", "500")),
     "random_state": 42,
     "tree_method": "hist"
 }
+EARLY_STOPPING_ROUNDS = 50   # incremental refreshes stop adding trees that do not help
 # ---------------------------------------
 
 Path(OUT_DIR).mkdir(parents=True, exist_ok=True)
 
+stage_metrics = StageMetrics("04a_train_xgboost")
+registry = ModelRegistry()
+feature_sets = load_feature_sets()
+
+def trimmed(model):
+    """Booster cut at the early-stopping iteration, as model.predict() uses it."""
+    booster = model.get_booster()
+    try:
+        return booster[:model.best_iteration + 1]
+    except AttributeError:      # no early stopping
+        return booster
+
+
 print("Loading feature-engineered data...")
 df = pd.read_csv(DATA_FILE, parse_dates=["datetime"])
 df = df.sort_values("datetime")
@@ -50,6 +72,7 @@ print(f"Train rows: {len(train_df):,}")
 print(f"Test  rows: {len(test_df):,}")
 
 metrics = []
+previous = warm_start.previous_metrics(METRICS_FILE)
 
 for pollutant in POLLUTANTS:
     print(f"\nTraining XGBoost for {pollutant.upper()}")
@@ -69,34 +92,85 @@ for pollutant in POLLUTANTS:
     X_train = X_train.select_dtypes(include=[np.number])
     X_test  = X_test.select_dtypes(include=[np.number])
 
-    model = xgb.XGBRegressor(**XGB_PARAMS)
-
-    model.fit(
-        X_train,
-        y_train,
-        eval_set=[(X_test, y_test)],
-        verbose=False
+    # Pruned subset from 04f_prune_features.py (AQI_FEATURE_PRUNING=1)
+    X_train, pruned = select_features(X_train, pollutant, feature_sets)
+    X_test = X_test[X_train.columns]
+
+    plan = warm_start.plan(registry, "xgboost", pollutant, X_train.columns, train_p)
+    print(f"Mode: {plan['mode']} ({plan['reason']})")
+
+    if plan["mode"] == "skip":
+        print(f"Keeping xgboost/{pollutant} {plan['parent']}")
+        if pollutant in previous:
+            metrics.append(previous[pollutant])
+        continue
+
+    candidates = {}
+
+    if plan["mode"] == "incremental":
+        new = plan["new_rows"]
+        model = xgb.XGBRegressor(**{**XGB_PARAMS, "n_estimators": warm_start.INCREMENTAL_ROUNDS,
+                                    "early_stopping_rounds": EARLY_STOPPING_ROUNDS})
+
+        with stage_metrics.phase(f"fit_{pollutant}_incremental"):
+            model.fit(
+                X_train[new],
+                y_train[new],
+                eval_set=[(X_test, y_test)],
+                xgb_model=registry.load("xgboost", pollutant),
+                verbose=False
+            )
+        candidates["incremental"] = model
+
+    if plan["mode"] == "full" or plan["check"]:
+        model = xgb.XGBRegressor(**XGB_PARAMS)
+
+        with stage_metrics.phase(f"fit_{pollutant}_full"):
+            model.fit(
+                X_train,
+                y_train,
+                eval_set=[(X_test, y_test)],
+                verbose=False
+            )
+        candidates["full"] = model
+
+    preds = {name: m.predict(X_test) for name, m in candidates.items()}
+    mode, lineage = warm_start.choose(
+        plan, {name: float(np.sqrt(mean_squared_error(y_test, pr))) for name, pr in preds.items()}
     )
+    model = candidates[mode]
 
-    preds = model.predict(X_test)
-
-    rmse = np.sqrt(mean_squared_error(y_test, preds))
-    mae = mean_absolute_error(y_test, preds)
+    rmse = np.sqrt(mean_squared_error(y_test, preds[mode]))
+    mae = mean_absolute_error(y_test, preds[mode])
 
+    if "guard" in lineage:
+        g = lineage["guard"]
+        print(f"Guard check: incremental RMSE {g['incremental_rmse']:.3f} "
+              f"vs full {g['full_rmse']:.3f} → {mode}")
     print(f"RMSE: {rmse:.3f}")
     print(f"MAE : {mae:.3f}")
 
     metrics.append({
         "pollutant": pollutant,
+        "mode": mode,
         "rmse": rmse,
         "mae": mae,
-        "train_rows": len(train_p),
-        "test_rows": len(test_p)
+        "train_rows": int(plan["new_rows"].sum()) if mode == "incremental" else len(train_p),
+        "test_rows": len(test_p),
+        "fit_seconds": round(stage_metrics.phases[f"fit_{pollutant}_{mode}"], 2)
     })
 
-    model_path = f"{OUT_DIR}/xgb_{pollutant.replace('.', '')}.joblib"
-    joblib.dump(model, model_path)
-    print(f"Saved model → {model_path}")
+    train_start = plan["train_start"] if mode == "incremental" else train_p["datetime"].min()
+    version = registry.save(
+        "xgboost", pollutant, trimmed(model),
+        features=list(X_train.columns),
+        train_window={"start": train_start, "end": train_p["datetime"].max()},
+        metrics={"rmse": rmse, "mae": mae},
+        params=XGB_PARAMS,
+        pruned=pruned,
+        **lineage,
+    )
+    print(f"Saved model → xgboost/{pollutant} {version}")
 
 # ---------------- Save Metrics ----------------
 metrics_df = pd.DataFrame(metrics)
@@ -105,3 +179,5 @@ metrics_df.to_csv(METRICS_FILE, index=False)
 print("\nTraining complete.")
 print("Metrics saved to:", METRICS_FILE)
 print(metrics_df)
+
+stage_metrics.close(rows=len(df))
@@ -1,14 +1,22 @@
 # ============================================================
 # 04b_train_lightgbm.py
 # Train LightGBM models (NUMERIC FEATURES ONLY)
+# AQI_TRAIN_MODE=incremental continues the current registered
+# booster on new rows instead of retraining (see warm_start.py)
 # ============================================================
 
+import os
+
 import pandas as pd
 import numpy as np
 import lightgbm as lgb
 from sklearn.metrics import mean_squared_error, mean_absolute_error
 from pathlib import Path
-import joblib
+
+from instrument import StageMetrics
+from model_registry import ModelRegistry
+import warm_start
+from feature_sets import load_feature_sets, select_features
 
 # ---------------- CONFIG ----------------
 DATA_FILE = "data/processed/dl_data_features.csv"
@@ -17,8 +25,25 @@ OUT_DIR.mkdir(parents=True, exist_ok=True)
 
 POLLUTANTS = ["pm2.5", "pm10", "nox", "so2", "co", "o3"]
 TEST_DAYS = 60
+
+LGB_PARAMS = {
+    "objective": "regression",
+    "metric": "rmse",
+    "learning_rate": 0.05,
+    "num_leaves": 64,
+    "feature_fraction": 0.8,
+    "bagging_fraction": 0.8,
+    "bagging_freq": 5,
+    "verbosity": -1,
+    "seed": 42
+}
+NUM_BOOST_ROUND = int(os.environ.get("AQI_LGB_ROUNDS", "1000"))   # with early stopping
 # ---------------------------------------
 
+stage_metrics = StageMetrics("04b_train_lightgbm")
+registry = ModelRegistry()
+feature_sets = load_feature_sets()
+
 print("Loading feature-engineered data...")
 df = pd.read_csv(DATA_FILE, parse_dates=["datetime"])
 df = df.sort_values("datetime")
@@ -48,6 +73,7 @@ print(f"Train rows: {len(train_df):,}")
 print(f"Test  rows: {len(test_df):,}")
 
 metrics = []
+previous = warm_start.previous_metrics(OUT_DIR / "metrics.csv")
 
 # ------------------------------------------------
 # Train one model per pollutant
@@ -64,48 +90,95 @@ for pollutant in POLLUTANTS:
     X_train = tr.drop(columns=POLLUTANTS + ["datetime"])
     X_test  = te.drop(columns=POLLUTANTS + ["datetime"])
 
-    lgb_train = lgb.Dataset(X_train, y_train)
-    lgb_test  = lgb.Dataset(X_test, y_test, reference=lgb_train)
-
-    params = {
-        "objective": "regression",
-        "metric": "rmse",
-        "learning_rate": 0.05,
-        "num_leaves": 64,
-        "feature_fraction": 0.8,
-        "bagging_fraction": 0.8,
-        "bagging_freq": 5,
-        "verbosity": -1,
-        "seed": 42
+    # Pruned subset from 04f_prune_features.py (AQI_FEATURE_PRUNING=1)
+    X_train, pruned = select_features(X_train, pollutant, feature_sets)
+    X_test = X_test[X_train.columns]
+
+    plan = warm_start.plan(registry, "lightgbm", pollutant, X_train.columns, tr)
+    print(f"Mode: {plan['mode']} ({plan['reason']})")
+
+    if plan["mode"] == "skip":
+        print(f"Keeping lightgbm/{pollutant} {plan['parent']}")
+        if pollutant in previous:
+            metrics.append(previous[pollutant])
+        continue
+
+    candidates = {}
+
+    if plan["mode"] == "incremental":
+        new = plan["new_rows"]
+        lgb_new = lgb.Dataset(X_train[new], y_train[new])
+        lgb_test = lgb.Dataset(X_test, y_test, reference=lgb_new)
+
+        with stage_metrics.phase(f"fit_{pollutant}_incremental"):
+            candidates["incremental"] = lgb.train(
+                LGB_PARAMS,
+                lgb_new,
+                num_boost_round=warm_start.INCREMENTAL_ROUNDS,
+                valid_sets=[lgb_test],
+                init_model=registry.load("lightgbm", pollutant),
+                callbacks=[
+                    lgb.early_stopping(50, verbose=False),
+                    lgb.log_evaluation(0)
+                ]
+            )
+
+    if plan["mode"] == "full" or plan["check"]:
+        lgb_train = lgb.Dataset(X_train, y_train)
+        lgb_test = lgb.Dataset(X_test, y_test, reference=lgb_train)
+
+        with stage_metrics.phase(f"fit_{pollutant}_full"):
+            candidates["full"] = lgb.train(
+                LGB_PARAMS,
+                lgb_train,
+                num_boost_round=NUM_BOOST_ROUND,
+                valid_sets=[lgb_test],
+                callbacks=[
+                    lgb.early_stopping(50),
+                    lgb.log_evaluation(0)
+                ]
+            )
+
+    preds = {
+        name: m.predict(X_test, num_iteration=m.best_iteration)
+        for name, m in candidates.items()
     }
-
-    model = lgb.train(
-        params,
-        lgb_train,
-        num_boost_round=1000,
-        valid_sets=[lgb_test],
-        callbacks=[
-            lgb.early_stopping(50),
-            lgb.log_evaluation(0)
-        ]
+    mode, lineage = warm_start.choose(
+        plan, {name: mean_squared_error(y_test, pr) ** 0.5 for name, pr in preds.items()}
     )
+    model = candidates[mode]
 
-    preds = model.predict(X_test, num_iteration=model.best_iteration)
-
-    rmse = mean_squared_error(y_test, preds) ** 0.5
-    mae  = mean_absolute_error(y_test, preds)
+    rmse = mean_squared_error(y_test, preds[mode]) ** 0.5
+    mae  = mean_absolute_error(y_test, preds[mode])
 
+    if "guard" in lineage:
+        g = lineage["guard"]
+        print(f"Guard check: incremental RMSE {g['incremental_rmse']:.3f} "
+              f"vs full {g['full_rmse']:.3f} → {mode}")
     print(f"RMSE: {rmse:.3f}")
     print(f"MAE : {mae:.3f}")
 
-    joblib.dump(model, OUT_DIR / f"lgb_{pollutant.replace('.', '')}.joblib")
+    train_start = plan["train_start"] if mode == "incremental" else tr["datetime"].min()
+    version = registry.save(
+        "lightgbm", pollutant, model,
+        features=list(X_train.columns),
+        train_window={"start": train_start, "end": tr["datetime"].max()},
+        metrics={"rmse": rmse, "mae": mae},
+        params=LGB_PARAMS,
+        best_iteration=model.best_iteration,
+        pruned=pruned,
+        **lineage,
+    )
+    print(f"Saved model → lightgbm/{pollutant} {version}")
 
     metrics.append({
         "pollutant": pollutant,
+        "mode": mode,
         "rmse": rmse,
         "mae": mae,
-        "train_rows": len(tr),
-        "test_rows": len(te)
+        "train_rows": int(plan["new_rows"].sum()) if mode == "incremental" else len(tr),
+        "test_rows": len(te),
+        "fit_seconds": round(stage_metrics.phases[f"fit_{pollutant}_{mode}"], 2)
     })
 
 # ------------------------------------------------
@@ -117,3 +190,5 @@ metrics_df.to_csv(OUT_DIR / "metrics.csv", index=False)
 print("\nTraining complete.")
 print("Metrics saved to:", OUT_DIR / "metrics.csv")
 print(metrics_df)
+
+stage_metrics.close(rows=len(df))
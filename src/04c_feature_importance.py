@@ -3,13 +3,14 @@
 # Extract and visualize feature importance from XGBoost models
 # ============================================================
 
-import joblib
 import pandas as pd
 import matplotlib.pyplot as plt
 from pathlib import Path
 
+from instrument import StageMetrics
+from model_registry import ModelRegistry
+
 # ---------------- CONFIG ----------------
-MODEL_DIR = Path("models/xgboost")
 OUT_DIR = Path("models/xgboost/feature_importance")
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -17,21 +18,20 @@ POLLUTANTS = ["pm2.5", "pm10", "nox", "so2", "co", "o3"]
 TOP_K = 20
 # ---------------------------------------
 
+stage_metrics = StageMetrics("04c_feature_importance")
+registry = ModelRegistry()
+
 print("Extracting feature importance...")
 
 all_importance = []
 
 for pollutant in POLLUTANTS:
-    model_path = MODEL_DIR / f"xgb_{pollutant.replace('.', '')}.joblib"
-
-    if not model_path.exists():
+    if not registry.has_model("xgboost", pollutant):
         print(f"Model not found for {pollutant}, skipping.")
         continue
 
-    model = joblib.load(model_path)
-
     # XGBoost feature importance (gain-based)
-    booster = model.get_booster()
+    booster = registry.load("xgboost", pollutant)
     score = booster.get_score(importance_type="gain")
 
     imp_df = (
@@ -68,3 +68,5 @@ final_df.to_csv(OUT_DIR / "feature_importance_all_pollutants.csv", index=False)
 
 print("\nFeature importance extraction complete.")
 print("Outputs saved in:", OUT_DIR)
+
+stage_metrics.close()
@@ -4,10 +4,11 @@
 # ============================================================
 
 import pandas as pd
-import lightgbm as lgb
 import matplotlib.pyplot as plt
 from pathlib import Path
-import joblib
+
+from instrument import StageMetrics
+from model_registry import ModelRegistry
 
 # ---------------- CONFIG ----------------
 DATA_FILE = "data/processed/dl_data_features.csv"
@@ -18,6 +19,9 @@ OUT_DIR.mkdir(parents=True, exist_ok=True)
 POLLUTANTS = ["pm2.5", "pm10", "nox", "so2", "co", "o3"]
 # ---------------------------------------
 
+stage_metrics = StageMetrics("04d_lgb_feature_importance")
+registry = ModelRegistry()
+
 print("Loading feature-engineered data...")
 df = pd.read_csv(DATA_FILE)
 
@@ -28,8 +32,7 @@ X_cols = [c for c in df.columns if c not in drop_cols]
 for pollutant in POLLUTANTS:
     print(f"\nProcessing {pollutant.upper()}")
 
-    model_path = MODEL_DIR / f"lgb_{pollutant.replace('.', '')}.joblib"
-    model = joblib.load(model_path)
+    model = registry.load("lightgbm", pollutant)
 
     importance = model.feature_importance(importance_type="gain")
     features = model.feature_name()
@@ -63,3 +66,5 @@ for pollutant in POLLUTANTS:
     print(f"Saved → {png_path}")
 
 print("\nLightGBM feature importance completed.")
+
+stage_metrics.close(rows=len(df))
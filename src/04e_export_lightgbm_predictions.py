@@ -5,10 +5,12 @@
 
 import pandas as pd
 import numpy as np
-import joblib
 from pathlib import Path
 from sklearn.metrics import mean_squared_error, mean_absolute_error
 
+from instrument import StageMetrics
+from model_registry import ModelRegistry
+
 # ---------------- CONFIG ----------------
 DATA_FILE = "data/processed/dl_data_features.csv"
 MODEL_DIR = Path("models/lightgbm")
@@ -18,8 +20,17 @@ POLLUTANTS = ["pm2.5", "pm10", "nox", "so2", "co", "o3"]
 TEST_DAYS = 60
 # ---------------------------------------
 
+stage_metrics = StageMetrics("04e_export_lightgbm_predictions")
+registry = ModelRegistry()
+
+# Only the columns the registered models were trained on
+needed = {"datetime", "station_id", *POLLUTANTS}
+for pollutant in POLLUTANTS:
+    if registry.has_model("lightgbm", pollutant):
+        needed.update(registry.manifest("lightgbm", pollutant)["features"])
+
 print("Loading feature-engineered data...")
-df = pd.read_csv(DATA_FILE, parse_dates=["datetime"])
+df = pd.read_csv(DATA_FILE, parse_dates=["datetime"], usecols=lambda c: c in needed)
 df = df.sort_values("datetime")
 
 Path(OUT_FILE).parent.mkdir(parents=True, exist_ok=True)
@@ -38,13 +49,10 @@ metrics = []
 for pollutant in POLLUTANTS:
     print(f"\nPredicting {pollutant.upper()}")
 
-    model_path = MODEL_DIR / f"lgb_{pollutant.replace('.', '')}.joblib"
-    if not model_path.exists():
+    if not registry.has_model("lightgbm", pollutant):
         print(f"  Model not found → skipped")
         continue
 
-    model = joblib.load(model_path)
-
     te = test_df.dropna(subset=[pollutant]).copy()
     if len(te) == 0:
         print("  No test data → skipped")
@@ -52,12 +60,8 @@ for pollutant in POLLUTANTS:
 
     y_true = te[pollutant].values
 
-    X = te.drop(
-        columns=POLLUTANTS + ["datetime"],
-        errors="ignore"
-    )
-
-    preds = model.predict(X)
+    # Feature columns come from the model manifest
+    preds = registry.predict("lightgbm", pollutant, te)
 
     rmse = mean_squared_error(y_true, preds) ** 0.5
     mae = mean_absolute_error(y_true, preds)
@@ -93,3 +97,5 @@ print("\nPrediction export complete.")
 print("Saved predictions →", OUT_FILE)
 print("Saved metrics →", MODEL_DIR / "prediction_metrics.csv")
 print(metrics_df)
+
+stage_metrics.close(rows=len(final_preds))
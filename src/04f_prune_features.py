@@ -0,0 +1,179 @@
+# ============================================================
+# 04f_prune_features.py
+# Per-pollutant feature subsets from the stored importance
+# tables (04c XGBoost, 04d LightGBM)
+#   - Gain shares are averaged over the families that have a
+#     table, and features ranked by the combined share
+#   - AQI_PRUNE_METHOD=cumulative (default): smallest prefix
+#     holding CUM_GAIN of the total gain
+#   - AQI_PRUNE_METHOD=search: refit LightGBM on prefixes at
+#     several gain shares and keep the smallest one whose holdout
+#     RMSE is within PRUNE_TOLERANCE of the all-feature fit
+#
+# Writes models/feature_sets.json; training uses it with
+# AQI_FEATURE_PRUNING=1. Tables from models that were already
+# trained on a pruned set are not used (pruning again would
+# shrink the set on every cycle).
+# ============================================================
+
+import json
+import os
+from pathlib import Path
+
+import pandas as pd
+import numpy as np
+import lightgbm as lgb
+from sklearn.metrics import mean_squared_error
+
+from feature_sets import FEATURE_SETS_FILE
+from instrument import StageMetrics
+from model_registry import ModelRegistry, pollutant_key
+
+# ---------------- CONFIG ----------------
+DATA_FILE = "data/processed/dl_data_features.csv"
+IMPORTANCE_FILES = {
+    "xgboost": "models/xgboost/feature_importance/importance_{pollutant}.csv",
+    "lightgbm": "models/lightgbm/feature_importance/importance_{key}.csv",
+}
+OUT_FILE = FEATURE_SETS_FILE
+
+POLLUTANTS = ["pm2.5", "pm10", "nox", "so2", "co", "o3"]
+TEST_DAYS = 60
+
+METHOD = os.environ.get("AQI_PRUNE_METHOD", "cumulative")   # "cumulative" | "search"
+CUM_GAIN = 0.99
+MIN_FEATURES = 5
+
+SEARCH_SHARES = [0.999, 0.995, 0.99, 0.98, 0.95, 0.90]
+PRUNE_TOLERANCE = 0.01      # allowed relative RMSE increase over all features
+SEARCH_ROUNDS = 300
+
+SEARCH_PARAMS = {
+    "objective": "regression",
+    "metric": "rmse",
+    "learning_rate": 0.1,
+    "num_leaves": 64,
+    "feature_fraction": 0.8,
+    "bagging_fraction": 0.8,
+    "bagging_freq": 5,
+    "verbosity": -1,
+    "seed": 42
+}
+# ---------------------------------------
+
+stage_metrics = StageMetrics("04f_prune_features")
+registry = ModelRegistry()
+
+
+# ---------------- Helpers ----------------
+
+def gain_shares(pollutant):
+    """Combined gain share per feature, sorted descending; None if no usable table."""
+    shares = []
+    for family, pattern in IMPORTANCE_FILES.items():
+        path = Path(pattern.format(pollutant=pollutant, key=pollutant_key(pollutant)))
+        if not path.exists():
+            continue
+        if registry.has_model(family, pollutant) and registry.manifest(family, pollutant).get("pruned"):
+            print(f"  {family}: current model already uses a pruned set, table ignored")
+            continue
+
+        imp = pd.read_csv(path)
+        gain = imp.set_index("feature")["gain" if "gain" in imp.columns else "importance"]
+        if gain.sum() > 0:
+            shares.append(gain / gain.sum())
+
+    if not shares:
+        return None
+    # Features missing from a table had zero gain there
+    return pd.concat(shares, axis=1).fillna(0.0).mean(axis=1).sort_values(ascending=False)
+
+
+def prefix_for_share(shares, share):
+    """Number of top features holding `share` of the combined gain."""
+    k = int(np.searchsorted(shares.cumsum().values, share * shares.sum()) + 1)
+    return min(max(k, MIN_FEATURES), len(shares))
+
+
+def holdout_rmse(features, tr, te, pollutant):
+    ds_train = lgb.Dataset(tr[features], tr[pollutant])
+    ds_test = lgb.Dataset(te[features], te[pollutant], reference=ds_train)
+    model = lgb.train(
+        SEARCH_PARAMS, ds_train, num_boost_round=SEARCH_ROUNDS, valid_sets=[ds_test],
+        callbacks=[lgb.early_stopping(30, verbose=False), lgb.log_evaluation(0)]
+    )
+    preds = model.predict(te[features], num_iteration=model.best_iteration)
+    return mean_squared_error(te[pollutant], preds) ** 0.5
+
+
+# ---------------- Search data ----------------
+
+if METHOD == "search":
+    print("Loading feature-engineered data...")
+    df = pd.read_csv(DATA_FILE, parse_dates=["datetime"])
+    df = df.drop(columns=[c for c in ["season"] if c in df.columns])
+    cutoff = df["datetime"].max() - pd.Timedelta(days=TEST_DAYS)
+    train_df = df[df["datetime"] <= cutoff]
+    test_df = df[df["datetime"] > cutoff]
+elif METHOD != "cumulative":
+    raise ValueError(f"AQI_PRUNE_METHOD must be 'cumulative' or 'search', got {METHOD!r}")
+
+# ---------------- Prune ----------------
+
+previous = json.loads(OUT_FILE.read_text())["pollutants"] if OUT_FILE.exists() else {}
+result = {}
+summary = []
+
+for pollutant in POLLUTANTS:
+    print(f"\nPruning features for {pollutant.upper()}")
+
+    shares = gain_shares(pollutant)
+    if shares is None:
+        if pollutant in previous:
+            print("  no usable importance table, keeping the previous set")
+            result[pollutant] = previous[pollutant]
+        else:
+            print("  no usable importance table, skipped")
+        continue
+
+    ranked = list(shares.index)
+    entry = {"n_candidates": len(ranked)}
+
+    if METHOD == "cumulative":
+        k = prefix_for_share(shares, CUM_GAIN)
+    else:
+        tr = train_df.dropna(subset=[pollutant])
+        te = test_df.dropna(subset=[pollutant])
+        ranked = [f for f in ranked if f in tr.columns]
+
+        with stage_metrics.phase(f"search_{pollutant}"):
+            base = holdout_rmse(ranked, tr, te, pollutant)
+            k, best = len(ranked), base
+            tried = {}
+            for share in SEARCH_SHARES:
+                n = prefix_for_share(shares[ranked], share)
+                if n not in tried:
+                    tried[n] = holdout_rmse(ranked[:n], tr, te, pollutant)
+                    print(f"  top {n:3d} ({share:.1%} of gain): RMSE {tried[n]:.3f}")
+                if tried[n] <= base * (1 + PRUNE_TOLERANCE) and n < k:
+                    k, best = n, tried[n]
+        entry.update({"rmse_all": base, "rmse_selected": best})
+
+    entry["features"] = ranked[:k]
+    entry["gain_share"] = float(shares[ranked[:k]].sum() / shares.sum())
+    result[pollutant] = entry
+
+    print(f"  kept {k} of {len(ranked)} features ({entry['gain_share']:.2%} of gain)")
+    summary.append({"pollutant": pollutant, "kept": k, "candidates": len(ranked),
+                    "gain_share": entry["gain_share"]})
+    stage_metrics.count("features_kept", k)
+
+OUT_FILE.parent.mkdir(parents=True, exist_ok=True)
+OUT_FILE.write_text(json.dumps({"method": METHOD, "pollutants": result}, indent=2))
+
+print("\nSaved:", OUT_FILE)
+if summary:
+    print(pd.DataFrame(summary).to_string(index=False))
+print("Retrain with AQI_FEATURE_PRUNING=1 to use the pruned sets.")
+
+stage_metrics.close()
@@ -0,0 +1,199 @@
+# ============================================================
+# 04g_train_lightgbm_joint.py
+# Train ONE LightGBM model for all pollutants
+#   - Rows stacked per pollutant with a categorical pollutant
+#     code, per-pollutant standardised targets and the target's
+#     own lag features on a shared scale (joint_model.py)
+#   - One Dataset construction / binning and one tree ensemble
+#     instead of six; one predict call scores all pollutants
+#   - Comparison against the current per-pollutant 04b models on
+#     the same holdout rows: RMSE / MAE per pollutant, fit time
+#     and inference time for the whole holdout
+#
+# Registered as lightgbm_joint/all; 04b stays the default model.
+# ============================================================
+
+import os
+import time
+
+import pandas as pd
+import lightgbm as lgb
+from sklearn.metrics import mean_squared_error, mean_absolute_error
+from pathlib import Path
+
+from instrument import StageMetrics
+from model_registry import ModelRegistry
+import joint_model
+
+# ---------------- CONFIG ----------------
+DATA_FILE = "data/processed/dl_data_features.csv"
+OUT_DIR = Path("models/lightgbm_joint")
+OUT_DIR.mkdir(parents=True, exist_ok=True)
+PER_POLLUTANT_METRICS = Path("models/lightgbm/metrics.csv")
+
+POLLUTANTS = ["pm2.5", "pm10", "nox", "so2", "co", "o3"]
+TEST_DAYS = 60
+
+LGB_PARAMS = {
+    "objective": "regression",
+    "metric": "rmse",
+    "learning_rate": 0.05,
+    "num_leaves": 64,
+    "feature_fraction": 0.8,
+    "bagging_fraction": 0.8,
+    "bagging_freq": 5,
+    "cat_smooth": 1.0,
+    "verbosity": -1,
+    "seed": 42
+}
+NUM_BOOST_ROUND = int(os.environ.get("AQI_LGB_JOINT_ROUNDS", "2000"))
+SERVING_HOURS = 48          # holdout hours timed one at a time, as served
+# ---------------------------------------
+
+stage_metrics = StageMetrics("04g_train_lightgbm_joint")
+registry = ModelRegistry()
+
+print("Loading feature-engineered data...")
+df = pd.read_csv(DATA_FILE, parse_dates=["datetime"])
+df = df.sort_values("datetime")
+
+# Same numeric-only matrix as 04b; the pollutant code is the only categorical
+df = df.drop(columns=[c for c in ["season"] if c in df.columns])
+for c in df.columns:
+    if c != "datetime":
+        df[c] = pd.to_numeric(df[c], errors="coerce")
+
+cutoff = df["datetime"].max() - pd.Timedelta(days=TEST_DAYS)
+train_df = df[df["datetime"] <= cutoff]
+test_df  = df[df["datetime"] > cutoff]
+
+print("Train period end :", train_df["datetime"].max())
+print("Test period start:", test_df["datetime"].min())
+
+features = [c for c in df.columns if c not in POLLUTANTS + ["datetime"]]
+scales = joint_model.target_scales(train_df, POLLUTANTS)
+
+# ------------------------------------------------
+# Stacked training matrix (binned once)
+# ------------------------------------------------
+with stage_metrics.phase("stack"):
+    X_train, y_train = joint_model.stack(train_df[features], train_df, POLLUTANTS, scales)
+    X_test, y_test = joint_model.stack(test_df[features], test_df, POLLUTANTS, scales)
+features = list(X_train.columns)
+
+print(f"Stacked train rows: {len(X_train):,}")
+print(f"Stacked test  rows: {len(X_test):,}")
+
+lgb_train = lgb.Dataset(X_train, y_train, categorical_feature=[joint_model.POLLUTANT_COL])
+lgb_test = lgb.Dataset(X_test, y_test, reference=lgb_train)
+
+print("\nTraining joint LightGBM")
+with stage_metrics.phase("fit"):
+    model = lgb.train(
+        LGB_PARAMS,
+        lgb_train,
+        num_boost_round=NUM_BOOST_ROUND,
+        valid_sets=[lgb_test],
+        callbacks=[
+            lgb.early_stopping(50),
+            lgb.log_evaluation(0)
+        ]
+    )
+del lgb_train, lgb_test, X_train, X_test
+
+# ------------------------------------------------
+# Holdout: one call for all pollutants
+# (predict uses the early-stopped iteration count)
+# ------------------------------------------------
+with stage_metrics.phase("predict_joint"):
+    joint_preds = joint_model.predict_all(model, test_df, features, POLLUTANTS, scales)
+
+metrics = {}
+for p in POLLUTANTS:
+    mask = test_df[p].notna().values
+    y_true = test_df[p].values[mask]
+    metrics[p] = {
+        "rmse": mean_squared_error(y_true, joint_preds[p].values[mask]) ** 0.5,
+        "mae": mean_absolute_error(y_true, joint_preds[p].values[mask]),
+        "test_rows": int(mask.sum()),
+    }
+    print(f"{p.upper():>6}  RMSE: {metrics[p]['rmse']:.3f}  MAE: {metrics[p]['mae']:.3f}")
+
+version = registry.save(
+    joint_model.FAMILY, joint_model.MODEL_KEY, model,
+    features=features,
+    train_window={"start": train_df["datetime"].min(), "end": train_df["datetime"].max()},
+    metrics=metrics,
+    params=LGB_PARAMS,
+    best_iteration=model.best_iteration,
+    pollutants=POLLUTANTS,
+    target_scales=scales,
+)
+print(f"\nSaved model → {joint_model.FAMILY}/{joint_model.MODEL_KEY} {version}")
+
+# ------------------------------------------------
+# Comparison with the per-pollutant models (04b)
+# ------------------------------------------------
+separate_fit = {}
+if PER_POLLUTANT_METRICS.exists():
+    prev = pd.read_csv(PER_POLLUTANT_METRICS)
+    if "fit_seconds" in prev.columns:
+        separate_fit = prev.set_index("pollutant")["fit_seconds"].to_dict()
+
+rows = []
+separate_predict = 0.0
+for p in POLLUTANTS:
+    row = {"pollutant": p,
+           "joint_rmse": metrics[p]["rmse"], "joint_mae": metrics[p]["mae"]}
+
+    if registry.has_model("lightgbm", p):
+        # Every station-hour, as in serving: six calls vs the joint one
+        t0 = time.perf_counter()
+        preds = registry.predict("lightgbm", p, test_df)
+        separate_predict += time.perf_counter() - t0
+
+        mask = test_df[p].notna().values
+        y_true = test_df[p].values[mask]
+        row["separate_rmse"] = mean_squared_error(y_true, preds[mask]) ** 0.5
+        row["separate_mae"] = mean_absolute_error(y_true, preds[mask])
+        row["rmse_change"] = row["joint_rmse"] / row["separate_rmse"] - 1
+    row["separate_fit_seconds"] = separate_fit.get(p)
+    row["test_rows"] = metrics[p]["test_rows"]
+    rows.append(row)
+
+comparison = pd.DataFrame(rows)
+comparison.to_csv(OUT_DIR / "comparison.csv", index=False)
+
+# Serving: every station for one hour, six registry calls vs one joint call
+hours = [g for _, g in test_df.groupby("datetime")][-SERVING_HOURS:]
+t0 = time.perf_counter()
+for X_hour in hours:
+    joint_model.predict_all(model, X_hour, features, POLLUTANTS, scales)
+joint_hourly = (time.perf_counter() - t0) / max(1, len(hours))
+
+served = [p for p in POLLUTANTS if registry.has_model("lightgbm", p)]
+t0 = time.perf_counter()
+for X_hour in hours:
+    for p in served:
+        registry.predict("lightgbm", p, X_hour)
+separate_hourly = (time.perf_counter() - t0) / max(1, len(hours))
+
+timing = pd.DataFrame([
+    {"model": "joint", "fit_seconds": round(stage_metrics.phases["fit"], 2),
+     "predict_seconds": round(stage_metrics.phases["predict_joint"], 3), "predict_calls": 1,
+     "ms_per_hour": round(joint_hourly * 1000, 2)},
+    {"model": "separate",
+     "fit_seconds": round(sum(separate_fit.values()), 2) if separate_fit else None,
+     "predict_seconds": round(separate_predict, 3),
+     "predict_calls": len(served),
+     "ms_per_hour": round(separate_hourly * 1000, 2) if served else None},
+])
+timing.to_csv(OUT_DIR / "timing.csv", index=False)
+
+print("\nJoint vs per-pollutant models (holdout):")
+print(comparison.to_string(index=False))
+print(timing.to_string(index=False))
+print("Saved:", OUT_DIR / "comparison.csv", "and", OUT_DIR / "timing.csv")
+
+stage_metrics.count("stacked_train_rows", sum(int(train_df[p].notna().sum()) for p in POLLUTANTS))
+stage_metrics.close(rows=len(df))
@@ -0,0 +1,100 @@
+# ============================================================
+# 05_compute_aqi.py
+# Indian National AQI (CPCB) from forecasts
+#   - Every station-hour in lightgbm_predictions.csv, for the
+#     predicted and the actual concentrations
+#   - Every cell of the heatmap grid cubes written by
+#     05_generate_7day_heatmaps.py
+# ============================================================
+
+import pandas as pd
+import numpy as np
+from pathlib import Path
+
+from aqi import aqi_from_long, compute_aqi, CATEGORIES, POLLUTANTS
+from instrument import StageMetrics
+
+# ---------------- CONFIG ----------------
+PRED_FILE = "data/processed/lightgbm_predictions.csv"
+HEATMAP_DIR = Path("outputs/heatmaps")
+
+OUT_STATION = "data/processed/aqi_predictions.csv"
+OUT_GRID = Path("outputs/aqi/grid_aqi.npz")
+# ---------------------------------------
+
+stage_metrics = StageMetrics("05_compute_aqi")
+OUT_GRID.parent.mkdir(parents=True, exist_ok=True)
+
+# ------------------------------------------------
+# Station-hours
+# ------------------------------------------------
+print("Loading predictions...")
+preds = pd.read_csv(PRED_FILE, parse_dates=["datetime"])
+
+print("Computing station AQI...")
+with stage_metrics.phase("station_aqi"):
+    aqi_pred = aqi_from_long(preds, "predicted")
+    aqi_true = aqi_from_long(preds, "actual")[
+        ["datetime", "station_id", "aqi", "category", "dominant_pollutant"]
+    ]
+
+station_aqi = aqi_pred.merge(
+    aqi_true, on=["datetime", "station_id"], how="left", suffixes=("", "_actual")
+)
+station_aqi.to_csv(OUT_STATION, index=False)
+
+valid = station_aqi["aqi"].notna() & station_aqi["aqi_actual"].notna()
+if valid.any():
+    err = station_aqi.loc[valid, "aqi"] - station_aqi.loc[valid, "aqi_actual"]
+    hit = (station_aqi.loc[valid, "category"] == station_aqi.loc[valid, "category_actual"]).mean()
+    print(f"  AQI RMSE: {np.sqrt(np.mean(err ** 2)):.2f}   MAE: {np.mean(np.abs(err)):.2f}")
+    print(f"  Category agreement: {hit:.1%}")
+
+print(station_aqi["category"].value_counts().reindex(CATEGORIES).fillna(0).astype(int))
+stage_metrics.count("station_hours", int(station_aqi["aqi"].notna().sum()))
+
+# ------------------------------------------------
+# Heatmap grid
+# ------------------------------------------------
+cubes = {
+    p: np.load(HEATMAP_DIR / p.replace(".", "") / "grid_cube.npz")
+    for p in POLLUTANTS
+    if (HEATMAP_DIR / p.replace(".", "") / "grid_cube.npz").exists()
+}
+
+if cubes:
+    print("\nComputing grid AQI...")
+    with stage_metrics.phase("grid_aqi"):
+        first = next(iter(cubes.values()))
+        lon, lat = first["lon"], first["lat"]
+
+        # Common contiguous hourly axis across pollutants
+        t_min = min(c["times"].min() for c in cubes.values())
+        t_max = max(c["times"].max() for c in cubes.values())
+        times = np.arange(t_min, t_max + np.timedelta64(1, "h"), np.timedelta64(1, "h"))
+
+        hourly = {}
+        for p, c in cubes.items():
+            arr = np.full((len(times), len(lon)), np.nan)
+            arr[(c["times"] - t_min) // np.timedelta64(1, "h")] = c["estimate"]
+            hourly[p] = arr
+
+        res = compute_aqi(hourly)
+
+    np.savez_compressed(
+        OUT_GRID,
+        times=times, lon=lon, lat=lat,
+        aqi=res["aqi"], category=res["category"], dominant=res["dominant"],
+        pollutants=np.array(res["pollutants"]), categories=np.array(CATEGORIES),
+        **{f"si_{p.replace('.', '')}": res["sub_indices"][p] for p in res["pollutants"]}
+    )
+    n_cells = int(np.isfinite(res["aqi"]).sum())
+    stage_metrics.count("grid_cells", n_cells)
+    print(f"  {n_cells:,} cell-hours with a valid AQI")
+    print("Saved grid AQI →", OUT_GRID)
+else:
+    print("\nNo grid cubes found, grid AQI skipped.")
+
+print("Saved station AQI →", OUT_STATION)
+
+stage_metrics.close(rows=len(preds))
@@ -0,0 +1,162 @@
+# ============================================================
+# 05_detect_episodes.py
+# Pollution-episode alerts from the forecast AQI cubes
+# (see episodes.py)
+#   - Stations: data/processed/aqi_predictions.csv (AQI and the
+#     per-pollutant sub-indices of 05_compute_aqi.py)
+#   - Grid: outputs/aqi/grid_aqi.npz (heatmap grid cells)
+#   - Each rule: category or worse for min_hours consecutive
+#     hours at min_stations stations (or min_area_km2 of grid)
+#     at once, within horizon_hours of the forecast start;
+#     co-occurring sites within CLUSTER_KM form one episode
+#   - Episodes are matched to the alerts of earlier runs, so a
+#     refresh reports only new / updated / cancelled alerts
+#
+# The forecast start is the first hour of each cube unless
+# AQI_FORECAST_START is set.
+# ============================================================
+
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from aqi import POLLUTANTS
+from episodes import (
+    AlertBook, detect, grid_spacing_km, neighbor_pairs, project_km, GRID_NEIGHBOR_FACTOR
+)
+from instrument import StageMetrics
+
+# ---------------- CONFIG ----------------
+STATION_FILE = "data/processed/aqi_predictions.csv"
+GRID_FILE = Path("outputs/aqi/grid_aqi.npz")
+STATIONS_FILE = "data/raw/dl_details.csv"
+
+OUT_DIR = Path("outputs/alerts")
+EPISODES_FILE = OUT_DIR / "episodes.csv"
+EVENTS_FILE = OUT_DIR / "alert_events.csv"          # appended every run
+STATE_FILE = OUT_DIR / "alert_state.json"
+
+FORECAST_START = os.environ.get("AQI_FORECAST_START", "")
+CLUSTER_KM = 15.0           # stations closer than this join one episode
+
+# measure: "aqi" or a pollutant (its CPCB sub-index)
+RULES = [
+    {"name": "aqi_severe_6h", "measure": "aqi", "category": "Severe",
+     "min_hours": 6, "min_stations": 3, "min_area_km2": 50, "horizon_hours": 72},
+    {"name": "aqi_very_poor_24h", "measure": "aqi", "category": "Very Poor",
+     "min_hours": 24, "min_stations": 5, "min_area_km2": 200, "horizon_hours": 168},
+] + [
+    {"name": f"{p}_severe_6h", "measure": p, "category": "Severe",
+     "min_hours": 6, "min_stations": 3, "min_area_km2": 50, "horizon_hours": 72}
+    for p in POLLUTANTS
+]
+# ---------------------------------------
+
+stage_metrics = StageMetrics("05_detect_episodes")
+
+# ------------------------------------------------
+# Cubes: (hours × sites) per measure
+# ------------------------------------------------
+sources = {}
+
+print("Loading station AQI...")
+df = pd.read_csv(STATION_FILE, parse_dates=["datetime"])
+stations = pd.read_csv(STATIONS_FILE).set_index("station_id")
+station_ids = np.sort(df["station_id"].unique())
+hours = pd.date_range(df["datetime"].min(), df["datetime"].max(), freq="h")
+
+wide = df.set_index(["datetime", "station_id"])
+cubes = {}
+for measure in ["aqi"] + POLLUTANTS:
+    col = "aqi" if measure == "aqi" else f"si_{measure}"
+    if col in wide.columns:
+        cubes[measure] = wide[col].unstack("station_id").reindex(index=hours, columns=station_ids).values
+
+coords = stations.loc[station_ids, ["lon", "lat"]].values
+sources["station"] = {
+    "times": hours.values, "site_ids": station_ids, "cubes": cubes,
+    "xy": project_km(coords[:, 0], coords[:, 1]),
+    "pairs": neighbor_pairs(coords[:, 0], coords[:, 1], CLUSTER_KM),
+    "cell_km2": None,
+}
+del df, wide
+
+if GRID_FILE.exists():
+    print("Loading grid AQI...")
+    grid = np.load(GRID_FILE)
+    spacing = grid_spacing_km(grid["lon"], grid["lat"])
+    cubes = {"aqi": grid["aqi"]}
+    for p in POLLUTANTS:
+        key = f"si_{p.replace('.', '')}"
+        if key in grid.files:
+            cubes[p] = grid[key]
+
+    sources["grid"] = {
+        "times": grid["times"], "site_ids": np.arange(len(grid["lon"])), "cubes": cubes,
+        "xy": project_km(grid["lon"], grid["lat"]),
+        "pairs": neighbor_pairs(grid["lon"], grid["lat"], GRID_NEIGHBOR_FACTOR * spacing),
+        "cell_km2": spacing ** 2,
+    }
+    print(f"  {len(grid['lon']):,} cells, spacing {spacing:.2f} km")
+else:
+    print(f"No grid AQI at {GRID_FILE}; grid rules skipped")
+
+# ------------------------------------------------
+# Scan
+# ------------------------------------------------
+found = []
+t0 = time.perf_counter()
+with stage_metrics.phase("scan"):
+    for source, src in sources.items():
+        start = FORECAST_START or src["times"].min()
+        for rule in RULES:
+            if rule["measure"] not in src["cubes"]:
+                continue
+            if src["cell_km2"] is None:
+                min_sites = rule["min_stations"]
+            else:
+                min_sites = int(np.ceil(rule["min_area_km2"] / src["cell_km2"]))
+            ep = detect(rule, src["cubes"][rule["measure"]], src["times"], src["site_ids"],
+                        src["xy"], src["pairs"], start, min_sites)
+            if len(ep):
+                found.append(ep.assign(rule=rule["name"], source=source))
+scan_ms = (time.perf_counter() - t0) * 1000
+
+n_cells = sum(c.size for src in sources.values() for c in src["cubes"].values())
+print(f"\nScanned {len(RULES)} rules over {n_cells:,} site-hours in {scan_ms:.1f} ms")
+
+columns = ["rule", "source", "start", "end", "hours", "max_sites", "n_sites", "site_hours",
+           "peak_value", "peak_time", "x_km", "y_km", "sites"]
+episodes = pd.concat(found, ignore_index=True)[columns] if found else pd.DataFrame(columns=columns)
+
+# ------------------------------------------------
+# Alerts: match to earlier runs
+# ------------------------------------------------
+run_start = pd.Timestamp(FORECAST_START or min(src["times"].min() for src in sources.values()))
+book = AlertBook(STATE_FILE)
+episodes, events = book.reconcile(episodes, run_start)
+book.save()
+
+OUT_DIR.mkdir(parents=True, exist_ok=True)
+out = episodes.assign(sites=episodes["sites"].map(lambda x: ";".join(map(str, x))))
+out.to_csv(EPISODES_FILE, index=False)
+
+if len(events):
+    events = events.assign(sites=events["sites"].map(lambda x: ";".join(map(str, x))))
+    events.to_csv(EVENTS_FILE, mode="a", header=not EVENTS_FILE.exists(), index=False)
+
+print(f"Episodes: {len(episodes)}")
+if len(episodes):
+    print(episodes[["alert_id", "status", "rule", "source", "start", "end", "max_sites", "peak_value"]]
+          .round(1).to_string(index=False))
+counts = events["status"].value_counts() if len(events) else pd.Series(dtype=int)
+print("\nAlert events:", ", ".join(f"{k} {v}" for k, v in counts.items()) or "none")
+print("Saved episodes →", EPISODES_FILE)
+
+stage_metrics.count("episodes", len(episodes))
+for status in ["new", "updated", "cancelled"]:
+    stage_metrics.count(f"alerts_{status}", int(counts.get(status, 0)))
+stage_metrics.close(rows=n_cells)
@@ -0,0 +1,233 @@
+# ============================================================
+# 05_drift_monitor.py
+# Feature and residual drift from streaming sketches
+# (see drift_sketch.py)
+#   - Folds new rows of dl_data_features.csv (every non-calendar
+#     feature) and of the LightGBM predictions (residual
+#     actual − predicted per pollutant) into the per variable ×
+#     station × month sketches; rows at or before a watermark
+#     are skipped, and the features are read in CHUNK_ROWS chunks
+#   - An input whose content hash matches the last fold is not
+#     read; in a changed one, month slots whose already-folded
+#     rows changed are cleared and folded again in a second pass
+#   - Scores each of the last REPORT_MONTHS months against the
+#     months before it (same calendar month of earlier years when
+#     there is enough of it, else all earlier retained months):
+#     PSI, KS distance, mean shift in reference stds and p50 / p95,
+#     per station and pooled over stations
+#   - AQI_DRIFT_REBUILD=1 rebuilds the sketches from scratch
+# ============================================================
+
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from checkpoint import content_digest
+from drift_sketch import DriftSketches, DRIFT_DIR, hist_quantiles, psi, ks
+from instrument import StageMetrics
+
+# ---------------- CONFIG ----------------
+FEATURES_FILE = "data/processed/dl_data_features.csv"
+PRED_FILE = "data/processed/lightgbm_predictions.csv"
+OUT_DIR = Path("outputs/drift")
+OUT_FILE = OUT_DIR / "drift_scores.csv"
+SOURCE_FILE = DRIFT_DIR / "source.json"     # content hashes of the last folded inputs
+
+REBUILD = os.environ.get("AQI_DRIFT_REBUILD", "0") == "1"
+
+# Keys and calendar columns (deterministic, drift is meaningless)
+SKIP_COLS = {"station_id", "datetime", "hour", "day_of_week", "month", "season"}
+CHUNK_ROWS = 200_000
+
+REPORT_MONTHS = 3
+MIN_LIVE = 24               # values in the scored month
+MIN_REF = 24 * 7            # values in the reference
+PSI_LEVELS = [(0.25, "major"), (0.1, "moderate")]   # else "stable"
+# ---------------------------------------
+
+stage_metrics = StageMetrics("05_drift_monitor")
+
+if REBUILD and DRIFT_DIR.exists():
+    print("Rebuilding drift sketches from scratch...")
+    shutil.rmtree(DRIFT_DIR)
+
+sketches = DriftSketches.load(mode="r+")
+
+# ------------------------------------------------
+# Fold features and residuals
+# ------------------------------------------------
+header = pd.read_csv(FEATURES_FILE, nrows=0).columns
+feature_cols = [c for c in header if c not in SKIP_COLS]
+
+
+def fold(sources):
+    """One pass over the features (chunk by chunk) and / or the residuals per pollutant."""
+    n = 0
+    if "features" in sources:
+        print(f"Folding {len(feature_cols)} features from {FEATURES_FILE}...")
+        with stage_metrics.phase("features"):
+            for chunk in pd.read_csv(FEATURES_FILE, usecols=["station_id", "datetime", *feature_cols],
+                                     parse_dates=["datetime"], chunksize=CHUNK_ROWS):
+                n += len(chunk)
+                st = chunk["station_id"].values
+                times = chunk["datetime"].values
+                for c in feature_cols:
+                    if not pd.api.types.is_numeric_dtype(chunk[c]):
+                        continue
+                    applied = sketches.update(c, "feature", st, times, chunk[c].values)
+                    stage_metrics.count("feature_values", applied)
+
+    if "residuals" in sources:
+        print(f"Folding residuals from {PRED_FILE}...")
+        with stage_metrics.phase("residuals"):
+            preds = pd.read_csv(PRED_FILE, parse_dates=["datetime"])
+            n += len(preds)
+            for pollutant, g in preds.groupby("pollutant", sort=False):
+                applied = sketches.update(
+                    f"resid_{pollutant}", "residual", g["station_id"].values,
+                    g["datetime"].values, (g["actual"] - g["predicted"]).values
+                )
+                stage_metrics.count("residual_values", applied)
+            del preds
+    return n
+
+
+# Inputs whose content hash matches the last fold are not read at all
+previous = json.loads(SOURCE_FILE.read_text()) if SOURCE_FILE.exists() and sketches.variables else {}
+inputs = {"features": FEATURES_FILE}
+if Path(PRED_FILE).exists():
+    inputs["residuals"] = PRED_FILE
+else:
+    print(f"No predictions at {PRED_FILE}; residuals not monitored")
+
+with stage_metrics.phase("hash"):
+    source = {k: content_digest(f, previous.get(k)) for k, f in inputs.items()}
+changed = [k for k in source if previous.get(k, {}).get("sha256") != source[k]["sha256"]]
+for k in inputs:
+    if k not in changed:
+        print(f"{inputs[k]} unchanged since the last update; not read")
+
+rows_read = fold(changed)
+
+# Changed inputs are regenerated upstream: month slots whose
+# already-folded rows changed are cleared and folded again
+with stage_metrics.phase("verify"):
+    stale = sketches.verify()
+if stale:
+    print(f"{stale:,} sketch month slots changed upstream; refolding them...")
+    rows_read += fold(changed)
+
+with stage_metrics.phase("save"):
+    sketches.save()
+SOURCE_FILE.write_text(json.dumps({**previous, **source}, indent=2))
+
+print(f"Applied {sketches.stats['rows']:,} new values "
+      f"({sketches.stats['late_rows']:,} older than the ring skipped, "
+      f"{sketches.stats['evicted_months']} months evicted, "
+      f"{sketches.stats['refolded_slots']:,} slots refolded)")
+
+# ------------------------------------------------
+# Scores
+# ------------------------------------------------
+months = sketches.months()
+print(f"Sketches: {len(sketches.variables)} variables × {len(sketches.station_ids)} stations, "
+      f"{len(months)} months retained")
+
+variables = np.array(sketches.variables)
+kinds = np.array([sketches.kinds[v] for v in variables])
+n_v, n_s = len(variables), len(sketches.station_ids)
+
+
+def pool(moments):
+    """Moments merged over the station axis (min / max are not needed)."""
+    return {f: moments[f].sum(axis=1) for f in ("count", "sum", "sumsq")}
+
+
+def score_rows(h_live, m_live, h_ref, m_ref):
+    """Score columns for flat (n × bins) histograms and matching moments."""
+    q_live = hist_quantiles(h_live, [0.5, 0.95])
+    q_ref = hist_quantiles(h_ref, [0.5, 0.95])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_live = m_live["sum"] / m_live["count"]
+        mean_ref = m_ref["sum"] / m_ref["count"]
+        std_ref = np.sqrt(np.maximum(m_ref["sumsq"] / m_ref["count"] - mean_ref ** 2, 0.0))
+        shift = (mean_live - mean_ref) / std_ref
+    return {
+        "n_live": m_live["count"], "n_ref": m_ref["count"],
+        "psi": psi(h_ref, h_live), "ks": ks(h_ref, h_live),
+        "mean_live": mean_live, "mean_ref": mean_ref, "mean_shift_std": shift,
+        "p50_live": q_live[:, 0], "p50_ref": q_ref[:, 0],
+        "p95_live": q_live[:, 1], "p95_ref": q_ref[:, 1],
+    }
+
+
+tables = []
+with stage_metrics.phase("score"):
+    for month in months[-REPORT_MONTHS:]:
+        h_live, m_live = sketches.live(month)
+        h_ref, m_ref, basis = sketches.reference(month, MIN_REF)
+
+        # Per station: variable × station rows
+        per_station = pd.DataFrame({
+            "variable": np.repeat(variables, n_s),
+            "kind": np.repeat(kinds, n_s),
+            "scope": "station",
+            "station_id": np.tile(sketches.station_ids, n_v),
+            "month": str(month),
+            "ref_basis": basis.ravel(),
+            **score_rows(
+                h_live.reshape(n_v * n_s, -1), {f: v.ravel() for f, v in m_live.items()},
+                h_ref.reshape(n_v * n_s, -1), {f: v.ravel() for f, v in m_ref.items()},
+            ),
+        })
+
+        # Pooled over stations: sketches merge by adding, and the
+        # pooled reference is the sum of the per-station references
+        pooled = pd.DataFrame({
+            "variable": variables,
+            "kind": kinds,
+            "scope": "all",
+            "station_id": pd.NA,
+            "month": str(month),
+            "ref_basis": [b[0] if len(set(b)) == 1 else "mixed" for b in basis],
+            **score_rows(h_live.sum(axis=1), pool(m_live), h_ref.sum(axis=1), pool(m_ref)),
+        })
+
+        tables += [pooled, per_station]
+
+if tables:
+    scores = pd.concat(tables, ignore_index=True)
+    scores = scores[(scores["n_live"] >= MIN_LIVE) & (scores["n_ref"] >= MIN_REF)]
+    scores["level"] = "stable"
+    for threshold, level in reversed(PSI_LEVELS):
+        scores.loc[scores["psi"] >= threshold, "level"] = level
+    scores = scores.reset_index(drop=True)
+else:
+    scores = pd.DataFrame(columns=["variable", "kind", "scope", "station_id", "month", "psi", "ks", "level"])
+
+OUT_DIR.mkdir(parents=True, exist_ok=True)
+scores.to_csv(OUT_FILE, index=False)
+
+if len(scores):
+    latest = scores[(scores["scope"] == "all") & (scores["month"] == scores["month"].max())]
+    print(f"\nMost drifted variables in {latest['month'].iloc[0] if len(latest) else '-'} (pooled):")
+    print(latest.sort_values("psi", ascending=False).head(15)[
+        ["variable", "kind", "ref_basis", "n_live", "psi", "ks", "mean_shift_std", "level"]
+    ].round(3).to_string(index=False))
+
+    by_level = scores[scores["scope"] == "station"]["level"].value_counts()
+    print("\nStation-level scores:", ", ".join(f"{k} {v}" for k, v in by_level.items()))
+    for level in ["moderate", "major"]:
+        stage_metrics.count(f"station_scores_{level}", int(by_level.get(level, 0)))
+else:
+    print("\nNot enough history to score drift yet")
+
+print("\nSaved drift scores →", OUT_FILE)
+
+stage_metrics.count("values_applied", sketches.stats["rows"])
+stage_metrics.count("slots_refolded", sketches.stats["refolded_slots"])
+stage_metrics.close(rows=rows_read)
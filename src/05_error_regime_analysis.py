@@ -0,0 +1,221 @@
+# ============================================================
+# 05_error_regime_analysis.py
+# Where do the models miss?
+#   - Predicts the test window with every registered model
+#     version (LightGBM, XGBoost and the joint LightGBM, all
+#     pollutants)
+#   - RMSE / MAE / bias sliced by any combination of station,
+#     pollutant, hour, weekday, season, AQI band and observed-
+#     value decile
+#
+# Slice keys are integer codes computed once; each slice is one
+# mixed-radix key + np.bincount pass over all prediction rows.
+# ============================================================
+
+import os
+from pathlib import Path
+
+import pandas as pd
+import numpy as np
+
+from aqi import sub_index, category_codes, CATEGORIES
+from instrument import StageMetrics
+from model_registry import ModelRegistry, MODEL_FILES
+
+# ---------------- CONFIG ----------------
+DATA_FILE = "data/processed/dl_data_features.csv"
+OUT_DIR = Path("outputs/error_regimes")
+OUT_FILE = OUT_DIR / "slice_metrics.csv"
+
+POLLUTANTS = ["pm2.5", "pm10", "nox", "so2", "co", "o3"]
+TEST_DAYS = 60
+N_QUANTILES = 10
+
+# Each entry is one slice: the listed dimensions, always within
+# model version × pollutant. Override with e.g.
+# AQI_ERROR_SLICES="station,hour,season+aqi_band"
+SLICES = os.environ.get(
+    "AQI_ERROR_SLICES",
+    "station,hour,weekday,season,aqi_band,quantile,"
+    "station+hour,season+hour,season+aqi_band,station+quantile"
+)
+SLICES = [s.split("+") for s in SLICES.split(",") if s]
+
+SEASONS = ["winter", "summer", "monsoon", "post_monsoon"]
+SEASON_OF_MONTH = np.array([-1, 0, 0, 1, 1, 1, 2, 2, 2, 2, 3, 3, 0])
+# ---------------------------------------
+
+stage_metrics = StageMetrics("05_error_regime_analysis")
+registry = ModelRegistry()
+OUT_DIR.mkdir(parents=True, exist_ok=True)
+
+
+# ---------------- Helpers ----------------
+
+def slice_metrics(codes, sizes, dims, err):
+    """
+    n / RMSE / MAE / bias for every combination of `dims` in one pass.
+    codes: dict dim → int code array; sizes: dict dim → number of codes.
+    """
+    keys = ["model", "pollutant"] + dims
+    radix = [sizes[k] for k in keys]
+    key = np.ravel_multi_index([codes[k] for k in keys], radix)
+
+    n_cells = int(np.prod(radix))
+    n = np.bincount(key, minlength=n_cells)
+    s1 = np.bincount(key, weights=err, minlength=n_cells)
+    s2 = np.bincount(key, weights=err ** 2, minlength=n_cells)
+    sa = np.bincount(key, weights=np.abs(err), minlength=n_cells)
+
+    hit = np.flatnonzero(n)
+    out = pd.DataFrame(dict(zip(keys, np.unravel_index(hit, radix))))
+    out["n"] = n[hit]
+    out["rmse"] = np.sqrt(s2[hit] / n[hit])
+    out["mae"] = sa[hit] / n[hit]
+    out["bias"] = s1[hit] / n[hit]
+    return out
+
+
+# ---------------- Predictions per model version ----------------
+
+print("Loading feature-engineered data...")
+df = pd.read_csv(DATA_FILE, parse_dates=["datetime"])
+if "season" in df.columns:
+    df = df.drop(columns=["season"])
+
+cutoff = df["datetime"].max() - pd.Timedelta(days=TEST_DAYS)
+test_df = df[df["datetime"] > cutoff]
+
+frames = []
+models = []
+
+for family in sorted(MODEL_FILES):
+    for pollutant in POLLUTANTS:
+        if not registry.has_model(family, pollutant):
+            continue
+
+        te = test_df.dropna(subset=[pollutant])
+        if len(te) == 0:
+            continue
+
+        for version in registry.versions(family, pollutant):
+            features = registry.input_columns(family, pollutant, version)
+            missing = set(features) - set(te.columns)
+            if missing:
+                print(f"  {family}/{pollutant} {version}: {len(missing)} feature(s) "
+                      f"no longer in {DATA_FILE}, skipped")
+                continue
+
+            with stage_metrics.phase("predict"):
+                preds = registry.predict(family, pollutant, te, version=version)
+
+            label = f"{family}/{version}"
+            if label not in models:
+                models.append(label)
+
+            frames.append(pd.DataFrame({
+                "model": models.index(label),
+                "pollutant": POLLUTANTS.index(pollutant),
+                "station_id": te["station_id"].values,
+                "datetime": te["datetime"].values,
+                "actual": te[pollutant].values,
+                "predicted": preds,
+            }))
+            print(f"  {family}/{pollutant} {version}: {len(te):,} rows")
+
+if not frames:
+    raise RuntimeError("No registered models could be evaluated")
+
+rows = pd.concat(frames, ignore_index=True)
+err = rows["predicted"].values - rows["actual"].values
+
+# ---------------- Slice codes (computed once) ----------------
+
+with stage_metrics.phase("codes"):
+    station_code, station_ids = pd.factorize(rows["station_id"], sort=True)
+    dt = rows["datetime"].dt
+    pollutant_code = rows["pollutant"].values
+    actual = rows["actual"].values
+
+    # Hourly sub-index band of the observed concentration
+    band = np.empty(len(rows), dtype=np.int64)
+    quant = np.empty(len(rows), dtype=np.int64)
+    for i, pollutant in enumerate(POLLUTANTS):
+        m = pollutant_code == i
+        if not m.any():
+            continue
+        band[m] = category_codes(sub_index(actual[m], pollutant))
+        edges = np.quantile(actual[m], np.linspace(0, 1, N_QUANTILES + 1)[1:-1])
+        quant[m] = np.searchsorted(edges, actual[m], side="right")
+
+    codes = {
+        "model": rows["model"].values,
+        "pollutant": pollutant_code,
+        "station": station_code,
+        "hour": dt.hour.values,
+        "weekday": dt.dayofweek.values,
+        "season": SEASON_OF_MONTH[dt.month.values],
+        "aqi_band": np.maximum(band, 0),
+        "quantile": quant,
+    }
+    sizes = {
+        "model": len(models), "pollutant": len(POLLUTANTS), "station": len(station_ids),
+        "hour": 24, "weekday": 7, "season": len(SEASONS),
+        "aqi_band": len(CATEGORIES), "quantile": N_QUANTILES,
+    }
+    labels = {
+        "model": np.array(models, dtype=object),
+        "pollutant": np.array(POLLUTANTS, dtype=object),
+        "station": np.asarray(station_ids),
+        "season": np.array(SEASONS, dtype=object),
+        "aqi_band": np.array(CATEGORIES, dtype=object),
+    }
+
+# ---------------- Slices ----------------
+
+print(f"\nComputing {len(SLICES)} slices over {len(rows):,} prediction rows...")
+
+tables = []
+with stage_metrics.phase("slices"):
+    for dims in SLICES:
+        unknown = set(dims) - set(codes)
+        if unknown:
+            raise ValueError(f"Unknown slice dimension(s) {sorted(unknown)}; "
+                             f"choose from {sorted(codes)}")
+        t = slice_metrics(codes, sizes, dims, err)
+        for k, lab in labels.items():
+            if k in t.columns:
+                t[k] = lab[t[k].values]
+        t.insert(0, "slice", "+".join(dims))
+        tables.append(t)
+
+result = pd.concat(tables, ignore_index=True)
+result = result.rename(columns={"station": "station_id"})
+result[["family", "version"]] = result["model"].str.split("/", expand=True)
+
+dim_cols = [c for c in ["station_id", "hour", "weekday", "season", "aqi_band", "quantile"]
+            if c in result.columns]
+result = result[["slice", "family", "version", "pollutant"] + dim_cols
+                + ["n", "rmse", "mae", "bias"]]
+for c in ["station_id", "hour", "weekday", "quantile"]:
+    if c in result.columns:
+        result[c] = result[c].astype("Int64")
+result.to_csv(OUT_FILE, index=False)
+
+# ---------------- Report ----------------
+print("\nWorst station per pollutant (current LightGBM):")
+current = {
+    p: registry.current_version("lightgbm", p)
+    for p in POLLUTANTS if registry.has_model("lightgbm", p)
+}
+by_station = result[(result["slice"] == "station") & (result["family"] == "lightgbm")]
+by_station = by_station[by_station["version"] == by_station["pollutant"].map(current)]
+if len(by_station):
+    worst = by_station.loc[by_station.groupby("pollutant")["rmse"].idxmax()]
+    print(worst[["pollutant", "station_id", "n", "rmse", "mae", "bias"]].to_string(index=False))
+
+print("\nSaved:", OUT_FILE)
+
+stage_metrics.count("prediction_rows", len(rows))
+stage_metrics.count("slice_rows", len(result))
+stage_metrics.close(rows=len(rows))
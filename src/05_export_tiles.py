@@ -0,0 +1,144 @@
+# ============================================================
+# 05_export_tiles.py
+# Static XYZ tile pyramid for the dashboard
+#   - Reads the hourly grid cubes written by
+#     05_generate_7day_heatmaps.py
+#   - Writes outputs/tiles/<pollutant>/<YYYYMMDDHH>/{z}/{x}/{y}.png
+#     for zooms MIN_ZOOM..MAX_ZOOM over the Delhi NCR bbox, plus
+#     tiles.json (hours, zooms, colour scale) per pollutant
+#   - Hours are rendered in a process pool; tiles identical to
+#     one already written (typically the previous hour's) are
+#     hard links to the same blob, not re-encoded
+# ============================================================
+
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+
+from aqi import CONC_BREAKS, POLLUTANTS
+from instrument import StageMetrics
+from tiles import TilePyramid, BlobStore, palette, quantize
+
+# ---------------- CONFIG ----------------
+HEATMAP_DIR = Path("outputs/heatmaps")
+OUT_DIR = Path("outputs/tiles")
+BLOB_DIR = OUT_DIR / "blobs"
+
+BBOX = (76.80, 28.35, 77.40, 28.90)     # lon_min, lat_min, lon_max, lat_max (Delhi NCR)
+MIN_ZOOM = 8
+MAX_ZOOM = int(os.environ.get("AQI_TILE_MAX_ZOOM", "12"))
+CMAP = "viridis"
+N_JOBS = os.cpu_count() or 1
+# ---------------------------------------
+
+# Colour scale per pollutant: 0 → upper bound of CPCB "Very Poor"
+VMAX = {p: CONC_BREAKS[p][5] for p in POLLUTANTS}
+
+_pyramid = None
+_store = None
+_palette = None
+
+
+def init_worker(pyramid, pal):
+    global _pyramid, _store, _palette
+    _pyramid, _store, _palette = pyramid, BlobStore(BLOB_DIR), pal
+
+
+def render_hour(hour_dir, values, vmax):
+    """All tiles of one hour → (tiles, newly encoded blobs)."""
+    hour_dir = Path(hour_dir)
+    if hour_dir.exists():
+        shutil.rmtree(hour_dir)
+
+    n_tiles = n_new = 0
+    for z, x, y, t in _pyramid.tiles(values):
+        n_new += _store.link(quantize(t, 0.0, vmax), _palette, hour_dir / str(z) / str(x) / f"{y}.png")
+        n_tiles += 1
+    return n_tiles, n_new
+
+
+def main():
+    stage_metrics = StageMetrics("05_export_tiles")
+
+    cubes = {
+        p: HEATMAP_DIR / p.replace(".", "") / "grid_cube.npz"
+        for p in POLLUTANTS
+        if (HEATMAP_DIR / p.replace(".", "") / "grid_cube.npz").exists()
+    }
+    if not cubes:
+        raise FileNotFoundError(f"No grid_cube.npz under {HEATMAP_DIR}; run 05_generate_7day_heatmaps.py")
+
+    first = np.load(next(iter(cubes.values())))
+    print(f"Rasterizing {len(first['lon']):,} grid points to zoom {MIN_ZOOM}–{MAX_ZOOM}...")
+    with stage_metrics.phase("setup"):
+        pyramid = TilePyramid(first["lon"], first["lat"], BBOX, MIN_ZOOM, MAX_ZOOM)
+    pal = palette(plt.get_cmap(CMAP))
+
+    total_tiles = total_new = 0
+
+    with ProcessPoolExecutor(max_workers=N_JOBS, initializer=init_worker,
+                             initargs=(pyramid, pal)) as pool:
+        for pollutant, path in cubes.items():
+            cube = np.load(path)
+            if not (np.array_equal(cube["lon"], first["lon"]) and np.array_equal(cube["lat"], first["lat"])):
+                raise ValueError(f"{path} uses a different grid than the other pollutants")
+
+            pol_dir = OUT_DIR / pollutant.replace(".", "")
+            labels = [pd.Timestamp(t).strftime("%Y%m%d%H") for t in cube["times"]]
+            hours = [i for i in range(len(labels)) if np.isfinite(cube["estimate"][i]).any()]
+
+            # Hours dropped since the last export
+            if pol_dir.exists():
+                keep = {labels[i] for i in hours}
+                for d in pol_dir.iterdir():
+                    if d.is_dir() and d.name not in keep:
+                        shutil.rmtree(d)
+
+            with stage_metrics.phase("render"):
+                results = list(pool.map(
+                    render_hour,
+                    [pol_dir / labels[i] for i in hours],
+                    [cube["estimate"][i] for i in hours],
+                    [VMAX[pollutant]] * len(hours),
+                    chunksize=max(1, len(hours) // (4 * N_JOBS)),
+                ))
+
+            n_tiles = sum(r[0] for r in results)
+            n_new = sum(r[1] for r in results)
+            total_tiles += n_tiles
+            total_new += n_new
+            print(f"  {pollutant:6s} {len(hours):4d} hours  {n_tiles:7,d} tiles  {n_new:6,d} encoded")
+
+            (pol_dir / "tiles.json").write_text(json.dumps({
+                "pollutant": pollutant,
+                "hours": [labels[i] for i in hours],
+                "url": f"{pol_dir.name}/{{hour}}/{{z}}/{{x}}/{{y}}.png",
+                "min_zoom": MIN_ZOOM,
+                "max_zoom": MAX_ZOOM,
+                "bounds": list(BBOX),
+                "colormap": CMAP,
+                "vmin": 0.0,
+                "vmax": VMAX[pollutant],
+            }, indent=2))
+
+    pruned = BlobStore(BLOB_DIR).prune()
+
+    print(f"\nTiles: {total_tiles:,}   encoded: {total_new:,}   "
+          f"reused: {total_tiles - total_new:,}   stale blobs removed: {pruned or 0:,}")
+    if pruned is None:
+        print("Hard links unavailable here: tiles were copied and blobs were not pruned")
+    print(f"Saved under: {OUT_DIR.resolve()}")
+
+    stage_metrics.count("tiles", total_tiles)
+    stage_metrics.count("tiles_encoded", total_new)
+    stage_metrics.close(rows=total_tiles)
+
+
+if __name__ == "__main__":
+    main()
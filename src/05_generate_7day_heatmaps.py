@@ -1,8 +1,15 @@
 # ============================================================
 # 05_generate_7day_heatmaps.py
 # Generate IDW heatmaps for next 7 days (hourly)
+#   AQI_INTERPOLATOR=kriging switches to ordinary kriging
+#   AQI_HEATMAP_HOURS shortens the horizon (default 7 × 24)
+#   The hourly grids are also saved per pollutant as
+#   grid_cube.npz (estimate; variance under kriging) for
+#   05_compute_aqi.py
 # ============================================================
 
+import os
+
 import pandas as pd
 import numpy as np
 from scipy.spatial.distance import cdist
@@ -10,6 +17,9 @@ import matplotlib.pyplot as plt
 from pathlib import Path
 from tqdm import tqdm
 
+from instrument import StageMetrics
+from kriging import OrdinaryKriging, load_variograms, VARIOGRAM_FILE
+
 # ---------------- CONFIG ----------------
 PRED_FILE = "data/processed/lightgbm_predictions.csv"
 STATION_FILE = "data/raw/dl_details.csv"
@@ -21,14 +31,19 @@ OUT_DIR.mkdir(parents=True, exist_ok=True)
 
 POLLUTANTS = ["pm2.5", "pm10", "nox", "so2", "co", "o3"]
 N_NEIGHBORS = 5
+INTERPOLATOR = os.environ.get("AQI_INTERPOLATOR", "idw")   # "idw" | "kriging"
+HORIZON_HOURS = int(os.environ.get("AQI_HEATMAP_HOURS", str(7 * 24)))
 # ---------------------------------------
 
+stage_metrics = StageMetrics("05_generate_7day_heatmaps")
+
 print("Loading data...")
 
 preds = pd.read_csv(PRED_FILE, parse_dates=["datetime"])
 stations = pd.read_csv(STATION_FILE)
 grid = pd.read_csv(GRID_FILE)
 p_vals = pd.read_csv(P_FILE).set_index("pollutant")["best_p"].to_dict()
+variograms = load_variograms(VARIOGRAM_FILE) if INTERPOLATOR == "kriging" else {}
 
 # ---- Validate schema ----
 required_cols = {"datetime", "station_id", "pollutant", "predicted"}
@@ -72,7 +87,7 @@ for pollutant in POLLUTANTS:
 
     df_p = preds[preds["pollutant"] == pollutant]
     start_time = df_p["datetime"].min()
-    end_time = start_time + pd.Timedelta(days=7)
+    end_time = start_time + pd.Timedelta(hours=HORIZON_HOURS)
 
     times = sorted(
         df_p[
@@ -81,7 +96,24 @@ for pollutant in POLLUTANTS:
         ]["datetime"].unique()
 )
 
-    for t in tqdm(times, desc=pollutant):
+    est_grid = np.full((len(times), len(xy_target)), np.nan)
+    var_grid = np.full_like(est_grid, np.nan)
+
+    if INTERPOLATOR == "kriging":
+        # Whole horizon at once: hours sharing a station availability
+        # pattern reuse one kriging solve
+        wide = (
+            df_p.pivot_table(index="datetime", columns="station_id", values="predicted")
+            .reindex(index=pd.DatetimeIndex(times), columns=stations["station_id"])
+        )
+        krig = OrdinaryKriging(
+            stations[["lon", "lat"]].values, variograms[pollutant], min_points=N_NEIGHBORS
+        )
+        with stage_metrics.phase("kriging"):
+            est_grid, var_grid = krig.predict(wide.values, xy_target)
+        stage_metrics.count("kriging_factorizations", krig.stats["factorizations"])
+
+    for i, t in enumerate(tqdm(times, desc=pollutant)):
         snap = df_p[df_p["datetime"] == t]
 
         if len(snap) < N_NEIGHBORS:
@@ -91,9 +123,17 @@ for pollutant in POLLUTANTS:
         if np.all(np.isnan(vals)):
             continue
 
+        stage_metrics.count("heatmaps")
+
         xy_known = snap[["lon", "lat"]].values
 
-        z = idw_interpolate(xy_known, vals, xy_target, p)
+        if INTERPOLATOR == "kriging":
+            z = est_grid[i]
+            if np.all(np.isnan(z)):
+                continue
+        else:
+            z = idw_interpolate(xy_known, vals, xy_target, p)
+            est_grid[i] = z
 
         # ---- Plot ----
         plt.figure(figsize=(8, 6))
@@ -115,5 +155,14 @@ for pollutant in POLLUTANTS:
         plt.savefig(fname, dpi=150)
         plt.close()
 
+    np.savez_compressed(
+        pol_dir / "grid_cube.npz",
+        times=np.asarray(times, dtype="datetime64[s]"),
+        lon=grid["lon"].values, lat=grid["lat"].values,
+        estimate=est_grid, variance=var_grid
+    )
+
 print("\nAll heatmaps generated successfully.")
 print(f"Saved under: {OUT_DIR.resolve()}")
+
+stage_metrics.close(rows=len(preds))
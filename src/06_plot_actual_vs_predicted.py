@@ -4,18 +4,25 @@
 # For all 40 stations × all 6 pollutants
 # ============================================================
 
+import os
+
 import pandas as pd
 import matplotlib.pyplot as plt
 from pathlib import Path
 from tqdm import tqdm
 
+from instrument import StageMetrics
+
 # ---------------- CONFIG ----------------
 DATA_FILE = "data/processed/lightgbm_predictions.csv"
 OUT_DIR = Path("outputs/actual_vs_predicted")
 
 POLLUTANTS = ["pm2.5", "pm10", "nox", "so2", "co", "o3"]
+MAX_STATIONS = int(os.environ.get("AQI_PLOT_MAX_STATIONS", "0"))   # per pollutant; 0 = all
 # ---------------------------------------
 
+stage_metrics = StageMetrics("06_plot_actual_vs_predicted")
+
 print("Loading predictions...")
 df = pd.read_csv(DATA_FILE, parse_dates=["datetime"])
 
@@ -36,7 +43,11 @@ for pollutant in POLLUTANTS:
 
     df_p = df[df["pollutant"] == pollutant]
 
-    for station_id in tqdm(sorted(df_p["station_id"].unique()), desc=pollutant):
+    stations = sorted(df_p["station_id"].unique())
+    if MAX_STATIONS:
+        stations = stations[:MAX_STATIONS]
+
+    for station_id in tqdm(stations, desc=pollutant):
         df_s = df_p[df_p["station_id"] == station_id].sort_values("datetime")
 
         if df_s.empty:
@@ -59,3 +70,5 @@ for pollutant in POLLUTANTS:
 
 print("\nAll plots generated successfully.")
 print(f"Saved under: {OUT_DIR.resolve()}")
+
+stage_metrics.close(rows=len(df))
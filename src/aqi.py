@@ -0,0 +1,186 @@
+# ============================================================
+# aqi.py
+# Indian National AQI (CPCB) from hourly concentrations
+#   - Averaging: 24-h mean for PM2.5 / PM10 / NOx / SO2,
+#     maximum 8-h mean over the last 24 h for CO / O3
+#     (rolling means from cumulative sums, with the CPCB
+#     minimum-data rule of 16 of 24 / 6 of 8 hours)
+#   - Sub-indices by searchsorted over the breakpoint tables
+#   - AQI = max sub-index, reported only when ≥ 3 pollutants
+#     are available and one of them is PM2.5 or PM10
+#
+# Everything operates on (hours × columns) arrays, so the same
+# code serves station-hours and heatmap grid cells.
+#
+# NOx is scored with the NO2 breakpoints (the dataset has no
+# separate NO2 series). CO is in mg/m³, the rest in µg/m³.
+# ============================================================
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# ---------------- CONFIG ----------------
+POLLUTANTS = ["pm2.5", "pm10", "nox", "so2", "co", "o3"]
+
+# Concentration breakpoints and the matching index breakpoints.
+# The last segment (Severe, 401–500) uses the upper bounds of the
+# CPCB calculator; concentrations beyond it are capped at 500.
+INDEX_BREAKS = np.array([0, 50, 100, 200, 300, 400, 500], dtype=float)
+CONC_BREAKS = {
+    "pm2.5": [0, 30, 60, 90, 120, 250, 380],
+    "pm10":  [0, 50, 100, 250, 350, 430, 510],
+    "nox":   [0, 40, 80, 180, 280, 400, 800],
+    "so2":   [0, 40, 80, 380, 800, 1600, 2100],
+    "co":    [0, 1.0, 2.0, 10, 17, 34, 50],
+    "o3":    [0, 50, 100, 168, 208, 748, 1000],
+}
+
+# (window hours, minimum valid hours, take max of window means over 24 h)
+AVERAGING = {
+    "pm2.5": (24, 16, False),
+    "pm10":  (24, 16, False),
+    "nox":   (24, 16, False),
+    "so2":   (24, 16, False),
+    "co":    (8, 6, True),
+    "o3":    (8, 6, True),
+}
+MAX_LOOKBACK_HOURS = 24
+
+CATEGORIES = ["Good", "Satisfactory", "Moderate", "Poor", "Very Poor", "Severe"]
+MIN_SUBINDICES = 3
+PM_POLLUTANTS = ["pm2.5", "pm10"]
+# ---------------------------------------
+
+
+# ---------------- Averaging ----------------
+
+def rolling_mean(values, window, min_periods):
+    """
+    Trailing `window`-hour mean along axis 0 of an (hours × N) array,
+    NaN-aware, from cumulative sums. Fewer than `min_periods` valid
+    hours in the window → NaN.
+    """
+    observed = ~np.isnan(values)
+    total = np.cumsum(np.where(observed, values, 0.0), axis=0)
+    count = np.cumsum(observed, axis=0, dtype=np.int32)
+    total[window:] -= total[:-window].copy()
+    count[window:] -= count[:-window].copy()
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        total /= count
+    total[count < min_periods] = np.nan
+    return total
+
+
+def rolling_max(values, window):
+    """Trailing `window`-hour max along axis 0, ignoring NaN."""
+    padded = np.concatenate([np.full((window - 1,) + values.shape[1:], np.nan), values])
+    view = sliding_window_view(np.where(np.isnan(padded), -np.inf, padded), window, axis=0)
+    out = view.max(axis=-1)
+    return np.where(np.isinf(out), np.nan, out)
+
+
+def averaged(values, pollutant):
+    """Hourly concentrations → the CPCB averaging statistic for `pollutant`."""
+    window, min_periods, take_max = AVERAGING[pollutant]
+    means = rolling_mean(values, window, min_periods)
+    if take_max:
+        means = rolling_max(means, MAX_LOOKBACK_HOURS - window + 1)
+    return means
+
+
+# ---------------- Indices ----------------
+
+def sub_index(conc, pollutant):
+    """Piecewise-linear CPCB sub-index; NaN stays NaN."""
+    breaks = np.asarray(CONC_BREAKS[pollutant], dtype=float)
+    slope = np.diff(INDEX_BREAKS) / np.diff(breaks)
+
+    # NaN propagates through the arithmetic; searchsorted sends it to the last segment
+    c = np.minimum(np.maximum(conc, 0.0), breaks[-1])
+    seg = np.searchsorted(breaks[1:-1], c, side="right")
+    return INDEX_BREAKS[:-1][seg] + slope[seg] * (c - breaks[:-1][seg])
+
+
+def category_codes(aqi):
+    """Index into CATEGORIES; -1 where AQI is NaN."""
+    codes = np.searchsorted(INDEX_BREAKS[1:-1], np.ceil(np.nan_to_num(aqi)), side="left")
+    return np.where(np.isnan(aqi), -1, codes)
+
+
+def compute_aqi(hourly):
+    """
+    hourly: dict pollutant → (hours × N) hourly concentrations on a
+    common, contiguous hourly axis.
+
+    Returns dict with
+      sub_indices : dict pollutant → (hours × N)
+      aqi         : (hours × N), NaN where the CPCB rule is not met
+      dominant    : (hours × N) index into the pollutant list, -1 = none
+      category    : (hours × N) index into CATEGORIES, -1 = none
+      pollutants  : pollutant order used by `dominant`
+    """
+    pollutants = [p for p in POLLUTANTS if p in hourly]
+    subs = {p: sub_index(averaged(np.asarray(hourly[p], dtype=float), p), p) for p in pollutants}
+
+    stack = np.stack([subs[p] for p in pollutants])
+    valid = ~np.isnan(stack)
+    n_valid = valid.sum(axis=0)
+    has_pm = np.zeros(n_valid.shape, dtype=bool)
+    for p in PM_POLLUTANTS:
+        if p in subs:
+            has_pm |= valid[pollutants.index(p)]
+
+    ok = (n_valid >= MIN_SUBINDICES) & has_pm
+    filled = np.where(valid, stack, -np.inf)
+    dominant = filled.argmax(axis=0)
+    aqi = np.where(ok, filled.max(axis=0), np.nan)
+
+    return {
+        "sub_indices": subs,
+        "aqi": aqi,
+        "dominant": np.where(ok, dominant, -1),
+        "category": category_codes(aqi),
+        "pollutants": pollutants,
+    }
+
+
+# ---------------- Long tables ----------------
+
+def aqi_from_long(df, value_col, pollutant_col="pollutant"):
+    """
+    AQI for every station-hour of a long table
+    (datetime, station_id, pollutant, value).
+    Returns datetime, station_id, si_<pollutant>..., aqi, category,
+    dominant_pollutant (station-hours with no sub-index dropped).
+    """
+    hours = pd.date_range(df["datetime"].min(), df["datetime"].max(), freq="h")
+    station_ids = np.sort(df["station_id"].unique())
+
+    hourly = {
+        p: (
+            g.pivot_table(index="datetime", columns="station_id", values=value_col)
+            .reindex(index=hours, columns=station_ids)
+            .values
+        )
+        for p, g in df.groupby(pollutant_col)
+        if p in CONC_BREAKS
+    }
+    res = compute_aqi(hourly)
+
+    out = pd.DataFrame({
+        "datetime": np.repeat(hours.values, len(station_ids)),
+        "station_id": np.tile(station_ids, len(hours)),
+    })
+    for p in res["pollutants"]:
+        out[f"si_{p}"] = res["sub_indices"][p].ravel()
+    out["aqi"] = res["aqi"].ravel()
+
+    cats = np.array(CATEGORIES + [None], dtype=object)
+    names = np.array(res["pollutants"] + [None], dtype=object)
+    out["category"] = cats[res["category"].ravel()]
+    out["dominant_pollutant"] = names[res["dominant"].ravel()]
+
+    si_cols = [f"si_{p}" for p in res["pollutants"]]
+    return out[out[si_cols].notna().any(axis=1)].reset_index(drop=True)
@@ -0,0 +1,204 @@
+# ============================================================
+# benchmark.py
+# Scaling benchmarks for the pipeline on synthetic data
+#   - Generates synthetic raw data at several scales
+#   - Runs the selected stages in an isolated workspace
+#   - Appends one record per (scale, stage) to
+#     benchmarks/results.jsonl, tagged with the git commit
+#   - Compares the current commit against an earlier one
+#
+# Usage:
+#   python src/benchmark.py --stations 40 100 400 --years 1 5
+#   python src/benchmark.py --stages 01_gap_analysis 02_imputation
+#   python src/benchmark.py --compare <git-rev>
+# ============================================================
+
+import argparse
+import json
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+import run_pipeline
+import synthetic_data
+
+# ---------------- CONFIG ----------------
+PROJECT_ROOT = run_pipeline.PROJECT_ROOT
+RESULTS_FILE = PROJECT_ROOT / "benchmarks" / "results.jsonl"
+
+DEFAULT_STATIONS = [40, 100, 400]
+DEFAULT_YEARS = [1, 5, 15]
+# ---------------------------------------
+
+
+def git_revision(rev="HEAD"):
+    """Short commit hash of `rev`, or 'unknown' outside a git checkout."""
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", rev],
+            cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+        )
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def git_dirty():
+    try:
+        out = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+        )
+        return bool(out.stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def read_stage_metrics(workspace):
+    """Last instrument.py record per stage written inside the workspace."""
+    path = workspace / "logs" / "metrics.jsonl"
+    records = {}
+    if path.exists():
+        for line in path.read_text().splitlines():
+            rec = json.loads(line)
+            records[rec["stage"]] = rec
+    return records
+
+
+def run_scale(n_stations, years, stages, workdir, jobs=1):
+    """Generate data, run the stages and return one record per stage."""
+    workspace = Path(workdir) / f"s{n_stations}_y{years:g}"
+    if workspace.exists():
+        shutil.rmtree(workspace)
+    run_pipeline.prepare_workspace(workspace)
+
+    print(f"\n=== {n_stations} stations × {years:g} years ===")
+    t0 = time.perf_counter()
+    rows = synthetic_data.generate(workspace / "data" / "raw", n_stations, years)
+    print(f"Generated {rows:,} rows in {time.perf_counter() - t0:.1f}s")
+
+    results = run_pipeline.run_pipeline(
+        root=workspace, only=stages, force=True, jobs=jobs
+    )
+    stage_metrics = read_stage_metrics(workspace)
+
+    commit = git_revision()
+    dirty = git_dirty()
+    records = []
+    for r in results:
+        m = stage_metrics.get(r["stage"], {})
+        records.append({
+            "commit": commit,
+            "dirty": dirty,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "stations": n_stations,
+            "years": years,
+            "raw_rows": rows,
+            "stage": r["stage"],
+            "status": r["status"],
+            "wall_s": round(r["seconds"], 3),
+            "cpu_s": m.get("cpu_s"),
+            "peak_rss_mb": m.get("peak_rss_mb"),
+            "rows_per_s": m.get("rows_per_s"),
+            "phases_s": m.get("phases_s"),
+        })
+    return records
+
+
+def append_results(records):
+    RESULTS_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with open(RESULTS_FILE, "a") as f:
+        for rec in records:
+            f.write(json.dumps(rec) + "\n")
+
+
+def load_results():
+    if not RESULTS_FILE.exists():
+        return []
+    return [json.loads(line) for line in RESULTS_FILE.read_text().splitlines() if line]
+
+
+def latest_by_key(records, commit):
+    """Most recent successful wall time per (stations, years, stage)."""
+    out = {}
+    for rec in records:
+        if rec["commit"] == commit and rec["status"] == "ran":
+            out[(rec["stations"], rec["years"], rec["stage"])] = rec["wall_s"]
+    return out
+
+
+def print_scaling(records):
+    print("\nScaling (wall seconds):")
+    scales = sorted({(r["stations"], r["years"]) for r in records})
+    stages = list(dict.fromkeys(r["stage"] for r in records))
+    header = "".join(f"{f'{s}st×{y:g}y':>14}" for s, y in scales)
+    print(f"  {'stage':<36}{header}")
+    for stage in stages:
+        cells = []
+        for s, y in scales:
+            hit = [r for r in records
+                   if r["stage"] == stage and (r["stations"], r["years"]) == (s, y)]
+            cells.append(f"{hit[-1]['wall_s']:>14.1f}" if hit else f"{'-':>14}")
+        print(f"  {stage:<36}{''.join(cells)}")
+
+
+def print_comparison(base_rev):
+    records = load_results()
+    head = git_revision()
+    base = git_revision(base_rev)
+
+    now = latest_by_key(records, head)
+    then = latest_by_key(records, base)
+    shared = sorted(set(now) & set(then))
+
+    if not shared:
+        print(f"No overlapping benchmark records for {base} and {head}.")
+        return
+
+    print(f"\nWall time {base} → {head}:")
+    print(f"  {'scale':<12} {'stage':<36} {'before':>9} {'after':>9} {'ratio':>7}")
+    for key in shared:
+        s, y, stage = key
+        ratio = now[key] / then[key] if then[key] else float("nan")
+        print(f"  {f'{s}st×{y:g}y':<12} {stage:<36} {then[key]:>9.1f} {now[key]:>9.1f} {ratio:>7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline stages on synthetic data.")
+    parser.add_argument("--stations", type=int, nargs="+", default=DEFAULT_STATIONS)
+    parser.add_argument("--years", type=float, nargs="+", default=DEFAULT_YEARS)
+    parser.add_argument("--stages", nargs="+", metavar="STAGE",
+                        help="stages to time (upstream stages run as needed); default: all")
+    parser.add_argument("--workdir", default=None,
+                        help="where workspaces are created (default: a temp dir)")
+    parser.add_argument("--keep", action="store_true", help="keep workspaces")
+    parser.add_argument("--compare", metavar="REV",
+                        help="compare HEAD against results recorded for REV and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        print_comparison(args.compare)
+        return
+
+    stages = args.stages or [s["name"] for s in run_pipeline.STAGES]
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="aqi_bench_"))
+
+    all_records = []
+    try:
+        for n_stations in args.stations:
+            for years in args.years:
+                records = run_scale(n_stations, years, stages, workdir)
+                append_results(records)
+                all_records.extend(records)
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_scaling(all_records)
+    print("\nResults appended to:", RESULTS_FILE)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# ============================================================
+# checkpoint.py
+# Resumable unit-level checkpoints for long per-station loops
+# (02_imputation: one unit = one pollutant × station)
+#   - Every finished unit is written as a small CSV partition
+#     (tmp file + os.replace) and then appended to progress.jsonl,
+#     so a listed unit always has a complete partition
+#   - The first progress line is a fingerprint of the inputs,
+#     code and parameters; a run with a different fingerprint
+#     starts from scratch instead of reusing stale partitions
+#   - merge() streams the partitions into the final CSV in unit
+#     order without loading them together
+#
+# A torn last progress line (crash mid-append) is ignored and
+# that unit is simply recomputed.
+# ============================================================
+
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+# ---------------- CONFIG ----------------
+PROGRESS_FILE = "progress.jsonl"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"   # fixed, so partitions format like one big frame
+# ---------------------------------------
+
+
+def fingerprint(files, code_files, params):
+    """Hash of input file stats (size, mtime), code contents and parameters."""
+    h = hashlib.sha256()
+    for f in files:
+        p = Path(f)
+        if p.exists():
+            st = p.stat()
+            h.update(f"{f}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+        else:
+            h.update(f"{f}:missing\n".encode())
+    for f in code_files:
+        h.update(Path(f).read_bytes())
+    h.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return h.hexdigest()[:16]
+
+
+def content_digest(path, previous=None):
+    """
+    {"size", "mtime_ns", "sha256"} of a file; the sha256 is taken
+    from `previous` when size and mtime are unchanged.
+    """
+    st = Path(path).stat()
+    stamp = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    if previous and all(previous.get(k) == v for k, v in stamp.items()):
+        return {**stamp, "sha256": previous["sha256"]}
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return {**stamp, "sha256": h.hexdigest()}
+
+
+class UnitCheckpoint:
+    """Partition files plus an append-only progress log under `root`."""
+
+    def __init__(self, root, key):
+        self.root = Path(root)
+        self.key = key
+        self.done = {}          # unit → partition file name (None = no output)
+
+        progress = self.root / PROGRESS_FILE
+        lines = progress.read_text().splitlines() if progress.exists() else []
+        header = _parse(lines[0]) if lines else None
+
+        if header is None or header.get("fingerprint") != key:
+            if lines:
+                print(f"Checkpoint {self.root} is from different inputs; starting over")
+            self.clear()
+            self.root.mkdir(parents=True, exist_ok=True)
+            self._append({"fingerprint": key})
+            return
+
+        records = [r for r in map(_parse, lines[1:]) if r is not None]
+        for rec in records:
+            if rec["file"] is None or (self.root / rec["file"]).exists():
+                self.done[rec["unit"]] = rec["file"]
+
+        # Drop a torn line so new records start on a clean line
+        if len(records) < len(lines) - 1:
+            tmp = progress.with_suffix(".tmp")
+            tmp.write_text("".join(json.dumps(r) + "\n" for r in [header] + records))
+            os.replace(tmp, progress)
+
+        if self.done:
+            print(f"Resuming from checkpoint: {len(self.done)} units done ({self.root})")
+
+    def _append(self, record):
+        with open(self.root / PROGRESS_FILE, "a") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def is_done(self, unit):
+        return unit in self.done
+
+    def save(self, unit, name, frame=None):
+        """Write one unit's partition (None = unit finished with no rows) and log it."""
+        if frame is not None:
+            tmp = self.root / (name + ".tmp")
+            frame.to_csv(tmp, index=False, date_format=DATE_FORMAT)
+            os.replace(tmp, self.root / name)
+        else:
+            name = None
+        self._append({"unit": unit, "file": name, "rows": 0 if frame is None else len(frame)})
+        self.done[unit] = name
+
+    def partitions(self, units):
+        """Partition paths of `units` in the given order, skipping empty units."""
+        return [self.root / self.done[u] for u in units if self.done.get(u)]
+
+    def merge(self, units, out_path):
+        """Concatenate the partitions of `units` into one CSV, one header."""
+        out_path = Path(out_path)
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = out_path.with_name(out_path.name + ".tmp")
+
+        with open(tmp, "wb") as out:
+            for i, path in enumerate(self.partitions(units)):
+                with open(path, "rb") as f:
+                    header = f.readline()
+                    if i == 0:
+                        out.write(header)
+                    shutil.copyfileobj(f, out)
+        os.replace(tmp, out_path)
+
+    def clear(self):
+        if self.root.exists():
+            shutil.rmtree(self.root)
+
+
+def _parse(line):
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError:
+        return None
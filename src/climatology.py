@@ -0,0 +1,127 @@
+# ============================================================
+# climatology.py
+# Per-station climatology cube: pollutant × station × month ×
+# hour-of-week medians (float32, ~0.5 MB per pollutant for 40
+# stations), built in one groupby pass per pollutant
+#
+# Cells with fewer than MIN_CELL_OBS observations back off to
+# the station's hour-of-week median over all months, then to
+# its overall median.
+#
+# Used by 02_imputation.py as the long-gap fallback when fewer
+# than N_NEIGHBORS stations report: the target's climatology,
+# scaled by the median observed / climatology ratio of whichever
+# neighbours did report.
+# ============================================================
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# ---------------- CONFIG ----------------
+CLIMATOLOGY_FILE = Path("data/interim/climatology.npz")
+
+MIN_CELL_OBS = 3
+SCALE_CLIP = (0.25, 4.0)    # bounds on the neighbour anomaly ratio
+# ---------------------------------------
+
+N_MONTHS = 12
+N_HOW = 7 * 24
+
+
+def time_codes(times):
+    """(month 0–11, hour-of-week 0–167) for an array of datetimes."""
+    t = pd.DatetimeIndex(times)
+    return t.month.values - 1, t.dayofweek.values * 24 + t.hour.values
+
+
+def _group_median(key, values, size, min_obs):
+    """Median of `values` per integer key in [0, size); NaN below min_obs."""
+    s = pd.Series(values).groupby(key)
+    med = s.median()
+    med[s.count() < min_obs] = np.nan
+    out = np.full(size, np.nan, dtype=np.float32)
+    out[med.index.values] = med.values
+    return out
+
+
+class Climatology:
+
+    def __init__(self, cube, station_ids, pollutants):
+        self.cube = cube                      # (pollutant, station, month, hour-of-week)
+        self.station_ids = np.asarray(station_ids)
+        self.pollutants = list(pollutants)
+        self._station_index = pd.Index(self.station_ids)
+
+    # ---------------- Build / IO ----------------
+
+    @classmethod
+    def build(cls, df, pollutants):
+        """From a wide table (station_id, datetime, <pollutant>...) of observations."""
+        station_ids = np.sort(df["station_id"].unique())
+        s = pd.Index(station_ids).get_indexer(df["station_id"])
+        month, how = time_codes(df["datetime"])
+        n_st = len(station_ids)
+
+        cell = np.ravel_multi_index((s, month, how), (n_st, N_MONTHS, N_HOW))
+        weekly = np.ravel_multi_index((s, how), (n_st, N_HOW))
+
+        cube = np.full((len(pollutants), n_st, N_MONTHS, N_HOW), np.nan, dtype=np.float32)
+        for i, p in enumerate(pollutants):
+            obs = df[p].notna().values
+            vals = df[p].values[obs]
+
+            c = _group_median(cell[obs], vals, n_st * N_MONTHS * N_HOW, MIN_CELL_OBS)
+            c = c.reshape(n_st, N_MONTHS, N_HOW)
+            w = _group_median(weekly[obs], vals, n_st * N_HOW, MIN_CELL_OBS).reshape(n_st, 1, N_HOW)
+            o = _group_median(s[obs], vals, n_st, 1).reshape(n_st, 1, 1)
+
+            c = np.where(np.isnan(c), w, c)
+            cube[i] = np.where(np.isnan(c), o, c)
+
+        return cls(cube, station_ids, pollutants)
+
+    def save(self, path=CLIMATOLOGY_FILE):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(
+            path, cube=self.cube, station_ids=self.station_ids,
+            pollutants=np.array(self.pollutants)
+        )
+
+    @classmethod
+    def load(cls, path=CLIMATOLOGY_FILE):
+        with np.load(path) as z:
+            return cls(z["cube"], z["station_ids"], z["pollutants"].tolist())
+
+    # ---------------- Lookup ----------------
+
+    def lookup(self, pollutant, station_ids, times):
+        """Climatology at (hour × station) → (len(times), len(station_ids)); NaN for unknown stations."""
+        month, how = time_codes(times)
+        s = self._station_index.get_indexer(np.asarray(station_ids))
+        vals = self.cube[self.pollutants.index(pollutant)][
+            np.maximum(s, 0)[None, :], month[:, None], how[:, None]
+        ]
+        return np.where(s[None, :] >= 0, vals, np.nan)
+
+    def estimate(self, pollutant, station_id, times, nbr_ids=(), nbr_vals=None):
+        """
+        Fallback for `station_id` at `times`. nbr_vals (hours × len(nbr_ids))
+        holds whatever neighbours observed (NaN = missing); their median
+        ratio to climatology scales the estimate, 1 when none reported.
+        """
+        base = self.lookup(pollutant, [station_id], times)[:, 0]
+        if nbr_vals is None or len(nbr_ids) == 0:
+            return base
+
+        nbr_clim = self.lookup(pollutant, nbr_ids, times)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            ratio = np.asarray(nbr_vals, dtype=float) / nbr_clim
+        ratio[~np.isfinite(ratio)] = np.nan
+
+        has = ~np.isnan(ratio).all(axis=1)
+        scale = np.ones(len(base))
+        if has.any():
+            scale[has] = np.nanmedian(ratio[has], axis=1)
+        return base * np.clip(scale, *SCALE_CLIP)
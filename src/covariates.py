@@ -0,0 +1,191 @@
+# ============================================================
+# covariates.py
+# Exogenous covariates (meteorology, fire counts) as a cached
+# feature group for 03_feature_engineering.py
+#   - Sources are local CSV / Parquet files in long form:
+#       datetime, [lon, lat], <variables>
+#     Point sites and gridded fields look the same (one row per
+#     site or grid node and time). Files without lon / lat are
+#     regional series shared by every station.
+#   - As-of join onto a complete hourly grid: for every hour, the
+#     latest observation at or before it within the source's
+#     tolerance. One np.searchsorted over sorted (site, time) keys
+#     per block of hours, no per-row loop.
+#   - Aggregates over a period (daily fire counts) are stamped at
+#     the period start in the files; they are joined from the end
+#     of their period, so an hour never sees a total that includes
+#     later hours
+#   - Snapped to stations with the inverse-distance weights of the
+#     nearest sources (spatial_features.source_weights), skipping
+#     sites that did not report
+#
+# Cache layout (data/interim/covariates/):
+#   hours.npy, station_ids.npy, <variable>.npy (hours × stations,
+#   float32, written block by block), manifest.json
+# ============================================================
+
+import glob
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# ---------------- CONFIG ----------------
+CACHE_DIR = Path("data/interim/covariates")
+MANIFEST_FILE = "manifest.json"
+
+# name → file pattern, as-of tolerance and aggregation period
+# (0 = instantaneous; otherwise rows cover [datetime, datetime + period))
+COVARIATE_SOURCES = {
+    "met":   {"files": "data/raw/covariates/met_*.csv", "tolerance_hours": 3, "period_hours": 0},
+    "fires": {"files": "data/raw/covariates/fires_*.csv", "tolerance_hours": 24, "period_hours": 24},
+}
+
+SNAP_NEIGHBORS = 4          # nearest sites / grid nodes per station
+BLOCK_HOURS = 24 * 90       # hours joined per block (bounds memory)
+# ---------------------------------------
+
+META_COLS = {"datetime", "lon", "lat", "site_id"}
+
+
+# ---------------- Reading ----------------
+
+def read_source(pattern):
+    """All files of a source, concatenated; variables as float32. None if no files."""
+    files = sorted(glob.glob(pattern))
+    if not files:
+        return None
+
+    frames = []
+    for f in files:
+        if f.endswith(".parquet"):
+            frame = pd.read_parquet(f)
+        else:
+            header = pd.read_csv(f, nrows=0).columns
+            frame = pd.read_csv(f, dtype={c: np.float32 for c in header if c not in META_COLS})
+        frame["datetime"] = pd.to_datetime(frame["datetime"])
+        for c in frame.columns:
+            if c not in META_COLS and frame[c].dtype != np.float32:
+                frame[c] = pd.to_numeric(frame[c], errors="coerce").astype(np.float32)
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def available_at(times, spec):
+    """When each row can be known: the end of its aggregation period."""
+    return times + pd.Timedelta(hours=spec.get("period_hours", 0))
+
+
+def source_span(pattern):
+    """(first, last) timestamp over a source's files, reading only datetime; None if no files."""
+    first = last = None
+    for f in sorted(glob.glob(pattern)):
+        if f.endswith(".parquet"):
+            times = pd.read_parquet(f, columns=["datetime"])["datetime"]
+        else:
+            times = pd.read_csv(f, usecols=["datetime"])["datetime"]
+        times = pd.to_datetime(times)
+        first = times.min() if first is None else min(first, times.min())
+        last = times.max() if last is None else max(last, times.max())
+    return None if first is None else (first, last)
+
+
+def split_sites(df):
+    """
+    Site index per row and the (lon, lat) table of sites; a source
+    without coordinates is a single regional site.
+    """
+    if not {"lon", "lat"} <= set(df.columns):
+        return np.zeros(len(df), dtype=np.int64), None
+    groups = df.groupby(["lon", "lat"], sort=True)
+    sites = groups.size().index.to_frame(index=False)
+    return groups.ngroup().values.astype(np.int64), sites
+
+
+# ---------------- As-of join ----------------
+
+class AsOfIndex:
+    """
+    Sorted (site, time) keys of one variable's observations. Keys are
+    site * stride + seconds since t0, so one searchsorted finds the
+    latest observation of the right site for every grid cell.
+    """
+
+    def __init__(self, site_idx, seconds, values, n_sites):
+        keep = ~np.isnan(values)
+        site_idx, seconds, values = site_idx[keep], seconds[keep], values[keep]
+
+        self.n_sites = n_sites
+        self.stride = int(seconds.max()) + 1 if len(seconds) else 1
+        keys = site_idx * self.stride + seconds
+        order = np.argsort(keys, kind="stable")
+
+        self.keys = keys[order]
+        self.site = site_idx[order]
+        self.seconds = seconds[order]
+        self.values = values[order]
+
+    def join(self, grid_seconds, tolerance):
+        """(len(grid_seconds) × n_sites) as-of values, NaN where nothing within tolerance."""
+        out = np.full((len(grid_seconds), self.n_sites), np.nan, dtype=np.float32)
+        if not len(self.keys):
+            return out
+
+        # Grid cells before the first observation would look up another site's key
+        g = np.clip(grid_seconds, 0, self.stride - 1)
+        site = np.arange(self.n_sites)
+        query = (site[None, :] * self.stride + g[:, None]).ravel()
+
+        pos = np.searchsorted(self.keys, query, side="right") - 1
+        safe = np.maximum(pos, 0)
+        age = np.repeat(grid_seconds, self.n_sites) - self.seconds[safe]
+        ok = (pos >= 0) & (self.site[safe] == np.tile(site, len(grid_seconds))) \
+            & (age >= 0) & (age <= tolerance)
+
+        out.ravel()[ok] = self.values[safe[ok]]
+        return out
+
+
+# ---------------- Cache ----------------
+
+def write_manifest(cache_dir, sources, variables):
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    (cache_dir / MANIFEST_FILE).write_text(json.dumps(
+        {"sources": sources, "variables": variables}, indent=2, default=str
+    ))
+
+
+class CovariateCache:
+    """Read-only view of the station covariate grids."""
+
+    def __init__(self, root=CACHE_DIR):
+        self.root = Path(root)
+        self.variables = json.loads((self.root / MANIFEST_FILE).read_text())["variables"]
+        self.hours = pd.DatetimeIndex(np.load(self.root / "hours.npy"))
+        self.station_ids = np.load(self.root / "station_ids.npy")
+
+    def values(self, variable):
+        return np.load(self.root / f"{variable}.npy", mmap_mode="r")
+
+    def gather(self, station_col, datetime_col):
+        """variable → values for long-format rows (NaN outside the cached span)."""
+        row = self.hours.get_indexer(pd.DatetimeIndex(datetime_col))
+        col = pd.Index(self.station_ids).get_indexer(np.asarray(station_col))
+        ok = (row >= 0) & (col >= 0)
+
+        feats = {}
+        for v in self.variables:
+            out = np.full(len(row), np.nan, dtype=np.float32)
+            out[ok] = self.values(v)[row[ok], col[ok]]
+            feats[v] = out
+        return feats
+
+
+def load_covariates(root=CACHE_DIR):
+    """The covariate cache, or None when it holds no variables."""
+    manifest = Path(root) / MANIFEST_FILE
+    if not manifest.exists() or not json.loads(manifest.read_text())["variables"]:
+        return None
+    return CovariateCache(root)
@@ -0,0 +1,186 @@
+# ============================================================
+# data_profile.py
+# Compact data-quality profile shared by 00, 02b and 02c
+#   - Coverage table: rows and non-null counts per
+#     station × pollutant × year × month
+#   - Gap histogram: number of NaN runs and missing hours
+#     per station × pollutant × gap class
+#   - One small CSV pair per pipeline stage ("raw", "imputed")
+#
+# Both tables are built in a single vectorized pass; consumers
+# answer missingness / coverage questions from the profile
+# instead of rescanning the full hourly data.
+# ============================================================
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# ---------------- CONFIG ----------------
+PROFILE_DIR = Path("data/interim/profile")
+
+SHORT_GAP_HOURS = 6
+MEDIUM_GAP_HOURS = 72
+GAP_TYPES = ["structural", "short", "medium", "long"]
+# ---------------------------------------
+
+
+# ---------------- Builders ----------------
+
+def _coverage(keys, observed):
+    """Sum non-null flags by key columns → n_hours, n_obs."""
+    frame = keys.copy()
+    frame["n_obs"] = observed.astype(np.int32)
+    out = (
+        frame.groupby(list(keys.columns), observed=True)["n_obs"]
+        .agg(n_hours="size", n_obs="sum")
+        .reset_index()
+    )
+    return out
+
+
+def coverage_from_wide(df, pollutants):
+    """Coverage table from raw-style data (one column per pollutant)."""
+    keys = pd.DataFrame({
+        "station_id": df["station_id"].values,
+        "year": df["datetime"].dt.year.values,
+        "month": df["datetime"].dt.month.values,
+    })
+    tables = []
+    for pollutant in pollutants:
+        cov = _coverage(keys, df[pollutant].notna().values)
+        cov.insert(1, "pollutant", pollutant)
+        tables.append(cov)
+    return pd.concat(tables, ignore_index=True)
+
+
+def coverage_from_long(df, value_col="value"):
+    """Coverage table from long data (station_id, datetime, pollutant, value)."""
+    keys = pd.DataFrame({
+        "station_id": df["station_id"].values,
+        "pollutant": df["pollutant"].values,
+        "year": df["datetime"].dt.year.values,
+        "month": df["datetime"].dt.month.values,
+    })
+    return _coverage(keys, df[value_col].notna().values)
+
+
+def nan_runs(is_na, groups):
+    """
+    Start index and length of every NaN run in `is_na`.
+    Runs never cross a change in `groups` (e.g. station id).
+    Returns (starts, lengths, at_group_start).
+    """
+    is_na = np.asarray(is_na, dtype=bool)
+    groups = np.asarray(groups)
+    if is_na.size == 0:
+        empty = np.array([], dtype=np.int64)
+        return empty, empty, np.array([], dtype=bool)
+
+    boundary = np.r_[True, groups[1:] != groups[:-1]]
+    run_start = is_na & (boundary | ~np.r_[False, is_na[:-1]])
+
+    run_id = np.cumsum(run_start)
+    lengths = np.bincount(run_id[is_na], minlength=run_id[-1] + 1)[1:]
+    starts = np.flatnonzero(run_start)
+
+    return starts, lengths, boundary[starts]
+
+
+def classify_gaps(lengths, at_group_start):
+    """Gap class per run; runs at the start of a series are structural."""
+    gap_type = np.where(
+        lengths <= SHORT_GAP_HOURS, "short",
+        np.where(lengths <= MEDIUM_GAP_HOURS, "medium", "long")
+    ).astype(object)
+    gap_type[at_group_start] = "structural"
+    return gap_type
+
+
+def _gap_histogram(station_ids, pollutant, is_na, group_key):
+    starts, lengths, at_start = nan_runs(is_na, group_key)
+    runs = pd.DataFrame({
+        "station_id": station_ids[starts],
+        "pollutant": pollutant if np.isscalar(pollutant) else pollutant[starts],
+        "gap_type": classify_gaps(lengths, at_start),
+        "gap_hours": lengths,
+    })
+    return (
+        runs.groupby(["station_id", "pollutant", "gap_type"])["gap_hours"]
+        .agg(n_gaps="size", gap_hours="sum")
+        .reset_index()
+    )
+
+
+def gaps_from_wide(df, pollutants):
+    """Gap histogram from raw-style data. Sorts by station and time."""
+    df = df.sort_values(["station_id", "datetime"])
+    station_ids = df["station_id"].values
+
+    tables = [
+        _gap_histogram(station_ids, p, df[p].isna().values, station_ids)
+        for p in pollutants
+    ]
+    return pd.concat(tables, ignore_index=True)
+
+
+def gaps_from_long(df, value_col="value"):
+    """Gap histogram from long data. Sorts by pollutant, station and time."""
+    df = df.sort_values(["pollutant", "station_id", "datetime"])
+    station_ids = df["station_id"].values
+    pollutants = df["pollutant"].values
+
+    series_key = pd.factorize(
+        pd.MultiIndex.from_arrays([pollutants, station_ids])
+    )[0]
+    return _gap_histogram(station_ids, pollutants, df[value_col].isna().values, series_key)
+
+
+# ---------------- Storage ----------------
+
+def profile_paths(stage, profile_dir=PROFILE_DIR):
+    profile_dir = Path(profile_dir)
+    return (
+        profile_dir / f"coverage_{stage}.csv",
+        profile_dir / f"gaps_{stage}.csv",
+    )
+
+
+def save_profile(coverage, gaps, stage, profile_dir=PROFILE_DIR):
+    cov_path, gap_path = profile_paths(stage, profile_dir)
+    cov_path.parent.mkdir(parents=True, exist_ok=True)
+    coverage.to_csv(cov_path, index=False)
+    gaps.to_csv(gap_path, index=False)
+    return cov_path, gap_path
+
+
+def load_coverage(stage, profile_dir=PROFILE_DIR):
+    return pd.read_csv(profile_paths(stage, profile_dir)[0])
+
+
+def load_gaps(stage, profile_dir=PROFILE_DIR):
+    return pd.read_csv(profile_paths(stage, profile_dir)[1])
+
+
+# ---------------- Lookups ----------------
+
+def yearly_coverage(coverage):
+    """Fraction of non-null values per station-year (all pollutants pooled)."""
+    out = coverage.groupby(["station_id", "year"])[["n_obs", "n_hours"]].sum()
+    out["coverage"] = out["n_obs"] / out["n_hours"]
+    return out["coverage"].reset_index()
+
+
+def missing_by(coverage, keys):
+    """Missing value counts and percentages grouped by `keys`."""
+    out = coverage.groupby(keys)[["n_obs", "n_hours"]].sum()
+    out["missing"] = out["n_hours"] - out["n_obs"]
+    out["missing_pct"] = (out["missing"] / out["n_hours"] * 100).round(2)
+    return out[["missing", "missing_pct"]]
+
+
+def gap_type_counts(gaps):
+    """Total gap counts per class, in GAP_TYPES order."""
+    counts = gaps.groupby("gap_type")["n_gaps"].sum()
+    return counts.reindex([g for g in GAP_TYPES if g in counts.index])
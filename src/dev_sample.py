@@ -0,0 +1,281 @@
+# ============================================================
+# dev_sample.py
+# Development mode: run the whole pipeline (00 → 06) on a small,
+# reproducible, stratified sample in a sandbox project root
+#   - Stations: stratified by region (quadrant around the median
+#     lon / lat) × data quality (tercile of observed fraction),
+#     drawn round-robin over the strata
+#   - Time: WINDOWS_PER_SEASON windows of WINDOW_DAYS per season
+#     (the seasons of 03_feature_engineering), plus the most
+#     recent RECENT_DAYS so the trainers' 60-day holdout is the
+#     same period as in a full run. Each window starts LEAD_IN
+#     early; 03 drops those hours again (the first rows after a
+#     break), so lags never reach across into another window
+#   - Prediction grid thinned by GRID_STRIDE; covariate files cut
+#     to the sampled windows
+#   - Stages with a fixed budget (IDW p grid, imputation holdout,
+#     boosting rounds, heatmap horizon, tile zoom, plot count) get
+#     smaller ones through their env params
+#
+# The sandbox (default sandbox/dev/) gets its own data/, models/,
+# outputs/ and runner state. Sampled raw files are only rewritten
+# when their content changes, so after editing one script only
+# that stage and its downstream stages rerun.
+#
+# Usage:
+#   python src/dev_sample.py                     # sample + run stale stages
+#   python src/dev_sample.py --stations 16 --seed 3
+#   python src/dev_sample.py --only 04b_train_lightgbm --force
+#   python src/dev_sample.py --sample-only
+# ============================================================
+
+import argparse
+import filecmp
+import json
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import run_pipeline
+
+# ---------------- CONFIG ----------------
+PROJECT_ROOT = run_pipeline.PROJECT_ROOT
+RAW_DIR = Path("data/raw")
+SANDBOX_DIR = PROJECT_ROOT / "sandbox" / "dev"
+SAMPLE_FILE = "sample.json"
+
+POLLUTANTS = ["pm2.5", "pm10", "nox", "so2", "co", "o3"]
+
+N_STATIONS = 12             # IDW needs at least N_NEIGHBORS + 1 reporting
+WINDOW_DAYS = 21
+WINDOWS_PER_SEASON = 1
+RECENT_DAYS = 60            # = TEST_DAYS of the trainers
+LEAD_IN = pd.Timedelta(hours=72)      # = max(LAGS + [ROLL_WINDOW]) of 03, trimmed there
+GRID_STRIDE = 2             # keep every 2nd prediction-grid point per axis
+COVARIATE_PAD = pd.Timedelta(days=1)   # covers the as-of tolerances and daily periods
+RANDOM_SEED = 7
+
+# Same months as get_season() in 03_feature_engineering.py
+SEASONS = {
+    "winter": [12, 1, 2],
+    "summer": [3, 4, 5],
+    "monsoon": [6, 7, 8, 9],
+    "post_monsoon": [10, 11],
+}
+
+# Fixed search / evaluation budgets that do not shrink with the data;
+# explicit environment values win
+DEV_PARAMS = {
+    "AQI_IDW_P_STEP": "0.3",
+    "AQI_IDW_MAX_TIMESTAMPS": "12",
+    "AQI_HOLDOUT_GAPS": "200",
+    "AQI_HEATMAP_HOURS": "6",
+    "AQI_XGB_TREES": "30",
+    "AQI_LGB_ROUNDS": "50",
+    "AQI_LGB_JOINT_ROUNDS": "100",
+    "AQI_TILE_MAX_ZOOM": "10",
+    "AQI_PLOT_MAX_STATIONS": "2",
+}
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+# ---------------------------------------
+
+
+# ---------------- Stations ----------------
+
+def station_strata(df, details):
+    """One row per station: region, observed fraction, quality tercile."""
+    pollutants = [p for p in POLLUTANTS if p in df.columns]
+    observed = df[pollutants].notna().mean(axis=1).groupby(df["station_id"]).mean()
+
+    st = details[["station_id", "lon", "lat"]].set_index("station_id").loc[observed.index]
+    ns = np.where(st["lat"] >= st["lat"].median(), "N", "S")
+    ew = np.where(st["lon"] >= st["lon"].median(), "E", "W")
+
+    out = pd.DataFrame({
+        "station_id": observed.index,
+        "region": np.char.add(ns, ew),
+        "observed": observed.values,
+    })
+    # Ranks keep the terciles well-defined when fractions tie
+    out["quality"] = pd.qcut(
+        out["observed"].rank(method="first"), 3, labels=["low", "mid", "high"]
+    ).astype(str)
+    return out
+
+
+def pick_stations(strata, n_stations, rng):
+    """Round-robin over region × quality strata, random order inside each."""
+    groups = [
+        g.sample(frac=1.0, random_state=rng.integers(1 << 31))["station_id"].tolist()
+        for _, g in strata.groupby(["region", "quality"])
+    ]
+    rng.shuffle(groups)
+
+    picked = []
+    while len(picked) < min(n_stations, len(strata)):
+        for g in groups:
+            if g and len(picked) < n_stations:
+                picked.append(g.pop(0))
+    return sorted(picked)
+
+
+# ---------------- Time windows ----------------
+
+def pick_windows(start, end, rng, window_days=WINDOW_DAYS,
+                 per_season=WINDOWS_PER_SEASON, recent_days=RECENT_DAYS, lead_in=LEAD_IN):
+    """
+    Non-overlapping [start, end) windows: the most recent `recent_days`,
+    and `per_season` windows of `window_days` starting in each season,
+    each preceded by `lead_in` hours that 03 trims away again.
+    Returns a sorted list of (start, end, label), lead-in included.
+    """
+    recent_start = (end - pd.Timedelta(days=recent_days)).floor("D")
+    windows = [(recent_start - lead_in, end + pd.Timedelta(hours=1), "recent")]
+
+    length = pd.Timedelta(days=window_days)
+    days = pd.date_range(start.ceil("D") + lead_in, recent_start - length, freq="D")
+
+    for season, months in SEASONS.items():
+        candidates = days[days.month.isin(months)]
+        for _ in range(per_season):
+            free = [d for d in candidates
+                    if all(d + length <= a or d - lead_in >= b for a, b, _ in windows)]
+            if not free:
+                print(f"  no room for another {season} window")
+                break
+            d = free[rng.integers(len(free))]
+            windows.append((d - lead_in, d + length, season))
+
+    return sorted(windows)
+
+
+def in_windows(times, windows):
+    """Boolean mask of timestamps inside any window."""
+    times = pd.DatetimeIndex(times)
+    starts = pd.DatetimeIndex([w[0] for w in windows])
+    ends = pd.DatetimeIndex([w[1] for w in windows])
+    i = starts.searchsorted(times, side="right") - 1
+    return (i >= 0) & (times < ends[np.maximum(i, 0)])
+
+
+# ---------------- Writing ----------------
+
+def write_if_changed(frame, path, **to_csv):
+    """Write a CSV, leaving the file (and its runner hash) alone if unchanged."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    frame.to_csv(tmp, index=False, **to_csv)
+
+    if path.exists() and filecmp.cmp(tmp, path, shallow=False):
+        tmp.unlink()
+        return False
+    os.replace(tmp, path)
+    return True
+
+
+def build_sample(sandbox, n_stations=N_STATIONS, window_days=WINDOW_DAYS,
+                 per_season=WINDOWS_PER_SEASON, seed=RANDOM_SEED):
+    """Write the sampled raw files into sandbox/data/raw; returns the sample record."""
+    rng = np.random.default_rng(seed)
+    raw = PROJECT_ROOT / RAW_DIR
+    out = Path(sandbox) / RAW_DIR
+
+    print("Loading raw data...")
+    df = pd.read_csv(raw / "dl_data.csv", parse_dates=["datetime"])
+    details = pd.read_csv(raw / "dl_details.csv")
+    locs = pd.read_csv(raw / "locs_pred.csv")
+
+    strata = station_strata(df, details)
+    stations = pick_stations(strata, n_stations, rng)
+    windows = pick_windows(df["datetime"].min(), df["datetime"].max(), rng,
+                           window_days, per_season)
+
+    keep = df["station_id"].isin(stations).values & in_windows(df["datetime"], windows)
+    sample = df[keep]
+
+    changed = []
+    if write_if_changed(sample, out / "dl_data.csv", date_format=DATE_FORMAT):
+        changed.append("dl_data.csv")
+    if write_if_changed(details[details["station_id"].isin(stations)], out / "dl_details.csv"):
+        changed.append("dl_details.csv")
+
+    # Thin the prediction grid along both axes
+    xs, ys = np.sort(locs["x"].unique()), np.sort(locs["y"].unique())
+    grid = locs[locs["x"].isin(xs[::GRID_STRIDE]) & locs["y"].isin(ys[::GRID_STRIDE])]
+    if write_if_changed(grid, out / "locs_pred.csv"):
+        changed.append("locs_pred.csv")
+
+    # Covariates: rows near the sampled windows
+    padded = [(a - COVARIATE_PAD, b, label) for a, b, label in windows]
+    for f in sorted((raw / "covariates").glob("*.csv")):
+        cov = pd.read_csv(f, parse_dates=["datetime"])
+        if write_if_changed(cov[in_windows(cov["datetime"], padded)],
+                            out / "covariates" / f.name, date_format=DATE_FORMAT):
+            changed.append(f"covariates/{f.name}")
+
+    record = {
+        "seed": seed,
+        "rows": int(len(sample)),
+        "full_rows": int(len(df)),
+        "stations": strata[strata["station_id"].isin(stations)].to_dict("records"),
+        "windows": [{"start": str(a), "end": str(b), "season": s} for a, b, s in windows],
+    }
+    (Path(sandbox) / SAMPLE_FILE).write_text(json.dumps(record, indent=2, default=str))
+
+    print(f"Sample: {len(stations)} of {details['station_id'].nunique()} stations, "
+          f"{len(windows)} windows, {len(sample):,} of {len(df):,} rows "
+          f"({len(sample) / max(1, len(df)):.1%})")
+    for s in record["stations"]:
+        print(f"  station {s['station_id']:>4}  {s['region']}  {s['quality']:<4} "
+              f"observed {s['observed']:.0%}")
+    for w in record["windows"]:
+        print(f"  {w['season']:<13} {w['start']} → {w['end']}")
+    print("Changed raw files:", ", ".join(changed) if changed else "none")
+    return record
+
+
+# ---------------- CLI ----------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the pipeline on a stratified dev sample.")
+    parser.add_argument("--sandbox", default=str(SANDBOX_DIR))
+    parser.add_argument("--stations", type=int, default=N_STATIONS)
+    parser.add_argument("--window-days", type=int, default=WINDOW_DAYS)
+    parser.add_argument("--windows-per-season", type=int, default=WINDOWS_PER_SEASON)
+    parser.add_argument("--seed", type=int, default=RANDOM_SEED)
+    parser.add_argument("--only", nargs="+", metavar="STAGE",
+                        help="run these stages (and anything upstream that is stale)")
+    parser.add_argument("--force", action="store_true")
+    parser.add_argument("--jobs", type=int, default=2)
+    parser.add_argument("--sample-only", action="store_true",
+                        help="write the sample without running the pipeline")
+    args = parser.parse_args()
+
+    sandbox = Path(args.sandbox)
+    build_sample(sandbox, args.stations, args.window_days, args.windows_per_season, args.seed)
+    if args.sample_only:
+        return
+
+    # Stage params are read from the environment, so they are hashed too
+    for k, v in DEV_PARAMS.items():
+        os.environ.setdefault(k, v)
+
+    # Fresh copy of the scripts; unchanged ones keep their stage hashes
+    run_pipeline.prepare_workspace(sandbox)
+    print(f"\nRunning pipeline in {sandbox}")
+    results = run_pipeline.run_pipeline(
+        root=sandbox, only=args.only, force=args.force, jobs=args.jobs
+    )
+    run_pipeline.print_summary(results)
+
+    if any(r["status"] in ("failed", "blocked") for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
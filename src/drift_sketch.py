@@ -0,0 +1,427 @@
+# ============================================================
+# drift_sketch.py
+# Streaming distribution sketches for drift monitoring
+# (05_drift_monitor.py)
+#   - One sketch per variable × station × calendar month:
+#     moments (count, sum, sum of squares, min, max) and a
+#     signed log-binned quantile histogram (relative error
+#     SKETCH_ALPHA; the rollup cube's sketch mirrored for
+#     negative values). Sketches merge by adding, so station
+#     pools and multi-month references are plain sums.
+#   - Months live in a ring of RETAIN_MONTHS slots: a new month
+#     evicts the one RETAIN_MONTHS earlier, so memory depends on
+#     variables × stations only, never on history length
+#   - Updates are append-only per variable × station watermark
+#     (as in rollup_cube.py); AQI_DRIFT_REBUILD=1 starts over
+#   - Each month slot also keeps a digest of the rows folded into
+#     it. Inputs are regenerated every run, so verify() compares
+#     it against the rows now at or before the watermark, and
+#     slots whose history changed are cleared and folded again
+#   - A DIRTY marker is written before the first in-place change
+#     and removed once save() completes; sketches loaded with the
+#     marker present were interrupted mid-update and start over
+#
+# Drift scores come from the histograms alone: all sketches
+# share one bin grid, so PSI (over reference-quantile buckets)
+# and the KS distance (max CDF gap over bin edges) need no raw
+# rows.
+# ============================================================
+
+import json
+from pathlib import Path
+
+import numpy as np
+
+from rollup_cube import row_digest
+
+# ---------------- CONFIG ----------------
+DRIFT_DIR = Path("data/drift")
+DIRTY_FILE = "DIRTY"
+
+RETAIN_MONTHS = 24          # ring length; ≥ 13 keeps last year's same month
+SKETCH_ALPHA = 0.1          # relative accuracy of sketch quantiles
+SKETCH_MIN = 1e-3           # |values| at or below land in the zero bin
+SKETCH_MAX = 1e5
+
+PSI_BUCKETS = 10
+PSI_EPS = 1e-4              # floor on bucket shares inside the PSI log
+# ---------------------------------------
+
+SKETCH_GAMMA = (1 + SKETCH_ALPHA) / (1 - SKETCH_ALPHA)
+_HALF = int(np.ceil(np.log(SKETCH_MAX / SKETCH_MIN) / np.log(SKETCH_GAMMA))) + 1
+SKETCH_BINS = 2 * _HALF - 1        # negatives, zero bin, positives; ordered by value
+
+MOMENT_FIELDS = ["count", "sum", "sumsq", "min", "max"]
+_INIT = {"count": 0, "sum": 0.0, "sumsq": 0.0, "min": np.inf, "max": -np.inf}
+_DTYPE = {"count": np.int64, "sum": np.float64, "sumsq": np.float64,
+          "min": np.float32, "max": np.float32}
+
+
+# ---------------- Bins ----------------
+
+def sketch_bins(values):
+    """Signed log-spaced bin of each value; bin order follows value order."""
+    mag = np.abs(values)
+    b = np.ceil(np.log(np.maximum(mag, SKETCH_MIN) / SKETCH_MIN) / np.log(SKETCH_GAMMA))
+    b = np.clip(b, 0, _HALF - 1).astype(np.int64)
+    return _HALF - 1 + np.sign(values).astype(np.int64) * b
+
+
+def bin_values():
+    """Representative value of every bin."""
+    m = np.abs(np.arange(SKETCH_BINS) - (_HALF - 1))
+    mag = np.where(m == 0, 0.0, 2 * SKETCH_MIN * SKETCH_GAMMA ** m / (SKETCH_GAMMA + 1))
+    return np.sign(np.arange(SKETCH_BINS) - (_HALF - 1)) * mag
+
+
+def hist_quantiles(hist, qs):
+    """Quantiles from histograms (..., SKETCH_BINS) → (..., len(qs))."""
+    cum = np.cumsum(np.asarray(hist, dtype=np.int64), axis=-1)
+    total = cum[..., -1:]
+    centers = bin_values()
+    out = []
+    for q in qs:
+        rank = np.floor(q * np.maximum(total - 1, 0))
+        idx = np.minimum((cum <= rank).sum(axis=-1), SKETCH_BINS - 1)
+        out.append(np.where(total[..., 0] > 0, centers[idx], np.nan))
+    return np.stack(out, axis=-1)
+
+
+# ---------------- Scores ----------------
+
+def psi(ref, live):
+    """
+    Population stability index per row of (n × SKETCH_BINS) histograms.
+    Bins are grouped into PSI_BUCKETS buckets of equal reference mass.
+    """
+    ref = np.asarray(ref, dtype=np.float64)
+    live = np.asarray(live, dtype=np.float64)
+    n_ref = ref.sum(axis=1, keepdims=True)
+    n_live = live.sum(axis=1, keepdims=True)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mid = (np.cumsum(ref, axis=1) - ref / 2) / n_ref
+        bucket = np.clip(np.floor(mid * PSI_BUCKETS), 0, PSI_BUCKETS - 1)
+    bucket = np.nan_to_num(bucket).astype(np.int64)
+
+    rows = np.repeat(np.arange(len(ref)), ref.shape[1])
+    flat = rows * PSI_BUCKETS + bucket.ravel()
+    size = len(ref) * PSI_BUCKETS
+    r = np.bincount(flat, ref.ravel(), minlength=size).reshape(-1, PSI_BUCKETS)
+    l = np.bincount(flat, live.ravel(), minlength=size).reshape(-1, PSI_BUCKETS)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        r = np.maximum(r / n_ref, PSI_EPS)
+        l = np.maximum(l / n_live, PSI_EPS)
+    return ((l - r) * np.log(l / r)).sum(axis=1)
+
+
+def ks(ref, live):
+    """Largest gap between the two empirical CDFs, per row."""
+    ref = np.asarray(ref, dtype=np.float64)
+    live = np.asarray(live, dtype=np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cr = np.cumsum(ref, axis=1) / ref.sum(axis=1, keepdims=True)
+        cl = np.cumsum(live, axis=1) / live.sum(axis=1, keepdims=True)
+    return np.abs(cr - cl).max(axis=1)
+
+
+# ---------------- Store ----------------
+
+def _month_index(hours):
+    """Calendar months since 1970-01 for hour offsets since the epoch."""
+    return hours.astype("datetime64[h]").astype("datetime64[M]").astype(np.int64)
+
+
+class DriftSketches:
+    """
+    variable × station × month-slot sketches. slot_month[k] is the
+    calendar month (months since 1970-01) held in slot k, -1 if empty.
+    """
+
+    def __init__(self, root=DRIFT_DIR):
+        self.root = Path(root)
+        self.variables = []
+        self.kinds = {}
+        self.station_ids = np.array([], dtype=np.int64)
+        self.slot_month = np.full(RETAIN_MONTHS, -1, dtype=np.int64)
+        self.hist = np.zeros((0, 0, RETAIN_MONTHS, SKETCH_BINS), dtype=np.int32)
+        self.moments = {f: np.full((0, 0, RETAIN_MONTHS), _INIT[f], dtype=_DTYPE[f])
+                        for f in MOMENT_FIELDS}
+        self.watermark = np.zeros((0, 0), dtype=np.int64)     # hours since epoch; -1 = none
+        self._seen = self.watermark.copy()                     # latest hour applied this run
+        self.digest = np.zeros((0, 0, RETAIN_MONTHS), dtype=np.uint64)   # rows folded per slot
+        self._check = self.digest.copy()                       # this run's rows ≤ watermark
+        self._added = self.digest.copy()                       # rows applied this run
+        self._fed = set()                                      # variables seen this run
+        self._refold = None                                    # slots being folded again
+        self.stats = {"rows": 0, "late_rows": 0, "evicted_months": 0, "refolded_slots": 0}
+        self._relayout = True
+        self._dirty = False
+
+    # ---------------- Storage ----------------
+    @classmethod
+    def load(cls, root=DRIFT_DIR, mode="r"):
+        """mode "r" for scoring, "r+" to update in place."""
+        sk = cls(root)
+        meta_path = sk.root / "meta.json"
+        if not meta_path.exists():
+            return sk
+
+        if (sk.root / DIRTY_FILE).exists():
+            print(f"Drift sketches under {sk.root} were interrupted mid-update; starting over")
+            return sk
+
+        meta = json.loads(meta_path.read_text())
+        if meta["retain_months"] != RETAIN_MONTHS or meta["sketch_alpha"] != SKETCH_ALPHA:
+            print(f"Drift sketches under {sk.root} use other settings; starting over")
+            return sk
+
+        sk._relayout = False
+        sk.variables = meta["variables"]
+        sk.kinds = meta["kinds"]
+        sk.station_ids = np.array(meta["station_ids"], dtype=np.int64)
+        sk.slot_month = np.array(meta["slot_month"], dtype=np.int64)
+        sk.hist = np.load(sk.root / "hist.npy", mmap_mode=mode)
+        sk.moments = {f: np.load(sk.root / f"moment_{f}.npy", mmap_mode=mode) for f in MOMENT_FIELDS}
+        sk.watermark = np.load(sk.root / "watermark.npy")
+        sk._seen = sk.watermark.copy()
+        # Sketches written before digests existed are verified once (and refolded)
+        digest = sk.root / "digest.npy"
+        sk.digest = (np.load(digest) if digest.exists()
+                     else np.zeros(sk.watermark.shape + (RETAIN_MONTHS,), dtype=np.uint64))
+        sk._check = np.zeros_like(sk.digest)
+        sk._added = np.zeros_like(sk.digest)
+        return sk
+
+    def _mark_dirty(self):
+        """Flag the files as inconsistent until save() completes."""
+        if not self._dirty:
+            self.root.mkdir(parents=True, exist_ok=True)
+            (self.root / DIRTY_FILE).touch()
+            self._dirty = True
+
+    def save(self):
+        """Flush in-place updates, or rewrite everything after a re-layout."""
+        self._mark_dirty()
+        self.watermark = np.maximum(self.watermark, self._seen)
+        self.digest += self._added
+        self._added[:] = 0
+        np.save(self.root / "watermark.npy", self.watermark)
+        np.save(self.root / "digest.npy", self.digest)
+
+        if not self._relayout:
+            for arr in [self.hist] + list(self.moments.values()):
+                if isinstance(arr, np.memmap):
+                    arr.flush()
+        else:
+            np.save(self.root / "hist.npy", self.hist)
+            for f in MOMENT_FIELDS:
+                np.save(self.root / f"moment_{f}.npy", self.moments[f])
+            self._relayout = False
+
+        # Slots change without a re-layout, so meta is always rewritten
+        (self.root / "meta.json").write_text(json.dumps({
+            "variables": self.variables,
+            "kinds": self.kinds,
+            "station_ids": self.station_ids.tolist(),
+            "slot_month": self.slot_month.tolist(),
+            "retain_months": RETAIN_MONTHS,
+            "sketch_alpha": SKETCH_ALPHA,
+        }, indent=2))
+        (self.root / DIRTY_FILE).unlink()
+        self._dirty = False
+
+    # ---------------- Update ----------------
+    def _grow(self, variables, kind, station_ids):
+        """Re-allocate to cover new variables / stations; a no-op otherwise."""
+        new_vars = [v for v in variables if v not in self.kinds]
+        new_st = np.setdiff1d(station_ids, self.station_ids)
+        if not new_vars and not len(new_st):
+            return
+
+        n_v, n_s = len(self.variables), len(self.station_ids)
+        shape = (n_v + len(new_vars), n_s + len(new_st))
+
+        hist = np.zeros(shape + (RETAIN_MONTHS, SKETCH_BINS), dtype=np.int32)
+        hist[:n_v, :n_s] = self.hist
+        moments = {f: np.full(shape + (RETAIN_MONTHS,), _INIT[f], dtype=_DTYPE[f]) for f in MOMENT_FIELDS}
+        for f in MOMENT_FIELDS:
+            moments[f][:n_v, :n_s] = self.moments[f]
+        watermark = np.full(shape, -1, dtype=np.int64)
+        watermark[:n_v, :n_s] = self.watermark
+        seen = watermark.copy()
+        seen[:n_v, :n_s] = self._seen
+        digests = []
+        for old in (self.digest, self._check, self._added):
+            new = np.zeros(shape + (RETAIN_MONTHS,), dtype=np.uint64)
+            new[:n_v, :n_s] = old
+            digests.append(new)
+
+        self.hist, self.moments, self.watermark, self._seen = hist, moments, watermark, seen
+        self.digest, self._check, self._added = digests
+        self.variables = self.variables + new_vars
+        self.kinds.update({v: kind for v in new_vars})
+        self.station_ids = np.concatenate([self.station_ids, new_st])
+        self._relayout = True
+
+    def _slots(self, months):
+        """Slot of each month, evicting older months; -1 where the month is too old."""
+        slot = (months % RETAIN_MONTHS).astype(np.int64)
+        for m in np.unique(months):
+            k = m % RETAIN_MONTHS
+            held = self.slot_month[k]
+            if held == m:
+                continue
+            if held > m:
+                slot[months == m] = -1
+                continue
+            if held >= 0:
+                self.hist[:, :, k] = 0
+                for f in MOMENT_FIELDS:
+                    self.moments[f][:, :, k] = _INIT[f]
+                for d in (self.digest, self._check, self._added):
+                    d[:, :, k] = 0
+                self.stats["evicted_months"] += 1
+            self.slot_month[k] = m
+        return slot
+
+    def update(self, variable, kind, station_ids, times, values):
+        """
+        Fold new observations of one variable into its sketches.
+        Rows at or before the variable × station watermark, NaNs and
+        months older than the ring are skipped. Returns rows applied.
+
+        The watermark only advances on save(), so a file can be fed in
+        chunks in any row order. While refolding (after verify()), only
+        rows of the cleared slots are applied, at any hour.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        ok = np.isfinite(values)
+        station_ids, times, values = np.asarray(station_ids)[ok], np.asarray(times)[ok], values[ok]
+        if not len(values):
+            return 0
+
+        self._grow([variable], kind, np.unique(station_ids))
+        j = self.variables.index(variable)
+        self._fed.add(j)
+
+        order = np.argsort(self.station_ids)
+        s = order[np.searchsorted(self.station_ids, station_ids, sorter=order)]
+        hours = times.astype("datetime64[h]").astype(np.int64)
+        months = _month_index(hours)
+
+        if self._refold is not None:
+            slot = months % RETAIN_MONTHS
+            new = (self.slot_month[slot] == months) & self._refold[j, s, slot]
+        else:
+            # History check: rows already folded into a retained slot
+            old = hours <= self.watermark[j, s]
+            slot = months[old] % RETAIN_MONTHS
+            held = self.slot_month[slot] == months[old]
+            np.add.at(self._check[j], (s[old][held], slot[held]),
+                      row_digest(hours[old][held], values[old][held]))
+            new = ~old
+
+        s, hours, values, months = s[new], hours[new], values[new], months[new]
+        if not len(values):
+            return 0
+        if not self._relayout:
+            self._mark_dirty()
+
+        slot = self._slots(months)
+        keep = slot >= 0
+        self.stats["late_rows"] += int((~keep).sum())
+        s, slot, v, h = s[keep], slot[keep], values[keep], hours[keep]
+        np.add.at(self._added[j], (s, slot), row_digest(h, v))
+
+        # Counts for this variable's block only, so the bincount stays small
+        n_s = len(self.station_ids)
+        cell = s * RETAIN_MONTHS + slot
+        hist_j = self.hist[j].reshape(-1)
+        hist_j += np.bincount(
+            cell * SKETCH_BINS + sketch_bins(v), minlength=n_s * RETAIN_MONTHS * SKETCH_BINS
+        ).astype(np.int32)
+
+        size = n_s * RETAIN_MONTHS
+        mom = {f: self.moments[f][j].reshape(-1) for f in MOMENT_FIELDS}
+        mom["count"] += np.bincount(cell, minlength=size)
+        mom["sum"] += np.bincount(cell, v, minlength=size)
+        mom["sumsq"] += np.bincount(cell, v * v, minlength=size)
+        np.minimum.at(mom["min"], cell, v.astype(np.float32))
+        np.maximum.at(mom["max"], cell, v.astype(np.float32))
+
+        np.maximum.at(self._seen[j], s, h)
+        self.stats["rows"] += len(v)
+        return len(v)
+
+    def verify(self):
+        """
+        After a full pass over the inputs: clear the slots whose rows at
+        or before the watermark no longer match their digest (variables
+        fed this run only) and switch update() to refolding them.
+        Returns the number of slots to refold.
+        """
+        fed = np.zeros(len(self.variables), dtype=bool)
+        fed[list(self._fed)] = True
+        stale = ((self.watermark >= 0)[..., None] & (self.slot_month >= 0)
+                 & fed[:, None, None] & (self._check != self.digest))
+        self._check[:] = 0
+        if not stale.any():
+            return 0
+
+        if not self._relayout:
+            self._mark_dirty()
+        j, s, k = np.nonzero(stale)
+        self.hist[j, s, k] = 0
+        for f in MOMENT_FIELDS:
+            self.moments[f][j, s, k] = _INIT[f]
+        self.digest[j, s, k] = 0
+        self._added[j, s, k] = 0
+        self._refold = stale
+        self.stats["refolded_slots"] += len(j)
+        return len(j)
+
+    # ---------------- Scores ----------------
+    def months(self):
+        """Retained calendar months, oldest first (as datetime64[M])."""
+        held = np.sort(self.slot_month[self.slot_month >= 0])
+        return held.astype("datetime64[M]")
+
+    def reference(self, month, min_count):
+        """
+        Reference sketches for `month`: the same calendar month of
+        earlier years where a variable × station has at least
+        `min_count` values there, otherwise every earlier month.
+        Returns (hist, moments, basis) over variable × station.
+        """
+        m = np.datetime64(month, "M").astype(np.int64)
+        earlier = (self.slot_month >= 0) & (self.slot_month < m)
+        same = earlier & ((self.slot_month - m) % 12 == 0)
+
+        def pooled(mask):
+            h = np.asarray(self.hist[:, :, mask], dtype=np.int64).sum(axis=2)
+            mo = {f: np.asarray(self.moments[f][:, :, mask]) for f in MOMENT_FIELDS}
+            return h, {
+                "count": mo["count"].sum(axis=2), "sum": mo["sum"].sum(axis=2),
+                "sumsq": mo["sumsq"].sum(axis=2),
+                "min": mo["min"].min(axis=2, initial=np.inf),
+                "max": mo["max"].max(axis=2, initial=-np.inf),
+            }
+
+        h_all, m_all = pooled(earlier)
+        h_same, m_same = pooled(same)
+        use_same = m_same["count"] >= min_count
+
+        hist = np.where(use_same[..., None], h_same, h_all)
+        moments = {f: np.where(use_same, m_same[f], m_all[f]) for f in MOMENT_FIELDS}
+        basis = np.where(use_same, "same_month", "all_earlier")
+        return hist, moments, basis
+
+    def live(self, month):
+        """Sketches of one retained month over variable × station."""
+        m = np.datetime64(month, "M").astype(np.int64)
+        k = int(np.flatnonzero(self.slot_month == m)[0])
+        hist = np.asarray(self.hist[:, :, k], dtype=np.int64)
+        moments = {f: np.asarray(self.moments[f][:, :, k]) for f in MOMENT_FIELDS}
+        return hist, moments
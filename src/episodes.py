@@ -0,0 +1,286 @@
+# ============================================================
+# episodes.py
+# Pollution-episode detection over forecast cubes
+# (05_detect_episodes.py)
+#   - Works on (hours × sites) arrays: stations from the station
+#     AQI table or cells of the heatmap grid AQI cube
+#   - Threshold crossing via the CPCB category codes (aqi.py),
+#     then run lengths down each site column in one cumsum /
+#     bincount pass (as the flatline check in 00b)
+#   - Spatial clustering: (hour, site) nodes joined to the same
+#     site an hour later and to active neighbour sites within a
+#     radius in the same hour; one connected_components call
+#     labels every spatio-temporal episode
+#   - AlertBook matches this run's episodes to the alerts of
+#     earlier runs (same rule and source, overlapping hours and
+#     sites), so a refresh only reports what changed
+# ============================================================
+
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+
+from aqi import CATEGORIES, category_codes
+
+# ---------------- CONFIG ----------------
+KM_PER_DEG = 111.2
+GRID_NEIGHBOR_FACTOR = 1.5      # grid cells within 1.5 × the grid spacing touch
+
+MATCH_SLACK_HOURS = 6           # episodes this close in time can be the same alert
+UPDATE_HOURS = 3                # start / end moves that count as an update
+# ---------------------------------------
+
+
+# ---------------- Geometry ----------------
+
+def project_km(lon, lat):
+    """Local equirectangular projection to km (fine at city scale)."""
+    lon, lat = np.asarray(lon, dtype=float), np.asarray(lat, dtype=float)
+    return np.c_[lon * KM_PER_DEG * np.cos(np.radians(lat.mean())), lat * KM_PER_DEG]
+
+
+def grid_spacing_km(lon, lat):
+    """Median distance between neighbouring grid cells."""
+    d, _ = cKDTree(project_km(lon, lat)).query(project_km(lon, lat), k=2)
+    return float(np.median(d[:, 1]))
+
+
+def neighbor_pairs(lon, lat, radius_km):
+    """(P × 2) site index pairs closer than radius_km; None = every site touches every other."""
+    if radius_km is None:
+        return None
+    return cKDTree(project_km(lon, lat)).query_pairs(radius_km, output_type="ndarray")
+
+
+# ---------------- Detection ----------------
+
+def exceeds(values, category):
+    """(hours × sites) True where the index is in `category` or worse."""
+    return category_codes(values) >= CATEGORIES.index(category)
+
+
+def sustained(mask, min_hours):
+    """True where a cell is inside a run of at least `min_hours` True hours."""
+    n_hours, n_sites = mask.shape
+    m = mask.T.ravel()                      # column-major: each site contiguous
+
+    starts = np.ones(m.shape, dtype=bool)
+    starts[1:] = m[1:] != m[:-1]
+    starts[::n_hours] = True                # runs never cross into the next site
+
+    run_id = np.cumsum(starts) - 1
+    run_len = np.bincount(run_id)[run_id]
+    return (m & (run_len >= min_hours)).reshape(n_sites, n_hours).T
+
+
+def label_episodes(active, pairs):
+    """
+    Connected (hour, site) components of `active`. Returns
+    (labels, n): labels is (hours × sites), -1 where inactive.
+    pairs=None joins every active site of an hour through one
+    hub node per hour instead of neighbour edges.
+    """
+    n_hours, n_sites = active.shape
+    node = np.arange(n_hours * n_sites).reshape(n_hours, n_sites)
+
+    # Same site, consecutive hours
+    h, s = np.nonzero(active[:-1] & active[1:])
+    src, dst = [node[h, s]], [node[h + 1, s]]
+
+    if pairs is None:
+        h, s = np.nonzero(active)
+        src.append(node[h, s])
+        dst.append(n_hours * n_sites + h)
+    elif len(pairs):
+        h, p = np.nonzero(active[:, pairs[:, 0]] & active[:, pairs[:, 1]])
+        src.append(node[h, pairs[p, 0]])
+        dst.append(node[h, pairs[p, 1]])
+
+    n_nodes = n_hours * n_sites
+    size = n_nodes + (n_hours if pairs is None else 0)
+    src, dst = np.concatenate(src), np.concatenate(dst)
+    graph = sparse.coo_matrix((np.ones(len(src), dtype=np.int8), (src, dst)), shape=(size, size))
+    _, comp = connected_components(graph, directed=False)
+
+    # Renumber the components that hold active nodes as 0..n-1
+    comp = comp[:n_nodes].reshape(n_hours, n_sites)
+    uniq, inverse = np.unique(comp[active], return_inverse=True)
+    labels = np.full((n_hours, n_sites), -1, dtype=np.int64)
+    labels[active] = inverse
+    return labels, len(uniq)
+
+
+def summarize(labels, n, values, times, site_ids, xy):
+    """
+    One row per episode: start / end hour, duration, peak number of
+    simultaneous sites, distinct sites, peak value and its time,
+    centroid (km-projected xy averaged over site-hours).
+    """
+    n_hours = labels.shape[0]
+    h, s = np.nonzero(labels >= 0)
+    lab = labels[h, s]
+    v = values[h, s]
+
+    start = np.full(n, n_hours)
+    end = np.full(n, -1)
+    np.minimum.at(start, lab, h)
+    np.maximum.at(end, lab, h)
+
+    per_hour = np.bincount(lab * n_hours + h, minlength=n * n_hours).reshape(n, n_hours)
+    site_pairs = np.unique(lab * len(site_ids) + s)
+    sites_of = np.split(site_ids[site_pairs % len(site_ids)],
+                        np.searchsorted(site_pairs // len(site_ids), np.arange(1, n)))
+
+    order = np.lexsort((-v, lab))
+    first = order[np.searchsorted(lab[order], np.arange(n))]
+
+    hours = np.bincount(lab, minlength=n)
+    return pd.DataFrame({
+        "start": times[start],
+        "end": times[end],
+        "hours": end - start + 1,
+        "max_sites": per_hour.max(axis=1),
+        "n_sites": [len(x) for x in sites_of],
+        "site_hours": hours,
+        "peak_value": v[first],
+        "peak_time": times[h[first]],
+        "x_km": np.bincount(lab, xy[s, 0], minlength=n) / hours,
+        "y_km": np.bincount(lab, xy[s, 1], minlength=n) / hours,
+        "sites": [x.tolist() for x in sites_of],
+    })
+
+
+def detect(rule, values, times, site_ids, xy, pairs, start, min_sites):
+    """
+    Episodes of one rule over an (hours × sites) cube. The scan
+    covers [start, start + horizon_hours). Returns a frame (empty
+    if nothing qualifies).
+    """
+    times = np.asarray(times, dtype="datetime64[h]")
+    start = np.datetime64(start, "h")
+    window = (times >= start) & (times < start + np.timedelta64(rule["horizon_hours"], "h"))
+    values, times = values[window], times[window]
+    if not len(times):
+        return pd.DataFrame()
+
+    active = sustained(exceeds(values, rule["category"]), rule["min_hours"])
+    if not active.any():
+        return pd.DataFrame()
+
+    labels, n = label_episodes(active, pairs)
+    out = summarize(labels, n, values, times, np.asarray(site_ids), xy)
+    return out[out["max_sites"] >= min_sites].reset_index(drop=True)
+
+
+# ---------------- Alerts across runs ----------------
+
+class AlertBook:
+    """
+    Alerts carried between forecast runs (alert_state.json).
+    reconcile() gives every episode an alert id and a status:
+      new       : no earlier alert matches
+      updated   : matches, but start / end moved by UPDATE_HOURS or
+                  more, or the peak category or site count grew
+      ongoing   : matches, nothing material changed (not re-sent)
+    and earlier alerts without a match become
+      cancelled : still in the future, no longer forecast
+      expired   : ended before this run's forecast start
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        state = json.loads(self.path.read_text()) if self.path.exists() else {}
+        self.next_id = state.get("next_id", 1)
+        self.alerts = state.get("alerts", [])
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"next_id": self.next_id, "alerts": self.alerts}, indent=2))
+        tmp.replace(self.path)
+
+    def _match(self, episodes):
+        """Greedy one-to-one matches (episode row → alert index), best site overlap first."""
+        slack = pd.Timedelta(hours=MATCH_SLACK_HOURS)
+        candidates = []
+        for i, ep in enumerate(episodes.itertuples()):
+            ep_sites = set(ep.sites)
+            for k, a in enumerate(self.alerts):
+                if (a["rule"], a["source"]) != (ep.rule, ep.source):
+                    continue
+                if pd.Timestamp(a["start"]) > ep.end + slack or pd.Timestamp(a["end"]) < ep.start - slack:
+                    continue
+                shared = len(ep_sites & set(a["sites"]))
+                if shared:
+                    candidates.append((shared, i, k))
+
+        matches, used = {}, set()
+        for shared, i, k in sorted(candidates, reverse=True):
+            if i not in matches and k not in used:
+                matches[i] = k
+                used.add(k)
+        return matches
+
+    def reconcile(self, episodes, forecast_start):
+        """
+        episodes: frame with rule, source, start, end, max_sites,
+        peak_value, sites. Returns (episodes with alert_id / status,
+        events frame of new / updated / cancelled / expired alerts).
+        """
+        forecast_start = pd.Timestamp(forecast_start)
+        matches = self._match(episodes) if len(episodes) else {}
+        update = pd.Timedelta(hours=UPDATE_HOURS)
+
+        ids, status, kept, events = [], [], [], []
+        for i, ep in enumerate(episodes.itertuples()):
+            record = {
+                "rule": ep.rule, "source": ep.source,
+                "start": str(ep.start), "end": str(ep.end),
+                "max_sites": int(ep.max_sites), "peak_value": float(ep.peak_value),
+                "category": CATEGORIES[max(int(category_codes(np.array([ep.peak_value]))[0]), 0)],
+                "sites": [int(x) for x in ep.sites],
+            }
+            if i in matches:
+                old = self.alerts[matches[i]]
+                record["alert_id"] = old["alert_id"]
+                record["issued"] = old["issued"]
+
+                # An episode already under way is cut at this run's start
+                old_start = pd.Timestamp(old["start"])
+                if old_start < forecast_start:
+                    record["start"] = str(min(old_start, ep.start))
+                moved = (abs(max(old_start, forecast_start) - ep.start) >= update
+                         or abs(ep.end - pd.Timestamp(old["end"])) >= update)
+                worse = (CATEGORIES.index(record["category"]) > CATEGORIES.index(old["category"])
+                         or record["max_sites"] > old["max_sites"])
+                st = "updated" if (moved or worse) else "ongoing"
+            else:
+                record["alert_id"] = f"A{self.next_id:06d}"
+                record["issued"] = str(forecast_start)
+                self.next_id += 1
+                st = "new"
+
+            ids.append(record["alert_id"])
+            status.append(st)
+            kept.append(record)
+            if st != "ongoing":
+                events.append({**record, "status": st})
+
+        matched = set(matches.values())
+        for k, a in enumerate(self.alerts):
+            if k in matched:
+                continue
+            st = "expired" if pd.Timestamp(a["end"]) < forecast_start else "cancelled"
+            events.append({**a, "status": st})
+
+        self.alerts = kept
+        episodes = episodes.assign(alert_id=ids, status=status)
+        events = pd.DataFrame(events)
+        if len(events):
+            events.insert(0, "run", str(forecast_start))
+        return episodes, events
@@ -0,0 +1,42 @@
+# ============================================================
+# feature_sets.py
+# Per-pollutant feature subsets chosen by 04f_prune_features.py
+#   AQI_FEATURE_PRUNING=1 makes the training scripts build their
+#   matrices from models/feature_sets.json instead of every
+#   numeric column. Prediction follows automatically: the model
+#   manifest records the columns it was trained on.
+# ============================================================
+
+import json
+import os
+from pathlib import Path
+
+# ---------------- CONFIG ----------------
+FEATURE_SETS_FILE = Path("models/feature_sets.json")
+PRUNING = os.environ.get("AQI_FEATURE_PRUNING", "0") == "1"
+# ---------------------------------------
+
+
+def load_feature_sets(path=FEATURE_SETS_FILE):
+    """pollutant → selected features; empty when no pruning has been run."""
+    path = Path(path)
+    if not path.exists():
+        return {}
+    return {p: s["features"] for p, s in json.loads(path.read_text())["pollutants"].items()}
+
+
+def select_features(X, pollutant, feature_sets):
+    """
+    Restrict a feature matrix to the pollutant's pruned subset when
+    AQI_FEATURE_PRUNING=1, keeping X's column order. Selected features a
+    family does not use (e.g. station_id in XGBoost) are ignored.
+    Returns (X, pruned).
+    """
+    if not PRUNING:
+        return X, False
+    if pollutant not in feature_sets:
+        print(f"  No pruned feature set for {pollutant} in {FEATURE_SETS_FILE}, using all columns")
+        return X, False
+
+    keep = set(feature_sets[pollutant])
+    return X[[c for c in X.columns if c in keep]], True
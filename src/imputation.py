@@ -0,0 +1,153 @@
+# ============================================================
+# imputation.py
+# Gap-filling methods shared by 02_imputation.py and the
+# masked-holdout evaluation (02d)
+#   - Linear interpolation (short gaps)
+#   - Kalman smoothing (medium gaps)
+#   - IDW from neighbouring stations (long gaps)
+#
+# The *_batch functions evaluate the same methods over many
+# gaps at once with numpy.
+# ============================================================
+
+import numpy as np
+from scipy.spatial.distance import cdist
+from pykalman import KalmanFilter
+
+# ---------------- CONFIG ----------------
+N_NEIGHBORS = 5
+
+KALMAN_OBS_COV = 1.0
+KALMAN_TRANS_COV = 0.01
+KALMAN_PAD = 10             # observed hours on each side of a medium gap
+
+MIN_IDW_DIST = 1e-3
+# ---------------------------------------
+
+
+# ---------------- Per-gap methods ----------------
+
+def find_nan_blocks(series):
+    is_na = series.isna().values
+    blocks = []
+    i = 0
+    while i < len(is_na):
+        if is_na[i]:
+            j = i
+            while j < len(is_na) and is_na[j]:
+                j += 1
+            blocks.append((i, j, j - i))
+            i = j
+        else:
+            i += 1
+    return blocks
+
+
+def kalman_fill(values):
+    obs = values[~np.isnan(values)]
+    if len(obs) == 0:
+        return values
+
+    kf = KalmanFilter(
+        initial_state_mean=np.mean(obs),
+        observation_covariance=KALMAN_OBS_COV,
+        transition_covariance=KALMAN_TRANS_COV
+    )
+
+    # pykalman only skips *masked* observations; bare NaNs would
+    # propagate through the whole window
+    filled, _ = kf.smooth(np.ma.masked_invalid(values))
+    return np.asarray(filled).flatten()
+
+
+def idw_predict(target_row, others_df, p, n_neighbors=N_NEIGHBORS):
+    coords_t = target_row[["lon", "lat"]].values.reshape(1, -1)
+    coords_o = others_df[["lon", "lat"]].values
+    vals = others_df["val"].values
+
+    dists = cdist(coords_t, coords_o)[0]
+    idx = np.argsort(dists)[:n_neighbors]
+
+    d = np.maximum(dists[idx], MIN_IDW_DIST)
+    w = 1.0 / (d ** p)
+
+    return np.sum(w * vals[idx]) / np.sum(w)
+
+
+# ---------------- Batched methods ----------------
+
+def linear_fill_batch(left, right, length):
+    """
+    Linear interpolation across n gaps of equal `length`.
+    left/right: observed values just before / after each gap.
+    Returns (n × length).
+    """
+    frac = np.arange(1, length + 1) / (length + 1)
+    return left[:, None] + (right - left)[:, None] * frac[None, :]
+
+
+def kalman_smooth_batch(windows):
+    """
+    RTS smoother of the kalman_fill model over n windows at once.
+    windows: (n × L) with NaN for missing hours.
+
+    Same local-level model as kalman_fill (pykalman defaults:
+    identity transition/observation, unit initial covariance,
+    initial mean = mean of the window's observations).
+    """
+    n, length = windows.shape
+    observed = ~np.isnan(windows)
+
+    counts = observed.sum(axis=1)
+    mean0 = np.where(counts > 0, np.nansum(windows, axis=1) / np.maximum(counts, 1), np.nan)
+
+    m_pred = np.empty((length, n))
+    p_pred = np.empty((length, n))
+    m_filt = np.empty((length, n))
+    p_filt = np.empty((length, n))
+
+    m, p = mean0, np.ones(n)
+    for t in range(length):
+        if t > 0:
+            p = p + KALMAN_TRANS_COV
+        m_pred[t], p_pred[t] = m, p
+
+        obs_t = observed[:, t]
+        gain = p / (p + KALMAN_OBS_COV)
+        m = np.where(obs_t, m + gain * (np.nan_to_num(windows[:, t]) - m), m)
+        p = np.where(obs_t, (1 - gain) * p, p)
+        m_filt[t], p_filt[t] = m, p
+
+    m_smooth = np.empty((length, n))
+    m_smooth[-1] = m_filt[-1]
+    for t in range(length - 2, -1, -1):
+        j = p_filt[t] / p_pred[t + 1]
+        m_smooth[t] = m_filt[t] + j * (m_smooth[t + 1] - m_pred[t + 1])
+
+    return m_smooth.T
+
+
+def idw_fill_batch(values, target, dists, p, n_neighbors=N_NEIGHBORS):
+    """
+    IDW estimate for many (hour, target station) pairs at once.
+
+    values : (n × S) station values at each pair's hour (NaN = missing)
+    target : (n,) column index of the station being filled
+    dists  : (S × S) station distance matrix
+    Pairs with fewer than n_neighbors reporting stations → NaN.
+    """
+    n, n_st = values.shape
+    d = dists[target].astype(float)
+    d[np.arange(n), target] = np.inf
+    d[np.isnan(values)] = np.inf
+
+    k = min(n_neighbors, n_st - 1)
+    idx = np.argpartition(d, k - 1, axis=1)[:, :k]
+    d_k = np.take_along_axis(d, idx, axis=1)
+    v_k = np.take_along_axis(values, idx, axis=1)
+
+    enough = np.isfinite(d_k).all(axis=1) & (k == n_neighbors)
+    w = 1.0 / np.maximum(np.where(np.isfinite(d_k), d_k, 1.0), MIN_IDW_DIST) ** p
+    est = np.sum(w * np.nan_to_num(v_k), axis=1) / np.sum(w, axis=1)
+
+    return np.where(enough, est, np.nan)
@@ -0,0 +1,381 @@
+# ============================================================
+# ingest_daemon.py
+# Asyncio daemon for hourly observation drops
+#   - Watches a directory for small CSV drops
+#   - Validates each drop against the dl_data.csv schema
+#   - Deduplicates by (station_id, datetime) against the raw
+#     store and within the batch
+#   - Batch-appends to data/raw/dl_data.csv; while a refresh is
+#     running (it reads and hashes that file) batches go to a
+#     journal instead, merged into the store once it finishes
+#   - Triggers a pipeline refresh through a bounded queue;
+#     bursts of drops coalesce into one refresh
+#
+# Usage:
+#   python src/ingest_daemon.py                   # run forever
+#   python src/ingest_daemon.py --once            # drain and exit
+#   python src/ingest_daemon.py --no-refresh
+# ============================================================
+
+import argparse
+import asyncio
+import shutil
+import signal
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# ---------------- CONFIG ----------------
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+WATCH_DIR = PROJECT_ROOT / "data" / "incoming"
+PROCESSED_SUBDIR = "processed"
+REJECTED_SUBDIR = "rejected"
+
+RAW_FILE = PROJECT_ROOT / "data" / "raw" / "dl_data.csv"
+JOURNAL_SUFFIX = ".journal"   # dl_data.csv.journal: rows appended during a refresh
+STATIONS_FILE = PROJECT_ROOT / "data" / "raw" / "dl_details.csv"
+
+POLLUTANTS = ["pm2.5", "pm10", "nox", "so2", "co", "o3"]
+KEY_COLS = ["station_id", "datetime"]
+
+POLL_SECONDS = 2.0          # directory scan interval
+BATCH_WINDOW_SECONDS = 5.0  # drops arriving within this window share one append
+FILE_QUEUE_SIZE = 64        # watcher blocks when the writer is this far behind
+REFRESH_QUEUE_SIZE = 1      # at most one refresh waiting behind the running one
+
+REFRESH_COMMAND = [sys.executable, str(PROJECT_ROOT / "src" / "run_pipeline.py")]
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+# ---------------------------------------
+
+
+class DropRejected(ValueError):
+    pass
+
+
+# ---------------- Key index ----------------
+
+def encode_keys(station_ids, datetimes):
+    """(station_id, hour) → one int64 per row, for fast set membership."""
+    hours = (pd.DatetimeIndex(datetimes) - pd.Timestamp(0)) // pd.Timedelta(hours=1)
+    return np.asarray(station_ids, dtype=np.int64) * 10_000_000 + np.asarray(hours, dtype=np.int64)
+
+
+def load_key_index(raw_file):
+    """Sorted unique keys already present in the raw store."""
+    if not raw_file.exists():
+        return np.array([], dtype=np.int64)
+    keys = pd.read_csv(raw_file, usecols=KEY_COLS, parse_dates=["datetime"])
+    return np.unique(encode_keys(keys["station_id"].values, keys["datetime"].values))
+
+
+def raw_columns(raw_file):
+    if raw_file.exists():
+        return list(pd.read_csv(raw_file, nrows=0).columns)
+    return KEY_COLS + POLLUTANTS
+
+
+# ---------------- Validation ----------------
+
+def validate_drop(path, columns, known_stations):
+    """
+    Parse one drop and return it aligned to the raw schema.
+    Raises DropRejected for anything that cannot be appended.
+    """
+    try:
+        df = pd.read_csv(path)
+    except Exception as e:
+        raise DropRejected(f"unreadable CSV: {e}")
+
+    missing = set(KEY_COLS) - set(df.columns)
+    if missing:
+        raise DropRejected(f"missing key columns {sorted(missing)}")
+
+    unknown = set(df.columns) - set(columns)
+    if unknown:
+        raise DropRejected(f"unknown columns {sorted(unknown)}")
+
+    if not set(POLLUTANTS) & set(df.columns):
+        raise DropRejected("no pollutant columns")
+
+    df["datetime"] = pd.to_datetime(df["datetime"], errors="coerce")
+    df["station_id"] = pd.to_numeric(df["station_id"], errors="coerce")
+    if df[KEY_COLS].isna().any().any():
+        raise DropRejected("unparseable station_id or datetime")
+
+    df["station_id"] = df["station_id"].astype(np.int64)
+    bad_stations = set(df["station_id"]) - known_stations
+    if bad_stations:
+        raise DropRejected(f"unknown stations {sorted(bad_stations)}")
+
+    for c in df.columns:
+        if c not in KEY_COLS:
+            df[c] = pd.to_numeric(df[c], errors="coerce")
+
+    return df.reindex(columns=columns)
+
+
+# ---------------- Daemon ----------------
+
+class IngestDaemon:
+
+    def __init__(self, watch_dir=WATCH_DIR, raw_file=RAW_FILE, refresh=True):
+        self.watch_dir = Path(watch_dir)
+        self.raw_file = Path(raw_file)
+        self.journal = self.raw_file.with_name(self.raw_file.name + JOURNAL_SUFFIX)
+        self.refresh = refresh
+
+        self.file_queue = asyncio.Queue(maxsize=FILE_QUEUE_SIZE)
+        self.refresh_queue = asyncio.Queue(maxsize=REFRESH_QUEUE_SIZE)
+        self.in_flight = set()
+        self.stopping = asyncio.Event()
+        self.store_lock = asyncio.Lock()   # held by an append or a journal switch / merge
+        self.refreshing = False            # appends go to the journal while True
+
+        self.columns = raw_columns(self.raw_file)
+        self.known_stations = set(pd.read_csv(STATIONS_FILE)["station_id"].astype(int))
+        self._merge_journal()        # left over from a refresh that was interrupted
+        self.keys = load_key_index(self.raw_file)
+
+        self.stats = {"files": 0, "rejected": 0, "rows": 0, "duplicates": 0, "refreshes": 0}
+
+    # ---- watcher ----
+    async def watch(self):
+        """Queue drops whose size is stable across two scans."""
+        sizes = {}
+        while not self.stopping.is_set():
+            for path, size in self.scan():
+                if path in self.in_flight:
+                    continue
+                if sizes.get(path) != size:
+                    sizes[path] = size       # still being written
+                    continue
+                sizes.pop(path, None)
+                self.in_flight.add(path)
+                await self.file_queue.put(path)   # backpressure
+
+            try:
+                await asyncio.wait_for(self.stopping.wait(), POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    def scan(self):
+        """(path, size) of the current drops, oldest first; drops that vanish mid-scan are skipped."""
+        found = []
+        for path in self.watch_dir.glob("*.csv"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            found.append((st.st_mtime, path, st.st_size))
+        return [(path, size) for _, path, size in sorted(found)]
+
+    # ---- writer ----
+    async def next_batch(self):
+        """First queued drop plus everything arriving within the batch window."""
+        batch = [await self.file_queue.get()]
+        deadline = time.monotonic() + BATCH_WINDOW_SECONDS
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.file_queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _move(self, path, dest_dir):
+        dest_dir.mkdir(parents=True, exist_ok=True)
+        shutil.move(str(path), str(dest_dir / path.name))
+        self.in_flight.discard(path)
+
+    def _append(self, frames):
+        """
+        Dedupe a batch against the store and append it (blocking);
+        to the journal while a refresh is reading the store.
+        """
+        batch = pd.concat(frames, ignore_index=True)
+        n_in = len(batch)
+        batch = batch.drop_duplicates(subset=KEY_COLS, keep="last")
+
+        keys = encode_keys(batch["station_id"].values, batch["datetime"].values)
+        new = ~np.isin(keys, self.keys)
+        duplicates = n_in - int(new.sum())
+        batch = batch[new]
+
+        if len(batch):
+            target = self.journal if self.refreshing else self.raw_file
+            write_header = not target.exists()
+            target.parent.mkdir(parents=True, exist_ok=True)
+            size = 0 if write_header else target.stat().st_size
+            try:
+                batch.to_csv(
+                    target, mode="a", header=write_header,
+                    index=False, date_format=DATETIME_FORMAT
+                )
+            except Exception:
+                # Cut a half-written batch off again
+                if target.exists():
+                    with open(target, "r+b") as f:
+                        f.truncate(size)
+                raise
+            self.keys = np.union1d(self.keys, keys[new])
+
+        return len(batch), duplicates
+
+    def _merge_journal(self):
+        """Append the journal's rows to the store and remove it (blocking). Returns rows merged."""
+        if not self.journal.exists():
+            return 0
+        # Same columns and format as the store: copy the rows verbatim
+        has_header = self.raw_file.exists()
+        rows = 0
+        with open(self.journal, "rb") as src, open(self.raw_file, "ab") as dst:
+            header = src.readline()
+            if not has_header:
+                dst.write(header)
+            for line in src:
+                dst.write(line)
+                rows += 1
+        self.journal.unlink()
+        return rows
+
+    async def write(self):
+        while True:
+            paths = await self.next_batch()
+            try:
+                await self._write_batch(paths)
+            finally:
+                for _ in paths:
+                    self.file_queue.task_done()
+
+    def _reject(self, path, reason):
+        print(f"[reject] {path.name}: {reason}")
+        self.stats["rejected"] += 1
+        try:
+            self._move(path, self.watch_dir / REJECTED_SUBDIR)
+        except OSError as e:          # vanished or unmovable: forget it
+            print(f"[reject] could not move {path.name}: {e}")
+            self.in_flight.discard(path)
+
+    async def _write_batch(self, paths):
+        frames, accepted = [], []
+        for path in paths:
+            try:
+                frames.append(await asyncio.to_thread(
+                    validate_drop, path, self.columns, self.known_stations
+                ))
+                accepted.append(path)
+            except Exception as e:
+                self._reject(path, e)
+
+        if not frames:
+            return
+
+        try:
+            async with self.store_lock:
+                rows, dups = await asyncio.to_thread(self._append, frames)
+        except Exception as e:
+            for path in accepted:
+                self._reject(path, f"append failed: {e}")
+            return
+
+        self.stats["rows"] += rows
+        self.stats["duplicates"] += dups
+        print(f"[ingest] {len(frames)} file(s): {rows} new rows, {dups} duplicates")
+
+        for path in accepted:
+            self.stats["files"] += 1
+            try:
+                self._move(path, self.watch_dir / PROCESSED_SUBDIR)
+            except OSError as e:
+                print(f"[ingest] could not move {path.name}: {e}")
+                self.in_flight.discard(path)
+
+        if rows and self.refresh:
+            self.request_refresh()
+
+    # ---- refresh ----
+    def request_refresh(self):
+        """Never blocks: if a refresh is already waiting, this one is coalesced."""
+        try:
+            self.refresh_queue.put_nowait(time.time())
+        except asyncio.QueueFull:
+            print("[refresh] already pending, coalesced")
+
+    async def run_refreshes(self):
+        while True:
+            await self.refresh_queue.get()
+            print("[refresh] starting pipeline refresh")
+            t0 = time.perf_counter()
+            # The store is frozen for the refresh: appends go to the journal
+            async with self.store_lock:
+                self.refreshing = True
+            try:
+                proc = await asyncio.create_subprocess_exec(*REFRESH_COMMAND, cwd=PROJECT_ROOT)
+                code = await proc.wait()
+            finally:
+                async with self.store_lock:
+                    self.refreshing = False
+                    merged = await asyncio.to_thread(self._merge_journal)
+            self.stats["refreshes"] += 1
+            print(f"[refresh] finished with exit code {code} in {time.perf_counter() - t0:.1f}s")
+            if merged:
+                print(f"[refresh] merged {merged} journalled rows")
+                self.request_refresh()
+            self.refresh_queue.task_done()
+
+    # ---- lifecycle ----
+    async def run(self, once=False):
+        self.watch_dir.mkdir(parents=True, exist_ok=True)
+        print(f"Watching {self.watch_dir} ({len(self.keys):,} keys in raw store)")
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stopping.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        writer = asyncio.create_task(self.write())
+        refresher = asyncio.create_task(self.run_refreshes())
+
+        if once:
+            for path, _ in self.scan():
+                self.in_flight.add(path)
+                await self.file_queue.put(path)
+        else:
+            watcher = asyncio.create_task(self.watch())
+            await self.stopping.wait()
+            watcher.cancel()
+
+        # Drain what is already queued, then let a pending refresh finish
+        await self.file_queue.join()
+        await self.refresh_queue.join()
+        writer.cancel()
+        refresher.cancel()
+
+        print(
+            f"Stopped. files={self.stats['files']} rejected={self.stats['rejected']} "
+            f"rows={self.stats['rows']} duplicates={self.stats['duplicates']} "
+            f"refreshes={self.stats['refreshes']}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest hourly CSV drops into the raw store.")
+    parser.add_argument("--watch", default=str(WATCH_DIR), help="directory to watch")
+    parser.add_argument("--once", action="store_true", help="ingest current drops and exit")
+    parser.add_argument("--no-refresh", action="store_true", help="do not trigger the pipeline")
+    args = parser.parse_args()
+
+    daemon = IngestDaemon(watch_dir=args.watch, refresh=not args.no_refresh)
+    asyncio.run(daemon.run(once=args.once))
+
+
+if __name__ == "__main__":
+    main()
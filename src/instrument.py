@@ -0,0 +1,136 @@
+# ============================================================
+# instrument.py
+# Lightweight stage instrumentation
+#   - Wall time, CPU time, peak RSS and rows/sec per stage
+#   - Named sub-phase timers and counters for hot loops
+#   - One JSON line per stage run (logs/metrics.jsonl)
+#   - Optional cProfile dump (AQI_PROFILE=1)
+#
+# Usage inside a pipeline script:
+#   stage_metrics = StageMetrics("02_imputation")
+#   with stage_metrics.phase("short_gap"):
+#       ...
+#   stage_metrics.count("short_gaps")
+#   stage_metrics.close(rows=len(df))
+# ============================================================
+
+import json
+import os
+import socket
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# ---------------- CONFIG ----------------
+METRICS_FILE = os.environ.get("AQI_METRICS_FILE", "logs/metrics.jsonl")
+PROFILE_DIR = os.environ.get("AQI_PROFILE_DIR", "logs/profile")
+PROFILE = os.environ.get("AQI_PROFILE", "0") == "1"
+# ---------------------------------------
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process in MB (None if unknown).
+    On Linux this is VmHWM, which starts over at exec; ru_maxrss
+    would carry the high-water mark of the parent (run_pipeline,
+    benchmark.py) into every stage it launches.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KB on Linux, bytes on macOS
+    if sys.platform == "darwin":
+        rss /= 1024
+    return round(rss / 1024, 1)
+
+
+class StageMetrics:
+    """
+    Collects timings and counters for one stage run and appends
+    them to METRICS_FILE as a single JSON line on close().
+    """
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.phases = {}
+        self.counters = {}
+        self.extra = {}
+        self._closed = False
+
+        self._profiler = None
+        if PROFILE:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+        self._wall0 = time.perf_counter()
+        self._cpu0 = time.process_time()
+
+    @contextmanager
+    def phase(self, name):
+        """Accumulate wall time spent inside the block under `name`."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + (time.perf_counter() - t0)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + int(n)
+
+    def record(self, **fields):
+        """Attach extra key/value pairs to the stage record."""
+        self.extra.update(fields)
+
+    def close(self, rows=None):
+        """Stop timers, dump the profile if enabled and write the record."""
+        if self._closed:
+            return
+        self._closed = True
+
+        wall = time.perf_counter() - self._wall0
+        cpu = time.process_time() - self._cpu0
+
+        if self._profiler is not None:
+            self._profiler.disable()
+            Path(PROFILE_DIR).mkdir(parents=True, exist_ok=True)
+            prof_path = Path(PROFILE_DIR) / f"{self.stage}.prof"
+            self._profiler.dump_stats(str(prof_path))
+            self.extra["profile"] = str(prof_path)
+
+        record = {
+            "stage": self.stage,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "host": socket.gethostname(),
+            "wall_s": round(wall, 3),
+            "cpu_s": round(cpu, 3),
+            "peak_rss_mb": peak_rss_mb(),
+            "rows": rows,
+            "rows_per_s": round(rows / wall, 1) if rows and wall > 0 else None,
+            "phases_s": {k: round(v, 3) for k, v in self.phases.items()},
+            "counters": self.counters,
+        }
+        record.update(self.extra)
+
+        Path(METRICS_FILE).parent.mkdir(parents=True, exist_ok=True)
+        with open(METRICS_FILE, "a") as f:
+            f.write(json.dumps(record, default=str) + "\n")
+
+        print(
+            f"\n[metrics] {self.stage}: wall {wall:.1f}s, cpu {cpu:.1f}s, "
+            f"peak RSS {record['peak_rss_mb']} MB"
+        )
@@ -0,0 +1,119 @@
+# ============================================================
+# joint_model.py
+# One LightGBM booster for all pollutants (04g_train_lightgbm_joint)
+#   - Rows are stacked once per pollutant with a categorical
+#     POLLUTANT_COL code, so the shared features are binned into
+#     a single Dataset instead of six
+#   - Targets are standardised per pollutant (train mean / std)
+#     so CO and PM10 weigh alike in the shared loss; the scales
+#     are stored in the registry manifest and undone on predict
+#   - The target's own lag / rolling / neighbour columns are
+#     repeated as OWN_PREFIX features on the same scale, so trees
+#     can share splits across pollutants instead of first
+#     splitting on the code and then on "pm10_lag1"
+#   - predict_all() scores every pollutant for a frame of
+#     station-hours with a single booster call; the registry
+#     serves the family through it
+# ============================================================
+
+import numpy as np
+import pandas as pd
+
+# ---------------- CONFIG ----------------
+FAMILY = "lightgbm_joint"
+MODEL_KEY = "all"                   # registry "pollutant" slot of the joint model
+POLLUTANT_COL = "pollutant_code"
+OWN_PREFIX = "own_"
+# ---------------------------------------
+
+
+def _shift(suffix, mean):
+    return 0.0 if ("delta" in suffix or suffix.endswith("std")) else mean
+
+
+def own_features(X, pollutant, scales):
+    """
+    The pollutant's "<pollutant>_<suffix>" columns as "own_<suffix>",
+    standardised with the target scale (spreads and deltas are only
+    divided by the std).
+    """
+    mean, std = scales[pollutant]
+    prefix = f"{pollutant}_"
+    own = {}
+    for c in X.columns:
+        if not c.startswith(prefix):
+            continue
+        suffix = c[len(prefix):]
+        own[OWN_PREFIX + suffix] = (X[c].values - _shift(suffix, mean)) / std
+    return pd.DataFrame(own, index=X.index)
+
+
+def _with_own(X, pollutant, code, scales):
+    out = pd.concat([X, own_features(X, pollutant, scales)], axis=1)
+    out[POLLUTANT_COL] = np.int32(code)
+    return out
+
+
+def stack(X, targets, pollutants, scales):
+    """
+    Stack rows per pollutant. X: feature frame, targets: frame with the
+    pollutant columns (same index). Rows with a missing target are
+    dropped for that pollutant. Returns (X_stacked, y_scaled).
+    """
+    parts, ys = [], []
+    for code, p in enumerate(pollutants):
+        mask = targets[p].notna().values
+        parts.append(_with_own(X[mask], p, code, scales))
+        mean, std = scales[p]
+        ys.append((targets[p].values[mask] - mean) / std)
+
+    return pd.concat(parts, ignore_index=True), np.concatenate(ys)
+
+
+def target_scales(targets, pollutants):
+    """pollutant → (mean, std) of the training target."""
+    scales = {}
+    for p in pollutants:
+        y = targets[p].dropna()
+        std = float(y.std())
+        scales[p] = (float(y.mean()), std if std > 0 else 1.0)
+    return scales
+
+
+def input_columns(features, pollutants):
+    """Columns of the unstacked frame that predict_all() reads."""
+    shared = [f for f in features if not f.startswith(OWN_PREFIX) and f != POLLUTANT_COL]
+    suffixes = [f[len(OWN_PREFIX):] for f in features if f.startswith(OWN_PREFIX)]
+    return shared + [f"{p}_{s}" for p in pollutants for s in suffixes]
+
+
+def predict_all(booster, X, features, pollutants, scales):
+    """
+    All pollutants for every row of X in one booster call.
+    Returns a frame with one column per pollutant, indexed like X.
+
+    The stacked matrix is filled as a plain array (no per-pollutant
+    frames), which keeps small serving batches cheap.
+    """
+    n = len(X)
+    own = [j for j, f in enumerate(features) if f.startswith(OWN_PREFIX)]
+    code_col = features.index(POLLUTANT_COL)
+    shared = [j for j in range(len(features)) if j not in own and j != code_col]
+
+    base = X[[features[j] for j in shared]].to_numpy(dtype=np.float64)
+    stacked = np.empty((len(pollutants) * n, len(features)))
+
+    for code, p in enumerate(pollutants):
+        block = stacked[code * n:(code + 1) * n]
+        block[:, shared] = base
+        block[:, code_col] = code
+
+        mean, std = scales[p]
+        suffixes = [features[j][len(OWN_PREFIX):] for j in own]
+        src = X[[f"{p}_{s}" for s in suffixes]].to_numpy(dtype=np.float64)
+        block[:, own] = (src - np.array([_shift(s, mean) for s in suffixes])) / std
+
+    raw = booster.predict(stacked).reshape(len(pollutants), n)
+    mean = np.array([scales[p][0] for p in pollutants])[:, None]
+    std = np.array([scales[p][1] for p in pollutants])[:, None]
+    return pd.DataFrame((raw * std + mean).T, index=X.index, columns=pollutants)
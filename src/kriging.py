@@ -0,0 +1,262 @@
+# ============================================================
+# kriging.py
+# Ordinary kriging shared by 02_imputation.py and the heatmaps
+#   - Variogram models (spherical / exponential / gaussian) and
+#     a weighted least-squares fit to the empirical variogram
+#   - OrdinaryKriging: estimate + kriging variance
+#
+# The kriging system only depends on which stations report, not
+# on their values. LU factorizations are cached by the station
+# availability bitmask, and the solved weights by (mask, target
+# set), both as LRUs of cache_size entries, so every hour sharing
+# a pattern costs one matrix product.
+# ============================================================
+
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from scipy.linalg import lu_factor, lu_solve
+from scipy.optimize import curve_fit
+from scipy.spatial.distance import cdist, pdist
+
+# ---------------- CONFIG ----------------
+VARIOGRAM_FILE = "data/interim/variogram_params.csv"
+VARIOGRAM_MODELS = ["spherical", "exponential", "gaussian"]
+
+N_LAG_BINS = 12
+MAX_LAG_FRACTION = 0.6      # of the largest station distance
+MIN_PAIRS_PER_BIN = 3
+
+MIN_KRIGING_POINTS = 3
+WEIGHT_CACHE_SIZE = 256     # LRU entries: (mask, targets) weights and mask factorizations
+# ---------------------------------------
+
+
+# ---------------- Variogram ----------------
+
+def _spherical(h, nugget, psill, rng):
+    r = np.minimum(h / rng, 1.0)
+    return nugget + psill * (1.5 * r - 0.5 * r ** 3)
+
+
+def _exponential(h, nugget, psill, rng):
+    return nugget + psill * (1.0 - np.exp(-3.0 * h / rng))
+
+
+def _gaussian(h, nugget, psill, rng):
+    return nugget + psill * (1.0 - np.exp(-3.0 * (h / rng) ** 2))
+
+
+_MODEL_FUNCS = {
+    "spherical": _spherical,
+    "exponential": _exponential,
+    "gaussian": _gaussian,
+}
+
+
+def variogram(h, model, nugget, psill, rng):
+    """Semivariance γ(h); γ(0) = 0 (the nugget is a jump at h > 0)."""
+    h = np.asarray(h, dtype=float)
+    return np.where(h > 0, _MODEL_FUNCS[model](h, nugget, psill, rng), 0.0)
+
+
+def empirical_variogram(values, coords, n_bins=N_LAG_BINS):
+    """
+    Binned semivariance pooled over hours (equal pair counts per bin).
+    values: (hours × stations) with NaN for missing; coords: (S × 2).
+    Each station pair contributes 0.5·mean((z_i - z_j)²) over the
+    hours both reported, weighted by that number of hours.
+    Returns DataFrame(lag, gamma, n_pairs, weight).
+    """
+    n_st = values.shape[1]
+    i, j = np.triu_indices(n_st, k=1)
+    dist = pdist(coords)
+
+    # Pair sums as S × S products over hours, never hours × pairs:
+    # n = OᵀO and Σ(z_i − z_j)² = (Z²)ᵀO + Oᵀ(Z²) − 2·ZᵀZ with Z zero
+    # where missing (centred first, which leaves differences unchanged)
+    observed = ~np.isnan(values)
+    O = observed.astype(np.float64)
+    Z = np.where(observed, values - np.nanmean(values), 0.0) if observed.any() else O
+    Z2 = Z * Z
+    cross = Z2.T @ O
+
+    n = (O.T @ O)[i, j].round().astype(np.int64)
+    sq = np.maximum(cross[i, j] + cross[j, i] - 2.0 * (Z.T @ Z)[i, j], 0.0)
+
+    ok = n > 0
+    gamma_pair = 0.5 * sq[ok] / n[ok]
+    dist, n = dist[ok], n[ok]
+
+    # Equal-count lag bins: station networks are irregular, so fixed-width
+    # bins leave most of them empty
+    in_range = dist <= dist.max() * MAX_LAG_FRACTION if len(dist) else np.array([], dtype=bool)
+    n_bins = max(1, min(n_bins, int(in_range.sum()) // MIN_PAIRS_PER_BIN))
+    edges = np.quantile(dist[in_range], np.linspace(0, 1, n_bins + 1)) if in_range.any() else np.zeros(2)
+    bin_id = np.clip(np.searchsorted(edges, dist, side="right") - 1, 0, n_bins - 1)
+    keep = in_range
+
+    table = pd.DataFrame({
+        "bin": bin_id[keep],
+        "dist": dist[keep],
+        "gamma": gamma_pair[keep],
+        "n": n[keep],
+    })
+    table["dist_w"] = table["dist"] * table["n"]
+    table["gamma_w"] = table["gamma"] * table["n"]
+
+    out = table.groupby("bin").agg(
+        dist_w=("dist_w", "sum"), gamma_w=("gamma_w", "sum"),
+        weight=("n", "sum"), n_pairs=("n", "size"),
+    )
+    out["lag"] = out["dist_w"] / out["weight"]
+    out["gamma"] = out["gamma_w"] / out["weight"]
+    out = out[out["n_pairs"] >= MIN_PAIRS_PER_BIN]
+    return out[["lag", "gamma", "n_pairs", "weight"]].reset_index(drop=True)
+
+
+def fit_variogram(emp, models=VARIOGRAM_MODELS):
+    """
+    Weighted least-squares fit of each model to an empirical
+    variogram; returns the best one as a dict
+    (model, nugget, psill, range, sse).
+    """
+    lag, gamma = emp["lag"].values, emp["gamma"].values
+    sigma = 1.0 / np.sqrt(emp["weight"].values)
+
+    g_max = max(float(gamma.max()), 1e-9)
+    lag_max = max(float(lag.max()), 1e-9)
+    p0 = [0.1 * g_max, 0.9 * g_max, 0.5 * lag_max]
+    bounds = ([0.0, 0.0, 1e-6], [g_max * 2, g_max * 4, lag_max * 10])
+
+    best = None
+    for model in (models if len(emp) >= 3 else []):
+        try:
+            params, _ = curve_fit(
+                _MODEL_FUNCS[model], lag, gamma, p0=p0, sigma=sigma,
+                bounds=bounds, maxfev=10_000
+            )
+        except (RuntimeError, ValueError):
+            continue
+        resid = (_MODEL_FUNCS[model](lag, *params) - gamma) / sigma
+        sse = float(np.sum(resid ** 2))
+        if best is None or sse < best["sse"]:
+            best = {"model": model, "nugget": params[0], "psill": params[1],
+                    "range": params[2], "sse": sse}
+
+    if best is None:
+        # Too few bins to fit: pure nugget at the pooled variance
+        best = {"model": "spherical", "nugget": g_max, "psill": 0.0,
+                "range": lag_max, "sse": np.nan}
+    return best
+
+
+def load_variograms(path=VARIOGRAM_FILE):
+    """Fitted variogram parameters per pollutant, as written by 01_variogram_fit.py."""
+    table = pd.read_csv(path).set_index("pollutant")
+    return {
+        pollutant: {
+            "model": row["model"],
+            "nugget": float(row["nugget"]),
+            "psill": float(row["psill"]),
+            "range": float(row["range"]),
+        }
+        for pollutant, row in table.iterrows()
+    }
+
+
+# ---------------- Kriging ----------------
+
+class OrdinaryKriging:
+    """
+    Ordinary kriging over a fixed station set.
+
+    coords    : (S × 2) station coordinates (same units as the variogram)
+    params    : dict with model, nugget, psill, range
+    min_points: hours with fewer reporting stations → NaN
+    """
+
+    def __init__(self, coords, params, min_points=MIN_KRIGING_POINTS,
+                 cache_size=WEIGHT_CACHE_SIZE):
+        self.coords = np.asarray(coords, dtype=float)
+        self.params = params
+        self.min_points = min_points
+        self.cache_size = max(1, cache_size)
+
+        self._gamma = self._vario(cdist(self.coords, self.coords))
+        self._factors = OrderedDict()
+        self._weights = OrderedDict()
+        self.stats = {"factorizations": 0, "weight_solves": 0, "cache_hits": 0}
+
+    def _vario(self, h):
+        p = self.params
+        return variogram(h, p["model"], p["nugget"], p["psill"], p["range"])
+
+    def _factor(self, mask):
+        key = mask.tobytes()
+        if key in self._factors:
+            self._factors.move_to_end(key)
+        else:
+            idx = np.flatnonzero(mask)
+            n = len(idx)
+            a = np.ones((n + 1, n + 1))
+            a[:n, :n] = self._gamma[np.ix_(idx, idx)]
+            a[n, n] = 0.0
+            self._factors[key] = lu_factor(a)
+            self.stats["factorizations"] += 1
+            if len(self._factors) > self.cache_size:
+                self._factors.popitem(last=False)
+        return self._factors[key]
+
+    def weights(self, mask, targets, targets_key):
+        """
+        Kriging weights (n_avail × m) and variance (m,) for the
+        stations in `mask` and the target points.
+        """
+        key = (mask.tobytes(), targets_key)
+        if key in self._weights:
+            self._weights.move_to_end(key)
+            self.stats["cache_hits"] += 1
+            return self._weights[key]
+
+        idx = np.flatnonzero(mask)
+        n = len(idx)
+        rhs = np.ones((n + 1, len(targets)))
+        rhs[:n] = self._vario(cdist(self.coords[idx], targets))
+
+        sol = lu_solve(self._factor(mask), rhs)
+        lam, mu = sol[:n], sol[n]
+        var = np.maximum(np.sum(lam * rhs[:n], axis=0) + mu, 0.0)
+        self.stats["weight_solves"] += 1
+
+        self._weights[key] = (lam, var)
+        if len(self._weights) > self.cache_size:
+            self._weights.popitem(last=False)
+        return lam, var
+
+    def predict(self, values, targets, targets_key="grid"):
+        """
+        values : (hours × S) station values, NaN = not reporting
+        targets: (m × 2) target coordinates
+        targets_key: hashable id for the target set (for the cache)
+        Returns estimate and variance, both (hours × m).
+        """
+        values = np.atleast_2d(np.asarray(values, dtype=float))
+        targets = np.atleast_2d(np.asarray(targets, dtype=float))
+        est = np.full((len(values), len(targets)), np.nan)
+        var = np.full_like(est, np.nan)
+
+        masks = ~np.isnan(values)
+        patterns, inverse = np.unique(np.packbits(masks, axis=1), axis=0, return_inverse=True)
+        inverse = np.asarray(inverse).ravel()
+
+        for k in range(len(patterns)):
+            rows = np.flatnonzero(inverse == k)
+            mask = masks[rows[0]]
+            if mask.sum() < self.min_points:
+                continue
+            lam, v = self.weights(mask, targets, targets_key)
+            est[rows] = values[np.ix_(rows, np.flatnonzero(mask))] @ lam
+            var[rows] = v
+        return est, var
@@ -0,0 +1,283 @@
+# ============================================================
+# model_registry.py
+# Versioned model registry in native booster formats
+#   - XGBoost  → model.ubj  (Booster.save_model)
+#   - LightGBM → model.txt  (Booster.save_model)
+#     (also lightgbm_joint: one booster for all pollutants,
+#     registered under the pollutant key "all"; it is also
+#     reachable per pollutant and served via joint_model)
+#   - manifest.json per version: features, training window,
+#     metrics, params
+#   - CURRENT pointer per model; the last KEEP_VERSIONS versions
+#     (plus CURRENT) are kept for rollback, older ones pruned
+#   - Lazy per-pollutant loading with an in-process LRU cache
+#
+# Layout:
+#   models/registry/<family>/<pollutant>/v0001/{model.*, manifest.json}
+#   models/registry/<family>/<pollutant>/CURRENT
+#
+# CLI:
+#   python src/model_registry.py list
+#   python src/model_registry.py rollback lightgbm pm2.5 [--version v0002]
+# ============================================================
+
+import argparse
+import json
+import os
+import shutil
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+import joint_model
+
+# ---------------- CONFIG ----------------
+REGISTRY_DIR = Path("models/registry")
+CACHE_SIZE = int(os.environ.get("AQI_MODEL_CACHE_SIZE", "6"))
+KEEP_VERSIONS = int(os.environ.get("AQI_MODEL_KEEP_VERSIONS", "5"))   # 0 = keep all
+
+MODEL_FILES = {"xgboost": "model.ubj", "lightgbm": "model.txt", "lightgbm_joint": "model.txt"}
+# ---------------------------------------
+
+
+def pollutant_key(pollutant):
+    return pollutant.replace(".", "")
+
+
+def _to_jsonable(obj):
+    if isinstance(obj, (np.integer,)):
+        return int(obj)
+    if isinstance(obj, (np.floating,)):
+        return float(obj)
+    return str(obj)
+
+
+class ModelRegistry:
+    """
+    Boosters are only read from disk on first use and kept in an
+    LRU cache of at most `cache_size` models.
+    """
+
+    def __init__(self, root=REGISTRY_DIR, cache_size=CACHE_SIZE, keep_versions=KEEP_VERSIONS):
+        self.root = Path(root)
+        self.cache_size = max(1, cache_size)
+        self.keep_versions = keep_versions
+        self._cache = OrderedDict()
+
+    # ---------------- Paths ----------------
+    def _slot(self, family, pollutant):
+        """Directory key: the joint model serves every pollutant from one slot."""
+        if family == joint_model.FAMILY:
+            return joint_model.MODEL_KEY
+        return pollutant_key(pollutant)
+
+    def _model_dir(self, family, pollutant):
+        return self.root / family / self._slot(family, pollutant)
+
+    def versions(self, family, pollutant):
+        d = self._model_dir(family, pollutant)
+        if not d.exists():
+            return []
+        return sorted(p.name for p in d.iterdir() if p.is_dir() and p.name.startswith("v"))
+
+    def current_version(self, family, pollutant):
+        pointer = self._model_dir(family, pollutant) / "CURRENT"
+        if not pointer.exists():
+            return None
+        return pointer.read_text().strip()
+
+    def _resolve(self, family, pollutant, version):
+        version = version or self.current_version(family, pollutant)
+        if version is None:
+            raise FileNotFoundError(f"No registered {family} model for {pollutant}")
+        return version
+
+    def has_model(self, family, pollutant):
+        if self.current_version(family, pollutant) is None:
+            return False
+        if family == joint_model.FAMILY and pollutant != joint_model.MODEL_KEY:
+            return pollutant in self.manifest(family, pollutant).get("pollutants", [])
+        return True
+
+    def pollutants(self, family):
+        d = self.root / family
+        if not d.exists():
+            return []
+        return sorted(p.name for p in d.iterdir() if (p / "CURRENT").exists())
+
+    # ---------------- Write ----------------
+    def save(self, family, pollutant, model, features, train_window,
+             metrics, params, promote=True, **extra):
+        """
+        Store a new version in the family's native format and
+        (by default) make it current, then prune old versions.
+        Returns the version name.
+        """
+        if family not in MODEL_FILES:
+            raise ValueError(f"Unknown model family: {family}")
+
+        existing = self.versions(family, pollutant)
+        version = f"v{int(existing[-1][1:]) + 1:04d}" if existing else "v0001"
+
+        vdir = self._model_dir(family, pollutant) / version
+        vdir.mkdir(parents=True, exist_ok=False)
+
+        model_file = MODEL_FILES[family]
+        booster = model.get_booster() if hasattr(model, "get_booster") else model
+        booster.save_model(str(vdir / model_file))
+
+        manifest = {
+            "family": family,
+            "pollutant": pollutant,
+            "version": version,
+            "model_file": model_file,
+            "features": list(features),
+            "train_window": {k: str(v) for k, v in train_window.items()},
+            "metrics": metrics,
+            "params": params,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        manifest.update(extra)
+        (vdir / "manifest.json").write_text(
+            json.dumps(manifest, indent=2, default=_to_jsonable)
+        )
+
+        if promote:
+            self.promote(family, pollutant, version)
+        self.prune(family, pollutant)
+        return version
+
+    def prune(self, family, pollutant):
+        """Delete all but the last `keep_versions` versions; CURRENT is always kept."""
+        if self.keep_versions <= 0:
+            return []
+        current = self.current_version(family, pollutant)
+        old = [v for v in self.versions(family, pollutant)[:-self.keep_versions] if v != current]
+        for v in old:
+            shutil.rmtree(self._model_dir(family, pollutant) / v)
+            self._cache.pop((family, self._slot(family, pollutant), v), None)
+        return old
+
+    def promote(self, family, pollutant, version):
+        if version not in self.versions(family, pollutant):
+            raise FileNotFoundError(f"{family}/{pollutant} has no version {version}")
+        pointer = self._model_dir(family, pollutant) / "CURRENT"
+        tmp = pointer.with_suffix(".tmp")
+        tmp.write_text(version)
+        os.replace(tmp, pointer)
+
+    def rollback(self, family, pollutant, version=None):
+        """Point CURRENT at `version`, or at the one before the current one."""
+        if version is None:
+            versions = self.versions(family, pollutant)
+            current = self.current_version(family, pollutant)
+            idx = versions.index(current) if current in versions else len(versions)
+            if idx == 0:
+                raise ValueError(f"No earlier version of {family}/{pollutant} to roll back to")
+            version = versions[idx - 1]
+        self.promote(family, pollutant, version)
+        return version
+
+    # ---------------- Read ----------------
+    def manifest(self, family, pollutant, version=None):
+        version = self._resolve(family, pollutant, version)
+        path = self._model_dir(family, pollutant) / version / "manifest.json"
+        return json.loads(path.read_text())
+
+    def load(self, family, pollutant, version=None):
+        """Native booster for a model version, loaded on first use."""
+        version = self._resolve(family, pollutant, version)
+        key = (family, self._slot(family, pollutant), version)
+
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        path = self._model_dir(family, pollutant) / version / MODEL_FILES[family]
+        if family == "xgboost":
+            import xgboost as xgb
+            booster = xgb.Booster()
+            booster.load_model(str(path))
+        else:
+            import lightgbm as lgb
+            booster = lgb.Booster(model_file=str(path))
+
+        self._cache[key] = booster
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return booster
+
+    def input_columns(self, family, pollutant, version=None):
+        """Columns of X that predict() reads."""
+        manifest = self.manifest(family, pollutant, version)
+        if family == joint_model.FAMILY:
+            return joint_model.input_columns(manifest["features"], manifest["pollutants"])
+        return manifest["features"]
+
+    def predict(self, family, pollutant, X, version=None):
+        """
+        Predict from a DataFrame; columns are taken from the manifest.
+        The joint model returns one column per pollutant for the key
+        "all", else the named pollutant's predictions.
+        """
+        manifest = self.manifest(family, pollutant, version)
+        features = manifest["features"]
+        booster = self.load(family, pollutant, version)
+
+        if family == joint_model.FAMILY:
+            scales = {p: tuple(v) for p, v in manifest["target_scales"].items()}
+            preds = joint_model.predict_all(booster, X, features, manifest["pollutants"], scales)
+            return preds if pollutant == joint_model.MODEL_KEY else preds[pollutant].values
+
+        X = X[features]
+
+        if family == "xgboost":
+            import xgboost as xgb
+            return booster.predict(xgb.DMatrix(X))
+        return booster.predict(X)
+
+
+# ---------------- CLI ----------------
+
+def _rmse_text(metrics):
+    """RMSE for the listing; joint models keep metrics per pollutant."""
+    if "rmse" in metrics or not metrics:
+        return str(metrics.get("rmse"))
+    return ",".join(f"{p}:{m.get('rmse'):.3f}" for p, m in metrics.items()
+                    if isinstance(m, dict) and m.get("rmse") is not None) or "None"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or roll back registered models.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("list", help="list models and versions")
+
+    rb = sub.add_parser("rollback", help="point CURRENT at an earlier version")
+    rb.add_argument("family", choices=sorted(MODEL_FILES))
+    rb.add_argument("pollutant")
+    rb.add_argument("--version", help="target version (default: the previous one)")
+
+    args = parser.parse_args()
+    registry = ModelRegistry()
+
+    if args.command == "list":
+        for family in sorted(MODEL_FILES):
+            for pkey in registry.pollutants(family):
+                current = registry.current_version(family, pkey)
+                for v in registry.versions(family, pkey):
+                    m = registry.manifest(family, pkey, v)
+                    marker = "*" if v == current else " "
+                    rmse = _rmse_text(m.get("metrics", {}))
+                    print(f"{marker} {family:<14} {m['pollutant']:<6} {v}  "
+                          f"rmse={rmse}  train_end={m['train_window'].get('end')}  "
+                          f"created={m['created']}")
+    else:
+        version = registry.rollback(args.family, args.pollutant, args.version)
+        print(f"{args.family}/{args.pollutant} → {version}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,442 @@
+# ============================================================
+# rollup_cube.py
+# Daily / monthly rollups per station × pollutant
+#   - Daily buckets: count, sum, sum of squares, min, max and
+#     hours above the exceedance threshold
+#   - Monthly buckets: the same plus a log-binned quantile
+#     sketch (relative error SKETCH_ALPHA, mergeable by adding)
+#   - Dense numpy arrays (station × pollutant × day/month) saved
+#     as .npy and memory-mapped on load
+#
+# Updates are append-only: rows at or before a station ×
+# pollutant's watermark are ignored, and only the buckets the
+# new hours fall into are touched (np.add.at / minimum.at on
+# read-write memory maps, so unchanged pages are never
+# rewritten). A digest of the rows at or before each watermark
+# is kept as well; verify() clears the station × pollutants whose
+# history no longer matches it (re-imputation), so the next
+# update() folds them again from scratch.
+#
+# A DIRTY marker is written before the first in-place change and
+# removed once the watermarks are saved; a cube loaded with the
+# marker present was interrupted mid-update and starts over.
+#
+# CLI:
+#   python src/rollup_cube.py range pm2.5 2023-01-01 2023-03-31
+#   python src/rollup_cube.py yoy pm2.5 2022 2023
+# ============================================================
+
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# ---------------- CONFIG ----------------
+ROLLUP_DIR = Path("data/rollup")
+DIRTY_FILE = "DIRTY"
+
+POLLUTANTS = ["pm2.5", "pm10", "nox", "so2", "co", "o3"]
+
+# NAAQS 24-h standards (8-h for CO / O3), applied to hourly values
+# for exceedance hours and to daily means for exceedance days
+EXCEEDANCE = {"pm2.5": 60.0, "pm10": 100.0, "nox": 80.0, "so2": 80.0, "co": 2.0, "o3": 100.0}
+
+SKETCH_ALPHA = 0.05         # relative accuracy of sketch quantiles
+SKETCH_MIN = 1e-3           # values at or below land in bin 0
+SKETCH_MAX = 1e5
+# ---------------------------------------
+
+SKETCH_GAMMA = (1 + SKETCH_ALPHA) / (1 - SKETCH_ALPHA)
+SKETCH_BINS = int(np.ceil(np.log(SKETCH_MAX / SKETCH_MIN) / np.log(SKETCH_GAMMA))) + 1
+
+STAT_FIELDS = ["count", "sum", "sumsq", "min", "max", "exceed_hours"]
+_INIT = {"count": 0, "sum": 0.0, "sumsq": 0.0, "min": np.inf, "max": -np.inf, "exceed_hours": 0}
+_DTYPE = {"count": np.int32, "sum": np.float64, "sumsq": np.float64,
+          "min": np.float32, "max": np.float32, "exceed_hours": np.int32}
+
+
+# ---------------- Sketch ----------------
+
+def sketch_bins(values):
+    """Log-spaced bin of each value (bin i covers (MIN·γ^(i-1), MIN·γ^i])."""
+    v = np.maximum(values, SKETCH_MIN)
+    b = np.ceil(np.log(v / SKETCH_MIN) / np.log(SKETCH_GAMMA)).astype(np.int64)
+    return np.clip(b, 0, SKETCH_BINS - 1)
+
+
+def sketch_quantiles(hist, qs):
+    """Quantiles from sketch histograms (..., SKETCH_BINS) → (..., len(qs))."""
+    cum = np.cumsum(np.asarray(hist, dtype=np.int64), axis=-1)
+    total = cum[..., -1:]
+    out = []
+    for q in qs:
+        rank = np.floor(q * np.maximum(total - 1, 0))
+        idx = np.minimum((cum <= rank).sum(axis=-1), SKETCH_BINS - 1)
+        est = np.where(idx == 0, SKETCH_MIN, 2 * SKETCH_MIN * SKETCH_GAMMA ** idx / (SKETCH_GAMMA + 1))
+        out.append(np.where(total[..., 0] > 0, est, np.nan))
+    return np.stack(out, axis=-1)
+
+
+# ---------------- History digest ----------------
+
+def row_digest(hours, values):
+    """
+    64-bit hash per (hour, value) row (splitmix64 finaliser). Summed
+    per station × pollutant with wrap-around, so it does not depend
+    on row order.
+    """
+    x = hours.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15) ^ values.astype(np.float64).view(np.uint64)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+# ---------------- Cube ----------------
+
+def _new_stats(shape):
+    return {f: np.full(shape, _INIT[f], dtype=_DTYPE[f]) for f in STAT_FIELDS}
+
+
+class RollupCube:
+    """
+    station × pollutant × day (and × month) aggregates.
+    Days and months are integer offsets from day0 / month0.
+    """
+
+    def __init__(self, root=ROLLUP_DIR):
+        self.root = Path(root)
+        self.station_ids = np.array([], dtype=np.int64)
+        self.pollutants = list(POLLUTANTS)
+        self.day0 = None
+        self.month0 = None
+        self.daily = _new_stats((0, len(self.pollutants), 0))
+        self.monthly = _new_stats((0, len(self.pollutants), 0))
+        self.sketch = np.zeros((0, len(self.pollutants), 0, SKETCH_BINS), dtype=np.int32)
+        self.watermark = np.zeros((0, len(self.pollutants)), dtype=np.int64)   # hours since epoch; -1 = none
+        self.history = np.zeros((0, len(self.pollutants)), dtype=np.uint64)    # digest of rows ≤ watermark
+        self.stats = {"rows": 0, "daily_buckets": 0, "monthly_buckets": 0, "refolded": 0}
+        self._relayout = True
+
+    # ---------------- Storage ----------------
+    @classmethod
+    def load(cls, root=ROLLUP_DIR, mode="r"):
+        """mode "r" for queries, "r+" to update in place."""
+        cube = cls(root)
+        meta_path = cube.root / "meta.json"
+        if not meta_path.exists():
+            return cube
+
+        if (cube.root / DIRTY_FILE).exists():
+            print(f"Rollup cube under {cube.root} was interrupted mid-update; rebuilding it")
+            return cube
+
+        meta = json.loads(meta_path.read_text())
+        cube._relayout = False
+        cube.station_ids = np.array(meta["station_ids"], dtype=np.int64)
+        cube.pollutants = meta["pollutants"]
+        cube.day0 = np.datetime64(meta["day0"], "D")
+        cube.month0 = np.datetime64(meta["month0"], "M")
+        cube.daily = {f: np.load(cube.root / f"daily_{f}.npy", mmap_mode=mode) for f in STAT_FIELDS}
+        cube.monthly = {f: np.load(cube.root / f"monthly_{f}.npy", mmap_mode=mode) for f in STAT_FIELDS}
+        cube.sketch = np.load(cube.root / "monthly_sketch.npy", mmap_mode=mode)
+        cube.watermark = np.load(cube.root / "watermark.npy")
+        history = cube.root / "history.npy"
+        # Cubes written before digests existed are verified once (and refolded)
+        cube.history = np.load(history) if history.exists() else np.zeros(cube.watermark.shape, dtype=np.uint64)
+        return cube
+
+    def _mark_dirty(self):
+        """Flag the files as inconsistent until the next save() completes."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        (self.root / DIRTY_FILE).touch()
+
+    def save(self):
+        """Flush in-place updates, or rewrite everything after a re-layout."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        if not self._relayout:
+            for arr in list(self.daily.values()) + list(self.monthly.values()) + [self.sketch]:
+                if isinstance(arr, np.memmap):
+                    arr.flush()
+            self._save_state()
+            return
+
+        self._mark_dirty()
+        for f in STAT_FIELDS:
+            np.save(self.root / f"daily_{f}.npy", self.daily[f])
+            np.save(self.root / f"monthly_{f}.npy", self.monthly[f])
+        np.save(self.root / "monthly_sketch.npy", self.sketch)
+        (self.root / "meta.json").write_text(json.dumps({
+            "station_ids": self.station_ids.tolist(),
+            "pollutants": self.pollutants,
+            "day0": str(self.day0),
+            "month0": str(self.month0),
+            "sketch_alpha": SKETCH_ALPHA,
+        }, indent=2))
+        self._save_state()
+        self._relayout = False
+
+    def _save_state(self):
+        np.save(self.root / "watermark.npy", self.watermark)
+        np.save(self.root / "history.npy", self.history)
+        (self.root / DIRTY_FILE).unlink(missing_ok=True)
+
+    # ---------------- Update ----------------
+    def _grow(self, station_ids, first_day, last_day):
+        """Re-allocate to cover new stations / days; a no-op otherwise."""
+        new_st = np.setdiff1d(station_ids, self.station_ids)
+        old_days = self.daily["count"].shape[2]
+        old_months = self.monthly["count"].shape[2]
+
+        # Allocate through the end of the year so hourly appends re-layout
+        # the files at most once a year
+        year_end = (last_day.astype("datetime64[Y]") + 1).astype("datetime64[D]") - 1
+        if self.day0 is None:
+            day0, day_end = first_day, year_end
+        else:
+            day0 = min(self.day0, first_day)
+            day_end = max(self.day0 + np.timedelta64(old_days - 1, "D"), year_end)
+
+        if not len(new_st) and day0 == self.day0 and last_day < self.day0 + np.timedelta64(old_days, "D"):
+            return
+
+        month0 = day0.astype("datetime64[M]")
+        n_days = int((day_end - day0) / np.timedelta64(1, "D")) + 1
+        n_months = int((day_end.astype("datetime64[M]") - month0) / np.timedelta64(1, "M")) + 1
+        lead_d = 0 if self.day0 is None else int((self.day0 - day0) / np.timedelta64(1, "D"))
+        lead_m = 0 if self.month0 is None else int((self.month0 - month0) / np.timedelta64(1, "M"))
+
+        n_old = len(self.station_ids)
+        shape = (n_old + len(new_st), len(self.pollutants))
+
+        daily, monthly = _new_stats(shape + (n_days,)), _new_stats(shape + (n_months,))
+        for f in STAT_FIELDS:
+            daily[f][:n_old, :, lead_d:lead_d + old_days] = self.daily[f]
+            monthly[f][:n_old, :, lead_m:lead_m + old_months] = self.monthly[f]
+        sketch = np.zeros(shape + (n_months, SKETCH_BINS), dtype=np.int32)
+        sketch[:n_old, :, lead_m:lead_m + old_months] = self.sketch
+        watermark = np.full(shape, -1, dtype=np.int64)
+        watermark[:n_old] = self.watermark
+        history = np.zeros(shape, dtype=np.uint64)
+        history[:n_old] = self.history
+
+        self.daily, self.monthly, self.sketch, self.watermark = daily, monthly, sketch, watermark
+        self.history = history
+        self.station_ids = np.concatenate([self.station_ids, new_st])
+        self.day0, self.month0 = day0, month0
+        self._relayout = True
+
+    def _clear(self, s, p):
+        """Reset every bucket of the given station × pollutant cells."""
+        for stats in (self.daily, self.monthly):
+            for f in STAT_FIELDS:
+                stats[f][s, p] = _INIT[f]
+        self.sketch[s, p] = 0
+        self.watermark[s, p] = -1
+        self.history[s, p] = 0
+
+    def _rows(self, df, value_col):
+        df = df[df["pollutant"].isin(self.pollutants) & df[value_col].notna()]
+        return df.drop_duplicates(subset=["station_id", "pollutant", "datetime"], keep="last")
+
+    def verify(self, df, value_col="value"):
+        """
+        Compare the full input's rows at or before each watermark with
+        the digest of what was folded; station × pollutants that differ
+        (or are missing from `df`) are cleared, so the next update()
+        folds all of their rows again. Returns the number cleared.
+        """
+        df = self._rows(df, value_col)
+        current = np.zeros(self.history.shape, dtype=np.uint64)
+        if len(df) and len(self.station_ids):
+            known = np.isin(df["station_id"].values, self.station_ids)
+            df = df[known]
+            order = np.argsort(self.station_ids)
+            s = order[np.searchsorted(self.station_ids, df["station_id"].values, sorter=order)]
+            p = pd.Index(self.pollutants).get_indexer(df["pollutant"].values)
+            hours = df["datetime"].values.astype("datetime64[h]").astype(np.int64)
+            seen = hours <= self.watermark[s, p]
+            np.add.at(current, (s[seen], p[seen]),
+                      row_digest(hours[seen], df[value_col].values[seen].astype(np.float64)))
+
+        stale = (self.watermark >= 0) & (current != self.history)
+        if stale.any():
+            if not self._relayout:
+                self._mark_dirty()
+            self._clear(*np.nonzero(stale))
+            self.stats["refolded"] += int(stale.sum())
+        return int(stale.sum())
+
+    def update(self, df, value_col="value"):
+        """
+        Fold new hourly rows (station_id, datetime, pollutant, value)
+        into the cube. Rows at or before the watermark are skipped.
+        Returns the number of rows applied.
+        """
+        df = self._rows(df, value_col)
+        if df.empty:
+            return 0
+
+        times = df["datetime"].values.astype("datetime64[h]")
+        self._grow(np.unique(df["station_id"].values),
+                   times.min().astype("datetime64[D]"), times.max().astype("datetime64[D]"))
+
+        order = np.argsort(self.station_ids)
+        s = order[np.searchsorted(self.station_ids, df["station_id"].values, sorter=order)]
+        p = pd.Index(self.pollutants).get_indexer(df["pollutant"].values)
+        hours = times.astype(np.int64)
+        v = df[value_col].values.astype(np.float64)
+
+        new = hours > self.watermark[s, p]
+        s, p, hours, times, v = s[new], p[new], hours[new], times[new], v[new]
+        if not len(v):
+            return 0
+        if not self._relayout:
+            self._mark_dirty()
+        np.add.at(self.history, (s, p), row_digest(hours, v))
+
+        d = ((times.astype("datetime64[D]") - self.day0) // np.timedelta64(1, "D")).astype(np.int64)
+        m = ((times.astype("datetime64[M]") - self.month0) // np.timedelta64(1, "M")).astype(np.int64)
+        thr = np.array([EXCEEDANCE.get(x, np.inf) for x in self.pollutants])[p]
+
+        for stats, bucket in ((self.daily, d), (self.monthly, m)):
+            flat = np.ravel_multi_index((s, p, bucket), stats["count"].shape)
+            np.add.at(stats["count"].reshape(-1), flat, 1)
+            np.add.at(stats["sum"].reshape(-1), flat, v)
+            np.add.at(stats["sumsq"].reshape(-1), flat, v * v)
+            np.minimum.at(stats["min"].reshape(-1), flat, v.astype(np.float32))
+            np.maximum.at(stats["max"].reshape(-1), flat, v.astype(np.float32))
+            np.add.at(stats["exceed_hours"].reshape(-1), flat, (v > thr).astype(np.int32))
+
+        flat = np.ravel_multi_index((s, p, m, sketch_bins(v)), self.sketch.shape)
+        np.add.at(self.sketch.reshape(-1), flat, 1)
+
+        np.maximum.at(self.watermark, (s, p), hours)
+
+        self.stats["rows"] += len(v)
+        self.stats["daily_buckets"] += len(np.unique(np.ravel_multi_index((s, p, d), self.daily["count"].shape)))
+        self.stats["monthly_buckets"] += len(np.unique(np.ravel_multi_index((s, p, m), self.monthly["count"].shape)))
+        return len(v)
+
+    # ---------------- Queries ----------------
+    def _station_index(self, stations):
+        if stations is None:
+            return np.arange(len(self.station_ids))
+        return np.flatnonzero(np.isin(self.station_ids, stations))
+
+    def _day_range(self, start, end):
+        lo = int((np.datetime64(start, "D") - self.day0) / np.timedelta64(1, "D"))
+        hi = int((np.datetime64(end, "D") - self.day0) / np.timedelta64(1, "D")) + 1
+        n = self.daily["count"].shape[2]
+        return slice(min(max(lo, 0), n), min(max(hi, 0), n))
+
+    def _month_range(self, start, end):
+        lo = int((np.datetime64(start, "M") - self.month0) / np.timedelta64(1, "M"))
+        hi = int((np.datetime64(end, "M") - self.month0) / np.timedelta64(1, "M")) + 1
+        n = self.monthly["count"].shape[2]
+        return slice(min(max(lo, 0), n), min(max(hi, 0), n))
+
+    def daily_table(self, pollutant, start, end, stations=None):
+        """Daily mean / std / min / max / count / exceedance hours."""
+        si = self._station_index(stations)
+        pi = self.pollutants.index(pollutant)
+        dr = self._day_range(start, end)
+        days = self.day0 + np.arange(dr.start, dr.stop)
+
+        cnt = np.asarray(self.daily["count"][si, pi, dr], dtype=np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = self.daily["sum"][si, pi, dr] / cnt
+            std = np.sqrt(np.maximum(self.daily["sumsq"][si, pi, dr] / cnt - mean ** 2, 0.0))
+
+        out = pd.DataFrame({
+            "station_id": np.repeat(self.station_ids[si], len(days)),
+            "date": np.tile(days, len(si)),
+            "count": cnt.ravel().astype(np.int64),
+            "mean": mean.ravel(),
+            "std": std.ravel(),
+            "min": np.asarray(self.daily["min"][si, pi, dr], dtype=np.float64).ravel(),
+            "max": np.asarray(self.daily["max"][si, pi, dr], dtype=np.float64).ravel(),
+            "exceed_hours": np.asarray(self.daily["exceed_hours"][si, pi, dr]).ravel(),
+        })
+        return out[out["count"] > 0].reset_index(drop=True)
+
+    def range_summary(self, pollutant, start, end, stations=None, qs=(0.5, 0.9, 0.95, 0.99)):
+        """
+        Per-station summary over [start, end]: mean, std, min, max,
+        exceedance hours and days from the daily buckets; quantiles
+        from the monthly sketches of the months the range touches.
+        """
+        si = self._station_index(stations)
+        pi = self.pollutants.index(pollutant)
+        dr = self._day_range(start, end)
+        mr = self._month_range(start, end)
+        thr = EXCEEDANCE.get(pollutant, np.inf)
+
+        cnt = np.asarray(self.daily["count"][si, pi, dr], dtype=np.float64)
+        tot = np.asarray(self.daily["sum"][si, pi, dr])
+        sq = np.asarray(self.daily["sumsq"][si, pi, dr])
+
+        n = cnt.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = tot.sum(axis=1) / n
+            std = np.sqrt(np.maximum(sq.sum(axis=1) / n - mean ** 2, 0.0))
+            exceed_days = (tot / cnt > thr).sum(axis=1)
+
+        out = pd.DataFrame({
+            "station_id": self.station_ids[si],
+            "hours": n.astype(np.int64),
+            "mean": mean,
+            "std": std,
+            "min": np.asarray(self.daily["min"][si, pi, dr], dtype=np.float64).min(axis=1, initial=np.inf),
+            "max": np.asarray(self.daily["max"][si, pi, dr], dtype=np.float64).max(axis=1, initial=-np.inf),
+            "exceed_hours": np.asarray(self.daily["exceed_hours"][si, pi, dr]).sum(axis=1),
+            "exceed_days": exceed_days,
+        })
+        quant = sketch_quantiles(np.asarray(self.sketch[si, pi, mr]).sum(axis=1), qs)
+        for j, q in enumerate(qs):
+            out[f"p{int(round(q * 100))}"] = quant[:, j]
+        return out[out["hours"] > 0].reset_index(drop=True)
+
+    def year_over_year(self, pollutant, year_a, year_b, stations=None):
+        """Per-station comparison of two calendar years."""
+        a = self.range_summary(pollutant, f"{year_a}-01-01", f"{year_a}-12-31", stations)
+        b = self.range_summary(pollutant, f"{year_b}-01-01", f"{year_b}-12-31", stations)
+        cols = ["station_id", "mean", "p95", "exceed_days"]
+        out = a[cols].merge(b[cols], on="station_id", suffixes=(f"_{year_a}", f"_{year_b}"))
+        out["mean_change_pct"] = (out[f"mean_{year_b}"] / out[f"mean_{year_a}"] - 1) * 100
+        return out
+
+
+# ---------------- CLI ----------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the rollup cube.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rg = sub.add_parser("range", help="per-station summary over a date range")
+    rg.add_argument("pollutant")
+    rg.add_argument("start")
+    rg.add_argument("end")
+
+    yy = sub.add_parser("yoy", help="year-over-year comparison")
+    yy.add_argument("pollutant")
+    yy.add_argument("year_a", type=int)
+    yy.add_argument("year_b", type=int)
+
+    parser.add_argument("--root", default=str(ROLLUP_DIR))
+    args = parser.parse_args()
+
+    cube = RollupCube.load(args.root)
+    if cube.day0 is None:
+        raise SystemExit(f"No rollup cube under {args.root}")
+
+    if args.command == "range":
+        table = cube.range_summary(args.pollutant, args.start, args.end)
+    else:
+        table = cube.year_over_year(args.pollutant, args.year_a, args.year_b)
+    print(table.round(2).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,559 @@
+# ============================================================
+# run_pipeline.py
+# Content-hashed DAG runner for the numbered pipeline scripts
+#   - Each stage declares its inputs, outputs and parameters
+#   - A stage is skipped when the hashes of its code, inputs
+#     and parameters match the last successful run
+#   - Independent stages run in parallel
+#   - Prints a per-stage timing summary
+#
+# Usage (from anywhere):
+#   python src/run_pipeline.py                 # run what is stale
+#   python src/run_pipeline.py --jobs 4
+#   python src/run_pipeline.py --only 04a_train_xgboost --force
+#   python src/run_pipeline.py --dry-run
+# ============================================================
+
+import argparse
+import ast
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+
+# ---------------- CONFIG ----------------
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+STATE_DIR = ".pipeline"
+STATE_FILE = "state.json"
+LOG_DIR = "logs"
+
+HASH_CHUNK = 1 << 20
+# ---------------------------------------
+
+# Paths are relative to the project root, which is also the working
+# directory every script is launched from. "params" are environment
+# variables passed to the script; their effective values are part of
+# the stage hash.
+STAGES = [
+    {
+        "name": "00_load_and_validate",
+        "inputs": ["data/raw/dl_data.csv", "data/raw/dl_details.csv",
+                   "data/raw/locs_pred.csv"],
+        "outputs": ["data/interim/profile/coverage_raw.csv",
+                    "data/interim/profile/gaps_raw.csv"],
+        "params": {},
+    },
+    {
+        "name": "00b_quality_control",
+        "inputs": ["data/raw/dl_data.csv"],
+        "outputs": ["data/interim/dl_data_qc.csv", "data/interim/qc_flags.csv",
+                    "data/interim/qc_summary.csv"],
+        "params": {},
+    },
+    {
+        "name": "01_gap_analysis",
+        "inputs": ["data/interim/dl_data_qc.csv"],
+        "outputs": ["data/interim/dl_data_trimmed.csv",
+                    "data/interim/gap_summary.csv"],
+        "params": {},
+    },
+    {
+        "name": "01_idw_p_cross_validation",
+        "inputs": ["data/interim/dl_data_qc.csv", "data/raw/dl_details.csv"],
+        "outputs": ["data/interim/idw_p_values.csv"],
+        "params": {"AQI_IDW_P_STEP": "0.01", "AQI_IDW_MAX_TIMESTAMPS": "200"},
+    },
+    {
+        "name": "01_variogram_fit",
+        "inputs": ["data/interim/dl_data_qc.csv", "data/raw/dl_details.csv"],
+        "outputs": ["data/interim/variogram_params.csv"],
+        "params": {},
+    },
+    {
+        "name": "01_build_climatology",
+        "inputs": ["data/interim/dl_data_trimmed.csv"],
+        "outputs": ["data/interim/climatology.npz"],
+        "params": {},
+    },
+    {
+        "name": "02_imputation",
+        "inputs": ["data/interim/dl_data_trimmed.csv",
+                   "data/raw/dl_details.csv",
+                   "data/interim/idw_p_values.csv",
+                   "data/interim/variogram_params.csv",
+                   "data/interim/climatology.npz"],
+        "outputs": ["data/interim/dl_data_imputed.csv",
+                    "data/interim/profile/coverage_imputed.csv",
+                    "data/interim/profile/gaps_imputed.csv"],
+        "params": {"AQI_INTERPOLATOR": "idw"},
+    },
+    {
+        "name": "02d_evaluate_imputation_holdout",
+        "inputs": ["data/interim/dl_data_trimmed.csv",
+                   "data/raw/dl_details.csv",
+                   "data/interim/idw_p_values.csv",
+                   "data/interim/gap_summary.csv"],
+        "outputs": ["outputs/imputation_holdout/holdout_errors.csv",
+                    "outputs/imputation_holdout/threshold_sweep.csv"],
+        "params": {"AQI_HOLDOUT_GAPS": "2000"},
+    },
+    {
+        "name": "02b_validate_imputation",
+        "inputs": ["data/interim/profile/coverage_imputed.csv",
+                   "data/interim/profile/gaps_imputed.csv"],
+        "outputs": [],
+        "params": {},
+    },
+    {
+        "name": "02c_trim_low_coverage",
+        "inputs": ["data/interim/dl_data_imputed.csv",
+                   "data/interim/profile/coverage_imputed.csv"],
+        "outputs": ["data/processed/dl_data_final.csv"],
+        "params": {},
+    },
+    {
+        "name": "02e_build_covariates",
+        "inputs": ["data/raw/covariates", "data/raw/dl_details.csv"],
+        "outputs": ["data/interim/covariates"],
+        "params": {},
+    },
+    {
+        "name": "03_feature_engineering",
+        "inputs": ["data/processed/dl_data_final.csv", "data/raw/dl_details.csv",
+                   "data/interim/covariates"],
+        "outputs": ["data/processed/dl_data_features.csv"],
+        "params": {},
+    },
+    {
+        "name": "03b_update_rollups",
+        "inputs": ["data/processed/dl_data_final.csv"],
+        "outputs": ["data/rollup"],
+        "params": {"AQI_ROLLUP_REBUILD": "0"},
+    },
+    {
+        "name": "04a_train_xgboost",
+        "inputs": ["data/processed/dl_data_features.csv"],
+        "outputs": ["models/registry/xgboost", "models/xgboost/metrics.csv"],
+        "params": {"AQI_TRAIN_MODE": "full", "AQI_FULL_CHECK_EVERY": "7",
+                   "AQI_FEATURE_PRUNING": "0", "AQI_XGB_TREES": "500"},
+    },
+    {
+        "name": "04b_train_lightgbm",
+        "inputs": ["data/processed/dl_data_features.csv"],
+        "outputs": ["models/registry/lightgbm", "models/lightgbm/metrics.csv"],
+        "params": {"AQI_TRAIN_MODE": "full", "AQI_FULL_CHECK_EVERY": "7",
+                   "AQI_FEATURE_PRUNING": "0", "AQI_LGB_ROUNDS": "1000"},
+    },
+    {
+        "name": "04g_train_lightgbm_joint",
+        "inputs": ["data/processed/dl_data_features.csv", "models/lightgbm/metrics.csv"],
+        "outputs": ["models/registry/lightgbm_joint", "models/lightgbm_joint"],
+        "params": {"AQI_LGB_JOINT_ROUNDS": "2000"},
+    },
+    {
+        "name": "04c_feature_importance",
+        "inputs": ["models/registry/xgboost"],
+        "outputs": ["models/xgboost/feature_importance"],
+        "params": {},
+    },
+    {
+        "name": "04d_lgb_feature_importance",
+        "inputs": ["data/processed/dl_data_features.csv", "models/registry/lightgbm"],
+        "outputs": ["models/lightgbm/feature_importance"],
+        "params": {},
+    },
+    {
+        # Not an input of 04a / 04b (that would be a cycle): after
+        # re-pruning, retrain them with --force
+        "name": "04f_prune_features",
+        "inputs": ["data/processed/dl_data_features.csv",
+                   "models/xgboost/feature_importance",
+                   "models/lightgbm/feature_importance"],
+        "outputs": ["models/feature_sets.json"],
+        "params": {"AQI_PRUNE_METHOD": "cumulative"},
+    },
+    {
+        "name": "04e_export_lightgbm_predictions",
+        "inputs": ["data/processed/dl_data_features.csv", "models/registry/lightgbm"],
+        "outputs": ["data/processed/lightgbm_predictions.csv",
+                    "models/lightgbm/prediction_metrics.csv"],
+        "params": {},
+    },
+    {
+        "name": "05_generate_7day_heatmaps",
+        "inputs": ["data/processed/lightgbm_predictions.csv",
+                   "data/raw/dl_details.csv", "data/raw/locs_pred.csv",
+                   "data/interim/idw_p_values.csv",
+                   "data/interim/variogram_params.csv"],
+        "outputs": ["outputs/heatmaps"],
+        "params": {"AQI_INTERPOLATOR": "idw", "AQI_HEATMAP_HOURS": "168"},
+    },
+    {
+        "name": "05_error_regime_analysis",
+        "inputs": ["data/processed/dl_data_features.csv", "models/registry"],
+        "outputs": ["outputs/error_regimes/slice_metrics.csv"],
+        "params": {"AQI_ERROR_SLICES": "station,hour,weekday,season,aqi_band,quantile,"
+                                       "station+hour,season+hour,season+aqi_band,station+quantile"},
+    },
+    {
+        "name": "05_drift_monitor",
+        "inputs": ["data/processed/dl_data_features.csv",
+                   "data/processed/lightgbm_predictions.csv"],
+        "outputs": ["data/drift", "outputs/drift/drift_scores.csv"],
+        "params": {"AQI_DRIFT_REBUILD": "0"},
+    },
+    {
+        "name": "05_export_tiles",
+        "inputs": ["outputs/heatmaps"],
+        "outputs": ["outputs/tiles"],
+        "params": {"AQI_TILE_MAX_ZOOM": "12"},
+    },
+    {
+        "name": "05_compute_aqi",
+        "inputs": ["data/processed/lightgbm_predictions.csv", "outputs/heatmaps"],
+        "outputs": ["data/processed/aqi_predictions.csv", "outputs/aqi/grid_aqi.npz"],
+        "params": {},
+    },
+    {
+        "name": "05_detect_episodes",
+        "inputs": ["data/processed/aqi_predictions.csv", "outputs/aqi/grid_aqi.npz",
+                   "data/raw/dl_details.csv"],
+        "outputs": ["outputs/alerts/episodes.csv"],
+        "params": {"AQI_FORECAST_START": ""},
+    },
+    {
+        "name": "06_plot_actual_vs_predicted",
+        "inputs": ["data/processed/lightgbm_predictions.csv"],
+        "outputs": ["outputs/actual_vs_predicted"],
+        "params": {"AQI_PLOT_MAX_STATIONS": "0"},
+    },
+]
+
+
+# ---------------- Hashing ----------------
+
+def _file_digest(path, cache):
+    """
+    sha256 of a file's content. Digests are cached by
+    (size, mtime) so unchanged multi-GB inputs are not re-read.
+    """
+    st = path.stat()
+    key = str(path)
+    stamp = [st.st_size, st.st_mtime_ns]
+    hit = cache.get(key)
+    if hit is not None and hit["stamp"] == stamp:
+        return hit["sha256"]
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(chunk)
+
+    digest = h.hexdigest()
+    cache[key] = {"stamp": stamp, "sha256": digest}
+    return digest
+
+
+def path_digest(path, cache):
+    """
+    Content digest of a file or of every file below a directory.
+    Missing paths hash to a fixed marker.
+    """
+    if not path.exists():
+        return "missing"
+    if path.is_file():
+        return _file_digest(path, cache)
+
+    h = hashlib.sha256()
+    for f in sorted(p for p in path.rglob("*") if p.is_file()):
+        h.update(str(f.relative_to(path)).encode())
+        h.update(_file_digest(f, cache).encode())
+    return h.hexdigest()
+
+
+def code_files(script, src_dir):
+    """
+    The script plus every helper module under src/ it imports,
+    followed transitively.
+    """
+    seen = []
+    todo = [script]
+    while todo:
+        f = todo.pop()
+        if f in seen:
+            continue
+        seen.append(f)
+
+        tree = ast.parse(f.read_text(encoding="utf-8"))
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [a.name for a in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                helper = src_dir / f"{name.split('.')[0]}.py"
+                if helper.exists():
+                    todo.append(helper)
+    return sorted(seen)
+
+
+def stage_params(stage):
+    """Effective parameter values: environment overrides defaults."""
+    return {
+        k: os.environ.get(k, str(v))
+        for k, v in sorted(stage["params"].items())
+    }
+
+
+def stage_key(stage, root, cache):
+    """Hash of code, parameters and input contents for a stage."""
+    src_dir = root / "src"
+    h = hashlib.sha256()
+
+    for f in code_files(src_dir / f"{stage['name']}.py", src_dir):
+        h.update(f.name.encode())
+        h.update(_file_digest(f, cache).encode())
+
+    h.update(json.dumps(stage_params(stage), sort_keys=True).encode())
+
+    for rel in sorted(stage["inputs"]):
+        h.update(rel.encode())
+        h.update(path_digest(root / rel, cache).encode())
+
+    return h.hexdigest()
+
+
+# ---------------- DAG ----------------
+
+def _produces(output, path):
+    """True if `output` is `path`, lies inside it, or contains it."""
+    if path == output:
+        return True
+    output, path = output.rstrip("/") + "/", path.rstrip("/") + "/"
+    return path.startswith(output) or output.startswith(path)
+
+
+def build_dag(stages):
+    """Map each stage to the stages producing any of its inputs."""
+    deps = {}
+    for s in stages:
+        deps[s["name"]] = sorted({
+            o["name"]
+            for o in stages
+            if o is not s
+            for out in o["outputs"]
+            for inp in s["inputs"]
+            if _produces(out, inp)
+        })
+    return deps
+
+
+def select_stages(stages, deps, only):
+    """Restrict to the named stages plus everything upstream of them."""
+    if not only:
+        return stages
+
+    unknown = set(only) - {s["name"] for s in stages}
+    if unknown:
+        raise ValueError(f"Unknown stages: {sorted(unknown)}")
+
+    keep = set()
+    todo = list(only)
+    while todo:
+        name = todo.pop()
+        if name not in keep:
+            keep.add(name)
+            todo.extend(deps[name])
+    return [s for s in stages if s["name"] in keep]
+
+
+# ---------------- State ----------------
+
+def load_state(root):
+    path = root / STATE_DIR / STATE_FILE
+    if path.exists():
+        return json.loads(path.read_text())
+    return {"stages": {}, "digests": {}}
+
+
+def save_state(root, state):
+    path = root / STATE_DIR / STATE_FILE
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(state, indent=1, sort_keys=True))
+    os.replace(tmp, path)
+
+
+# ---------------- Execution ----------------
+
+def prepare_workspace(root):
+    """
+    Copy the pipeline scripts into another project root so stages
+    can run there against their own data/ and models/ trees.
+    """
+    root = Path(root)
+    (root / "src").mkdir(parents=True, exist_ok=True)
+    for f in (PROJECT_ROOT / "src").glob("*.py"):
+        shutil.copy2(f, root / "src" / f.name)
+    return root
+
+
+def run_stage(stage, root, env=None):
+    """
+    Run one script as a subprocess from the project root.
+    Output goes to .pipeline/logs/<stage>.log.
+    Returns (returncode, wall seconds).
+    """
+    for rel in stage["outputs"]:
+        out = root / rel
+        (out if not out.suffix else out.parent).mkdir(parents=True, exist_ok=True)
+
+    log_path = root / STATE_DIR / LOG_DIR / f"{stage['name']}.log"
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+
+    run_env = dict(os.environ)
+    run_env.update(stage_params(stage))
+    run_env.update(env or {})
+
+    t0 = time.perf_counter()
+    with open(log_path, "w") as log:
+        proc = subprocess.run(
+            [sys.executable, str(root / "src" / f"{stage['name']}.py")],
+            cwd=root,
+            env=run_env,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+    return proc.returncode, time.perf_counter() - t0
+
+
+def run_pipeline(root=PROJECT_ROOT, only=None, force=False, jobs=2,
+                 dry_run=False, env=None, stages=STAGES):
+    """
+    Run every stale stage in dependency order, up to `jobs` at a time.
+    Returns a list of per-stage result dicts.
+    """
+    root = Path(root)
+    deps = build_dag(stages)
+    selected = select_stages(stages, deps, only)
+    by_name = {s["name"]: s for s in selected}
+    state = load_state(root)
+    cache = state["digests"]
+
+    forced = set(only or by_name) if force else set()
+
+    pending = dict(by_name)
+    status = {}
+    results = []
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        while pending or running:
+            for name in list(pending):
+                stage_deps = [d for d in deps[name] if d in by_name]
+                if any(status.get(d) in ("failed", "blocked") for d in stage_deps):
+                    status[name] = "blocked"
+                    results.append({"stage": name, "status": "blocked", "seconds": 0.0})
+                    del pending[name]
+                    continue
+                if not all(status.get(d) in ("ran", "skipped", "stale") for d in stage_deps):
+                    continue
+
+                stage = pending.pop(name)
+                key = stage_key(stage, root, cache)
+                prev = state["stages"].get(name, {})
+                outputs_ok = all((root / o).exists() for o in stage["outputs"])
+
+                # Dry run: a stage downstream of one that would run reruns too,
+                # even though its inputs still hash as before
+                upstream_stale = any(status.get(d) == "stale" for d in stage_deps)
+
+                if name not in forced and prev.get("key") == key and outputs_ok and not upstream_stale:
+                    status[name] = "skipped"
+                    results.append({"stage": name, "status": "skipped", "seconds": 0.0})
+                    print(f"[skip] {name}")
+                    continue
+
+                if dry_run:
+                    status[name] = "stale"
+                    results.append({"stage": name, "status": "stale", "seconds": 0.0})
+                    print(f"[stale] {name}")
+                    continue
+
+                print(f"[run ] {name}")
+                running[pool.submit(run_stage, stage, root, env)] = (name, key)
+
+            if not running:
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                name, key = running.pop(fut)
+                code, seconds = fut.result()
+                if code == 0:
+                    status[name] = "ran"
+                    state["stages"][name] = {
+                        "key": key,
+                        "seconds": round(seconds, 3),
+                        "finished": time.strftime("%Y-%m-%d %H:%M:%S"),
+                    }
+                    save_state(root, state)
+                    print(f"[done] {name} ({seconds:.1f}s)")
+                else:
+                    status[name] = "failed"
+                    print(f"[FAIL] {name} (exit {code}) → "
+                          f"{root / STATE_DIR / LOG_DIR / (name + '.log')}")
+                results.append({"stage": name, "status": status[name],
+                                "seconds": seconds})
+
+    save_state(root, state)
+    return results
+
+
+def print_summary(results):
+    print("\nStage timing summary:")
+    print(f"  {'stage':<36} {'status':<8} {'seconds':>9}")
+    for r in results:
+        print(f"  {r['stage']:<36} {r['status']:<8} {r['seconds']:>9.1f}")
+    total = sum(r["seconds"] for r in results)
+    print(f"  {'total (sum of stages)':<36} {'':<8} {total:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the AQI pipeline DAG.")
+    parser.add_argument("--only", nargs="+", metavar="STAGE",
+                        help="run these stages (and anything upstream that is stale)")
+    parser.add_argument("--force", action="store_true",
+                        help="rerun selected stages even if unchanged")
+    parser.add_argument("--jobs", type=int, default=2,
+                        help="maximum stages to run in parallel")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="only report which stages are stale")
+    parser.add_argument("--list", action="store_true",
+                        help="print stages and their dependencies")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, d in build_dag(STAGES).items():
+            print(f"{name:<36} <- {', '.join(d) or '-'}")
+        return
+
+    results = run_pipeline(
+        only=args.only, force=args.force, jobs=args.jobs, dry_run=args.dry_run
+    )
+    print_summary(results)
+
+    if any(r["status"] in ("failed", "blocked") for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+# ============================================================
+# run_sharded.py
+# Run the per-station stages as independent station shards
+#   1. plan    : manifest of contiguous station ranges balanced
+#                by row count, plus the read-only neighbour
+#                exchange the stage needs
+#   2. launch  : one process per shard (AQI_SHARD=i); locally a
+#                process pool, on a cluster any scheduler running
+#                the printed commands against a shared data/
+#   3. merge   : shard outputs concatenated in shard order (and
+#                re-ordered by pollutant for 02), giving the same
+#                file as an unsharded run
+#
+# Stages without a shard spec run unsharded in sequence, so a
+# whole stretch of the pipeline can be given at once.
+#
+# Usage:
+#   python src/run_sharded.py 01_gap_analysis 02_imputation \
+#       02c_trim_low_coverage 03_feature_engineering --shards 8 --jobs 4
+#   python src/run_sharded.py 02_imputation --shards 32 --plan-only
+#   python src/run_sharded.py 02_imputation --merge-only
+# ============================================================
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+import numpy as np
+
+import data_profile
+import run_pipeline
+import sharding
+
+# ---------------- CONFIG ----------------
+PROJECT_ROOT = run_pipeline.PROJECT_ROOT
+SHARD_ROOT = Path("data/shards")
+
+POLLUTANTS = ["pm2.5", "pm10", "nox", "so2", "co", "o3"]
+
+# exchange: how neighbour values are built from the stage input
+#   "wide" = pollutant columns, "long" = pollutant / value rows
+# order_by_pollutant: unsharded output is pollutant-major
+SHARD_SPECS = {
+    "01_gap_analysis": {
+        "input": "data/interim/dl_data_qc.csv",
+        "outputs": ["data/interim/dl_data_trimmed.csv", "data/interim/gap_summary.csv"],
+        "exchange": None,
+    },
+    "02_imputation": {
+        "input": "data/interim/dl_data_trimmed.csv",
+        "outputs": ["data/interim/dl_data_imputed.csv"],
+        "exchange": "wide",
+        "order_by_pollutant": True,
+        "profile": "imputed",
+    },
+    "03_feature_engineering": {
+        "input": "data/processed/dl_data_final.csv",
+        "outputs": ["data/processed/dl_data_features.csv"],
+        "exchange": "long",
+    },
+}
+# ---------------------------------------
+
+
+def shard_dir(root, stage):
+    return Path(root) / SHARD_ROOT / stage
+
+
+# ---------------- Plan ----------------
+
+def current_plan(out, source, n_shards, needs_exchange):
+    """Shards of an existing plan built from the same source, else None."""
+    try:
+        manifest = sharding.read_manifest(out)
+    except (OSError, ValueError):
+        return None
+    # plan_shards can return fewer shards than asked, so compare the request
+    if manifest["source"] != source or manifest.get("requested_shards") != n_shards:
+        return None
+    if needs_exchange and not (out / sharding.EXCHANGE_DIR).exists():
+        return None
+    return manifest["shards"]
+
+
+def plan(stage, n_shards, root=PROJECT_ROOT):
+    """
+    Write the manifest and exchange for a stage; returns the shard list.
+    A plan for the same source file (size, mtime) and shard count is
+    kept as it is, together with the shard directories, so a relaunch
+    resumes from the shards' checkpoints.
+    """
+    spec = SHARD_SPECS[stage]
+    out = shard_dir(root, stage)
+    src = Path(root) / spec["input"]
+    st = src.stat()
+    source = {"file": spec["input"], "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+    shards = current_plan(out, source, n_shards, spec["exchange"] is not None)
+    if shards is not None:
+        print("  source unchanged; reusing the existing plan")
+        return shards
+
+    if out.exists():
+        shutil.rmtree(out)
+
+    if spec["exchange"] is None:
+        df = pd.read_csv(src, usecols=["station_id"])
+    else:
+        df = pd.read_csv(src, parse_dates=["datetime"])
+
+    shards = sharding.plan_shards(df["station_id"].values, n_shards)
+    sharding.write_manifest(out, stage, shards, source, requested_shards=n_shards)
+
+    if spec["exchange"] == "wide":
+        wide, hours, station_ids = sharding.exchange_from_wide(df, POLLUTANTS)
+    elif spec["exchange"] == "long":
+        wide, hours, station_ids = sharding.exchange_from_long(df)
+    if spec["exchange"] is not None:
+        sharding.write_exchange(wide, hours, station_ids, out / sharding.EXCHANGE_DIR)
+
+    return shards
+
+
+def shard_command(stage, i):
+    """(argv, extra env) that runs shard i of a stage from the project root."""
+    env = {"AQI_SHARD": str(i), "AQI_SHARD_DIR": str(SHARD_ROOT / stage)}
+    return [sys.executable, f"src/{stage}.py"], env
+
+
+# ---------------- Launch ----------------
+
+def run_shard(stage, i, root=PROJECT_ROOT):
+    argv, extra = shard_command(stage, i)
+    env = dict(os.environ)
+    params = next((s["params"] for s in run_pipeline.STAGES if s["name"] == stage), {})
+    env.update({k: os.environ.get(k, str(v)) for k, v in params.items()})
+    env.update(extra)
+
+    log_path = shard_dir(root, stage) / f"shard_{i:03d}" / "run.log"
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+
+    t0 = time.perf_counter()
+    with open(log_path, "w") as log:
+        proc = subprocess.run(argv, cwd=root, env=env, stdout=log, stderr=subprocess.STDOUT)
+    return proc.returncode, time.perf_counter() - t0
+
+
+def launch(stage, n_shards, jobs, root=PROJECT_ROOT):
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        results = list(pool.map(lambda i: run_shard(stage, i, root), range(n_shards)))
+
+    failed = [i for i, (rc, _) in enumerate(results) if rc != 0]
+    for i, (rc, secs) in enumerate(results):
+        print(f"  shard {i:3d}: {'ok' if rc == 0 else f'exit {rc}':>8}  {secs:7.1f}s")
+    if failed:
+        raise RuntimeError(f"{stage}: shard(s) {failed} failed; logs under {shard_dir(root, stage)}")
+
+
+# ---------------- Merge ----------------
+
+def merge_csv(parts, out_path, order_by_pollutant=False):
+    """
+    Concatenate shard CSVs in shard order. Cells are kept as text, so
+    values are written back exactly as the shards formatted them.
+    """
+    frames = []
+    for f in parts:
+        try:
+            frames.append(pd.read_csv(f, dtype=str, keep_default_na=False))
+        except pd.errors.EmptyDataError:
+            continue
+
+    if not frames:
+        pd.DataFrame().to_csv(out_path, index=False)
+        return 0
+
+    # A shard may lack a pollutant's columns; keep the widest header's order
+    columns = list(max((fr.columns for fr in frames), key=len))
+    merged = pd.concat(frames, ignore_index=True)
+    merged = merged[columns + [c for c in merged.columns if c not in columns]].fillna("")
+
+    if order_by_pollutant:
+        rank = merged["pollutant"].map({p: i for i, p in enumerate(POLLUTANTS)})
+        merged = merged.iloc[np.argsort(rank.values, kind="stable")]
+
+    merged.to_csv(out_path, index=False)
+    return len(merged)
+
+
+def merge(stage, root=PROJECT_ROOT):
+    spec = SHARD_SPECS[stage]
+    out = shard_dir(root, stage)
+    n_shards = sharding.read_manifest(out)["n_shards"]
+
+    for rel in spec["outputs"]:
+        parts = [out / f"shard_{i:03d}" / Path(rel).name for i in range(n_shards)]
+        missing = [str(p) for p in parts if not p.exists()]
+        if missing:
+            raise FileNotFoundError(f"{stage}: missing shard outputs {missing}")
+
+        rows = merge_csv(parts, Path(root) / rel, spec.get("order_by_pollutant", False))
+        print(f"  merged {n_shards} shard(s) → {rel} ({rows:,} rows)")
+
+    if spec.get("profile"):
+        merged = pd.read_csv(Path(root) / spec["outputs"][0], parse_dates=["datetime"])
+        data_profile.save_profile(
+            data_profile.coverage_from_long(merged),
+            data_profile.gaps_from_long(merged),
+            spec["profile"],
+            profile_dir=Path(root) / data_profile.PROFILE_DIR
+        )
+
+
+# ---------------- CLI ----------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Run per-station stages as station shards.")
+    parser.add_argument("stages", nargs="+", metavar="STAGE")
+    parser.add_argument("--shards", type=int, default=4, help="number of station shards")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                        help="shards run in parallel on this machine")
+    parser.add_argument("--plan-only", action="store_true",
+                        help="write manifest + exchange and print the shard commands")
+    parser.add_argument("--merge-only", action="store_true",
+                        help="merge existing shard outputs")
+    args = parser.parse_args()
+
+    known = {s["name"]: s for s in run_pipeline.STAGES}
+    unknown = set(args.stages) - set(known)
+    if unknown:
+        raise SystemExit(f"Unknown stages: {sorted(unknown)}")
+
+    for stage in args.stages:
+        if stage not in SHARD_SPECS:
+            if args.plan_only or args.merge_only:
+                continue
+            print(f"\n[run ] {stage} (unsharded)")
+            rc, secs = run_pipeline.run_stage(known[stage], PROJECT_ROOT)
+            if rc != 0:
+                raise SystemExit(f"{stage} failed; see {run_pipeline.STATE_DIR}/{run_pipeline.LOG_DIR}/{stage}.log")
+            print(f"  {secs:.1f}s")
+            continue
+
+        print(f"\n[shard] {stage}")
+        if not args.merge_only:
+            shards = plan(stage, args.shards)
+            print(f"  {len(shards)} shard(s): "
+                  + ", ".join(f"{len(s['stations'])} st / {s['rows']:,} rows" for s in shards))
+
+            if args.plan_only:
+                for i in range(len(shards)):
+                    argv, env = shard_command(stage, i)
+                    print("  " + " ".join(f"{k}={v}" for k, v in env.items())
+                          + " python " + " ".join(argv[1:]))
+                continue
+
+            launch(stage, len(shards), args.jobs)
+        merge(stage)
+
+
+if __name__ == "__main__":
+    main()
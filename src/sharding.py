@@ -0,0 +1,173 @@
+# ============================================================
+# sharding.py
+# Station-sharded execution of the per-station stages
+# (01_gap_analysis, 02_imputation, 03_feature_engineering)
+#   - manifest.json: contiguous ranges of sorted station ids,
+#     balanced by row count, so concatenating shard outputs in
+#     shard order reproduces the unsharded station order
+#   - exchange/: read-only (hour × station) float64 arrays per
+#     pollutant (.npy, memory-mapped) for the parts that need
+#     neighbour values: long-gap IDW / kriging in 02 (observed
+#     values) and spatial-lag features in 03 (final values)
+#
+# A script runs as one shard when AQI_SHARD is set; it then keeps
+# only its stations and writes its outputs under
+# <AQI_SHARD_DIR>/shard_NNN/. run_sharded.py plans, launches and
+# merges.
+# ============================================================
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# ---------------- CONFIG ----------------
+SHARD = os.environ.get("AQI_SHARD")                     # shard index, unset = unsharded
+SHARD_DIR = Path(os.environ.get("AQI_SHARD_DIR", "data/shards"))
+MANIFEST_FILE = "manifest.json"
+EXCHANGE_DIR = "exchange"
+# ---------------------------------------
+
+
+def pollutant_file(pollutant):
+    return f"{pollutant.replace('.', '')}.npy"
+
+
+# ---------------- Planning ----------------
+
+def plan_shards(station_col, n_shards):
+    """
+    Contiguous ranges of sorted station ids with roughly equal row
+    counts. Returns a list of {"shard", "stations", "rows"}.
+    """
+    counts = pd.Series(np.asarray(station_col)).value_counts().sort_index()
+    n_shards = max(1, min(n_shards, len(counts)))
+
+    # Cut where the cumulative row count crosses each 1/n share
+    cum = counts.cumsum().values
+    cuts = np.searchsorted(cum, cum[-1] * np.arange(1, n_shards) / n_shards, side="left") + 1
+    bounds = np.unique(np.concatenate([[0], np.minimum(cuts, len(counts) - 1), [len(counts)]]))
+
+    return [
+        {"shard": i,
+         "stations": counts.index[a:b].tolist(),
+         "rows": int(counts.values[a:b].sum())}
+        for i, (a, b) in enumerate(zip(bounds[:-1], bounds[1:]))
+    ]
+
+
+def write_manifest(shard_dir, stage, shards, source, requested_shards=None):
+    """requested_shards: the count asked for (plan_shards may return fewer)."""
+    shard_dir = Path(shard_dir)
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    (shard_dir / MANIFEST_FILE).write_text(json.dumps(
+        {"stage": stage, "source": source, "n_shards": len(shards),
+         "requested_shards": requested_shards or len(shards), "shards": shards},
+        indent=2, default=str
+    ))
+
+
+def read_manifest(shard_dir=SHARD_DIR):
+    return json.loads((Path(shard_dir) / MANIFEST_FILE).read_text())
+
+
+# ---------------- Inside a shard ----------------
+
+def active():
+    return SHARD is not None
+
+
+def shard_path(path):
+    """Where this process writes `path`: unchanged unless running as a shard."""
+    if not active():
+        return path
+    out = SHARD_DIR / f"shard_{int(SHARD):03d}" / Path(path).name
+    out.parent.mkdir(parents=True, exist_ok=True)
+    return out
+
+
+def filter_stations(df, col="station_id"):
+    """Rows of this shard's stations (all rows when unsharded)."""
+    if not active():
+        return df
+    shard = read_manifest()["shards"][int(SHARD)]
+    return df[df[col].isin(shard["stations"])]
+
+
+# ---------------- Neighbour exchange ----------------
+
+def write_exchange(wide_by_pollutant, hours, station_ids, out_dir):
+    """wide_by_pollutant: pollutant → (len(hours) × len(station_ids)) array."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    np.save(out_dir / "hours.npy", np.asarray(hours, dtype="datetime64[ns]"))
+    np.save(out_dir / "station_ids.npy", np.asarray(station_ids))
+    for p, X in wide_by_pollutant.items():
+        np.save(out_dir / pollutant_file(p), np.asarray(X, dtype=np.float64))
+
+
+def exchange_from_long(df, value_col="value", pollutant_col="pollutant"):
+    """Contiguous hourly (hour × station) arrays from long rows."""
+    hours = pd.date_range(df["datetime"].min(), df["datetime"].max(), freq="h")
+    station_ids = np.sort(df["station_id"].unique())
+    wide = {
+        p: g.pivot_table(index="datetime", columns="station_id", values=value_col)
+              .reindex(index=hours, columns=station_ids).values
+        for p, g in df.groupby(pollutant_col)
+    }
+    return wide, hours, station_ids
+
+
+def exchange_from_wide(df, pollutants):
+    """Contiguous hourly (hour × station) arrays from a table with one column per pollutant."""
+    hours = pd.date_range(df["datetime"].min(), df["datetime"].max(), freq="h")
+    station_ids = np.sort(df["station_id"].unique())
+    wide = {
+        p: df.pivot(index="datetime", columns="station_id", values=p)
+             .reindex(index=hours, columns=station_ids).values
+        for p in pollutants if p in df.columns
+    }
+    return wide, hours, station_ids
+
+
+class Exchange:
+    """Read-only view of the neighbour exchange written for a sharded stage."""
+
+    def __init__(self, root=None):
+        self.root = Path(root) if root else SHARD_DIR / EXCHANGE_DIR
+        self.hours = pd.DatetimeIndex(np.load(self.root / "hours.npy"))
+        self.station_ids = np.load(self.root / "station_ids.npy", allow_pickle=False)
+
+    def values(self, pollutant):
+        """(hour × station) array, memory-mapped; None if the pollutant is absent."""
+        path = self.root / pollutant_file(pollutant)
+        return np.load(path, mmap_mode="r") if path.exists() else None
+
+    def frame(self, pollutant):
+        X = self.values(pollutant)
+        return None if X is None else pd.DataFrame(X, index=self.hours, columns=self.station_ids)
+
+    def long(self, pollutant):
+        """Observed (datetime, station_id, val) rows, by hour then station."""
+        X = self.values(pollutant)
+        if X is None:
+            return pd.DataFrame({"datetime": [], "station_id": [], "val": []})
+        hour, col = np.nonzero(~np.isnan(X))
+        return pd.DataFrame({
+            "datetime": self.hours[hour],
+            "station_id": self.station_ids[col],
+            "val": X[hour, col],
+        })
+
+    def positions(self, station_col, datetime_col):
+        """(hour, station) positions of rows on the exchange grid."""
+        row = self.hours.get_indexer(pd.DatetimeIndex(datetime_col))
+        col = pd.Index(self.station_ids).get_indexer(np.asarray(station_col))
+        return row, col
+
+
+def load_exchange():
+    """The exchange for this shard, or None when unsharded."""
+    return Exchange() if active() else None
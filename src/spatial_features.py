@@ -0,0 +1,119 @@
+# ============================================================
+# spatial_features.py
+# Spatial-lag features from neighbouring stations
+#   - One sparse (station × station) weight matrix built from
+#     dl_details.csv: inverse-distance weights to the k nearest
+#     other stations
+#   - Neighbour means of lagged values as a single sparse ×
+#     dense product over the full (hour × station) array
+#   - Missing neighbours are skipped by renormalising with the
+#     same product over the observed mask
+# ============================================================
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.spatial.distance import cdist
+
+# ---------------- CONFIG ----------------
+SPATIAL_NEIGHBORS = 8
+SPATIAL_POWER = 2.0
+SPATIAL_LAGS = [1, 24]      # hours
+MIN_SPATIAL_DIST = 1e-3
+# ---------------------------------------
+
+
+def neighbor_weights(stations, station_ids, n_neighbors=SPATIAL_NEIGHBORS, power=SPATIAL_POWER):
+    """
+    Sparse CSR matrix W (S × S): W[i, j] = 1 / d_ij^power for the
+    n_neighbors stations j nearest to i (j != i), zero elsewhere.
+    Rows follow `station_ids`; `stations` needs station_id, lon, lat.
+    """
+    coords = stations.set_index("station_id").loc[station_ids, ["lon", "lat"]].values
+    n_st = len(station_ids)
+    k = min(n_neighbors, n_st - 1)
+    if k <= 0:
+        return sparse.csr_matrix((n_st, n_st))
+
+    d = cdist(coords, coords)
+    np.fill_diagonal(d, np.inf)
+    idx = np.argpartition(d, k - 1, axis=1)[:, :k]
+    d_k = np.maximum(np.take_along_axis(d, idx, axis=1), MIN_SPATIAL_DIST)
+
+    rows = np.repeat(np.arange(n_st), k)
+    return sparse.csr_matrix(
+        (1.0 / d_k.ravel() ** power, (rows, idx.ravel())),
+        shape=(n_st, n_st)
+    )
+
+
+def source_weights(stations, station_ids, sources, n_neighbors, power=SPATIAL_POWER):
+    """
+    Sparse CSR matrix W (S × N): inverse-distance weights from each
+    station to its n_neighbors nearest sources (e.g. weather sites or
+    grid nodes). `sources` needs lon, lat; rows follow `station_ids`.
+    With neighbor_mean this snaps (hours × sources) values to stations.
+    """
+    coords = stations.set_index("station_id").loc[station_ids, ["lon", "lat"]].values
+    src = np.asarray(sources[["lon", "lat"]].values, dtype=float)
+    n_st, n_src = len(station_ids), len(src)
+    k = min(n_neighbors, n_src)
+
+    d = cdist(coords, src)
+    idx = np.argpartition(d, k - 1, axis=1)[:, :k]
+    d_k = np.maximum(np.take_along_axis(d, idx, axis=1), MIN_SPATIAL_DIST)
+
+    rows = np.repeat(np.arange(n_st), k)
+    return sparse.csr_matrix(
+        (1.0 / d_k.ravel() ** power, (rows, idx.ravel())),
+        shape=(n_st, n_src)
+    )
+
+
+def lag_grid(values, lag):
+    """Shift an (hours × stations) array down by `lag` hours (NaN-padded)."""
+    out = np.full_like(values, np.nan)
+    if lag < len(values):
+        out[lag:] = values[:len(values) - lag]
+    return out
+
+
+def neighbor_mean(values, W):
+    """
+    Weighted mean of each station's neighbours at every hour.
+    values: (hours × stations) with NaN for missing.
+    Hours where no neighbour reported → NaN.
+    """
+    observed = ~np.isnan(values)
+    num = (W @ np.where(observed, values, 0.0).T).T
+    den = (W @ observed.T.astype(float)).T
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(den > 0, num / den, np.nan)
+
+
+def spatial_lag_features(values, W, pollutant, lags=SPATIAL_LAGS):
+    """
+    Feature arrays for one pollutant, all (hours × stations):
+      {p}_nbr_lag{L}        neighbour mean of the lag-L values
+      {p}_nbr_delta_lag{L}  neighbour mean minus own lag-L value
+    """
+    feats = {}
+    for lag in lags:
+        lagged = lag_grid(values, lag)
+        nbr = neighbor_mean(lagged, W)
+        feats[f"{pollutant}_nbr_lag{lag}"] = nbr
+        feats[f"{pollutant}_nbr_delta_lag{lag}"] = nbr - lagged
+    return feats
+
+
+def grid_positions(station_col, datetime_col):
+    """
+    Integer (hour, station) positions of long-format rows on a
+    complete hourly grid, plus the grid's station ids and length.
+    """
+    station_ids, col = np.unique(np.asarray(station_col), return_inverse=True)
+    times = pd.DatetimeIndex(datetime_col)
+    start = times.min()
+    row = np.asarray((times - start) // pd.Timedelta(hours=1), dtype=np.int64)
+    n_hours = int(row.max()) + 1 if len(row) else 0
+    return row, col, station_ids, n_hours
@@ -0,0 +1,244 @@
+# ============================================================
+# synthetic_data.py
+# Synthetic Delhi-like AQI data in the raw schema
+#   - dl_data.csv    : station_id, datetime, <pollutants>
+#   - dl_details.csv : station_id, station_name, lon, lat
+#   - locs_pred.csv  : x, y  (prediction grid)
+#   - covariates/met_sites.csv   : 3-hourly weather at a few sites
+#   - covariates/fires_daily.csv : regional daily fire counts
+#
+# Missingness mimics the real feed:
+#   - structural gaps before each station's start date
+#   - short (≤6 h), medium (≤72 h) and long outages, both
+#     station-wide and per pollutant
+#
+# Usage:
+#   python src/synthetic_data.py --stations 40 --years 2 --out data/synthetic/raw
+# ============================================================
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+
+# ---------------- CONFIG ----------------
+POLLUTANTS = ["pm2.5", "pm10", "nox", "so2", "co", "o3"]
+
+# Delhi NCR bounding box (lon_min, lon_max, lat_min, lat_max)
+BBOX = (76.85, 77.35, 28.40, 28.88)
+GRID_STEP = 0.01            # degrees, prediction grid spacing
+
+END_TIME = "2023-12-31 23:00:00"
+
+# Typical level, winter/summer amplitude, diurnal amplitude per pollutant
+POLLUTANT_PROFILE = {
+    "pm2.5": {"level": 110.0, "season": 0.60, "diurnal": 0.25},
+    "pm10":  {"level": 220.0, "season": 0.50, "diurnal": 0.20},
+    "nox":   {"level": 55.0,  "season": 0.40, "diurnal": 0.40},
+    "so2":   {"level": 14.0,  "season": 0.30, "diurnal": 0.15},
+    "co":    {"level": 1.4,   "season": 0.45, "diurnal": 0.35},
+    "o3":    {"level": 35.0,  "season": -0.30, "diurnal": -0.60},
+}
+
+# Outages per station-pollutant-year: (rate, min_hours, max_hours)
+OUTAGES = {
+    "short":  (40.0, 1, 6),
+    "medium": (6.0, 7, 72),
+    "long":   (0.8, 73, 24 * 30),
+}
+STATION_WIDE_SHARE = 0.5    # fraction of outages hitting all pollutants
+MAX_START_FRACTION = 0.4    # stations start within the first 40% of the span
+
+MET_SITES = 6
+MET_STEP_HOURS = 3
+
+STATION_CHUNK = 20          # stations generated / written per batch
+RANDOM_SEED = 42
+# ---------------------------------------
+
+
+def make_stations(n_stations, rng):
+    lon = rng.uniform(BBOX[0] + 0.05, BBOX[1] - 0.05, n_stations)
+    lat = rng.uniform(BBOX[2] + 0.05, BBOX[3] - 0.05, n_stations)
+    return pd.DataFrame({
+        "station_id": np.arange(1, n_stations + 1),
+        "station_name": [f"Synthetic Station {i}" for i in range(1, n_stations + 1)],
+        "lon": lon.round(5),
+        "lat": lat.round(5),
+    })
+
+
+def make_grid():
+    xs = np.arange(BBOX[0], BBOX[1] + 1e-9, GRID_STEP)
+    ys = np.arange(BBOX[2], BBOX[3] + 1e-9, GRID_STEP)
+    gx, gy = np.meshgrid(xs, ys)
+    return pd.DataFrame({"x": gx.ravel().round(4), "y": gy.ravel().round(4)})
+
+
+def ar1(shape, phi, rng):
+    """AR(1) noise along axis 0, unit marginal variance."""
+    eps = rng.standard_normal(shape) * np.sqrt(1 - phi ** 2)
+    return lfilter([1.0], [1.0, -phi], eps, axis=0)
+
+
+def outage_mask(n_hours, n_series, years, rng):
+    """
+    Boolean (n_hours × n_series) mask of outages drawn from OUTAGES.
+    Built with a +1/-1 difference array, so no per-outage loop.
+    """
+    diff = np.zeros((n_hours + 1, n_series), dtype=np.int32)
+
+    for rate, lo, hi in OUTAGES.values():
+        counts = rng.poisson(rate * years, n_series)
+        col = np.repeat(np.arange(n_series), counts)
+        start = rng.integers(0, n_hours, col.size)
+        length = rng.integers(lo, hi + 1, col.size)
+        end = np.minimum(start + length, n_hours)
+
+        np.add.at(diff, (start, col), 1)
+        np.add.at(diff, (end, col), -1)
+
+    return np.cumsum(diff[:-1], axis=0) > 0
+
+
+def generate_chunk(times, stations, regional, years, rng):
+    """Wide hourly frame for a block of stations (station-major order)."""
+    n_hours = len(times)
+    n_st = len(stations)
+
+    hour = times.hour.values[:, None]
+    doy = times.dayofyear.values[:, None]
+
+    # Winter peak around early January
+    season = np.cos(2 * np.pi * (doy - 5) / 365.25)
+    # Morning and late-evening peaks
+    diurnal = 0.6 * np.cos(2 * np.pi * (hour - 9) / 24) + 0.4 * np.cos(2 * np.pi * (hour - 21) / 12)
+
+    # Station-level offsets scale every pollutant together
+    station_scale = rng.lognormal(0.0, 0.25, n_st)[None, :]
+
+    wide_outage = outage_mask(n_hours, n_st, years, rng)
+
+    # Structural gap: nothing before the station's start
+    start_idx = (rng.uniform(0, MAX_START_FRACTION, n_st) * n_hours).astype(int)
+    pre_start = np.arange(n_hours)[:, None] < start_idx[None, :]
+
+    data = {}
+    for pollutant in POLLUTANTS:
+        prof = POLLUTANT_PROFILE[pollutant]
+        log_level = (
+            np.log(prof["level"])
+            + prof["season"] * season
+            + prof["diurnal"] * diurnal
+            + 0.35 * regional[pollutant][:, None]
+            + 0.25 * ar1((n_hours, n_st), 0.9, rng)
+        )
+        values = np.exp(log_level) * station_scale
+
+        own_outage = outage_mask(n_hours, n_st, years * (1 - STATION_WIDE_SHARE), rng)
+        shared = rng.random(n_st) < STATION_WIDE_SHARE
+        missing = pre_start | own_outage | (wide_outage & shared[None, :])
+
+        values[missing] = np.nan
+        data[pollutant] = values.T.ravel().round(3)
+
+    frame = pd.DataFrame({
+        "station_id": np.repeat(stations["station_id"].values, n_hours),
+        "datetime": np.tile(times.values, n_st),
+    })
+    for pollutant in POLLUTANTS:
+        frame[pollutant] = data[pollutant]
+    return frame
+
+
+def write_covariates(out_dir, times, rng):
+    """Weather sites (met_sites.csv) and regional fire counts (fires_daily.csv)."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    met_times = times[::MET_STEP_HOURS]
+    n = len(met_times)
+    hour = met_times.hour.values[:, None]
+    season = np.cos(2 * np.pi * (met_times.dayofyear.values[:, None] - 5) / 365.25)
+
+    lon = rng.uniform(BBOX[0], BBOX[1], MET_SITES)
+    lat = rng.uniform(BBOX[2], BBOX[3], MET_SITES)
+    shared = ar1((n, 1), 0.95, rng)
+    met = {
+        "wind_u": 2.0 * shared + ar1((n, MET_SITES), 0.9, rng),
+        "wind_v": -1.0 + 2.0 * ar1((n, 1), 0.95, rng) + ar1((n, MET_SITES), 0.9, rng),
+        "blh": np.exp(6.2 - 0.5 * season + 0.8 * np.cos(2 * np.pi * (hour - 14) / 24)
+                      + 0.2 * ar1((n, MET_SITES), 0.9, rng)),
+        "temp": 25 - 9 * season + 5 * np.cos(2 * np.pi * (hour - 15) / 24)
+                + ar1((n, MET_SITES), 0.9, rng),
+        "rh": np.clip(60 + 15 * season - 15 * np.cos(2 * np.pi * (hour - 15) / 24)
+                      + 8 * ar1((n, MET_SITES), 0.9, rng), 5, 100),
+    }
+    frame = pd.DataFrame({
+        "datetime": np.repeat(met_times.values, MET_SITES),
+        "lon": np.tile(lon.round(4), n),
+        "lat": np.tile(lat.round(4), n),
+    })
+    for name, values in met.items():
+        frame[name] = values.ravel().round(2)
+    frame.to_csv(out_dir / "met_sites.csv", index=False, date_format="%Y-%m-%d %H:%M:%S")
+
+    # Stubble burning: peaks in late October / November
+    days = pd.date_range(times[0].normalize(), times[-1].normalize(), freq="D")
+    burn = np.exp(-0.5 * ((days.dayofyear.values - 310) / 12.0) ** 2)
+    pd.DataFrame({
+        "datetime": days,
+        "fire_count": rng.poisson(5 + 2000 * burn),
+    }).to_csv(out_dir / "fires_daily.csv", index=False, date_format="%Y-%m-%d %H:%M:%S")
+
+
+def generate(out_dir, n_stations=40, years=1, seed=RANDOM_SEED):
+    """Write dl_data.csv, dl_details.csv, locs_pred.csv and covariates/ to out_dir."""
+    rng = np.random.default_rng(seed)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    end = pd.Timestamp(END_TIME)
+    times = pd.date_range(end - pd.Timedelta(hours=int(years * 8760) - 1), end, freq="h")
+
+    stations = make_stations(n_stations, rng)
+    stations.to_csv(out_dir / "dl_details.csv", index=False)
+    make_grid().to_csv(out_dir / "locs_pred.csv", index=False)
+
+    # City-wide signal shared by all stations
+    regional = {p: ar1(len(times), 0.97, rng) for p in POLLUTANTS}
+
+    data_path = out_dir / "dl_data.csv"
+    for i in range(0, n_stations, STATION_CHUNK):
+        chunk = generate_chunk(times, stations.iloc[i:i + STATION_CHUNK], regional, years, rng)
+        chunk.to_csv(
+            data_path,
+            mode="w" if i == 0 else "a",
+            header=(i == 0),
+            index=False,
+            date_format="%Y-%m-%d %H:%M:%S",
+        )
+
+    # Separate stream, so the AQI data does not depend on the covariates
+    write_covariates(out_dir / "covariates", times, np.random.default_rng(seed + 1))
+
+    return len(times) * n_stations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic raw AQI data.")
+    parser.add_argument("--stations", type=int, default=40)
+    parser.add_argument("--years", type=float, default=1)
+    parser.add_argument("--seed", type=int, default=RANDOM_SEED)
+    parser.add_argument("--out", default="data/synthetic/raw")
+    args = parser.parse_args()
+
+    print(f"Generating {args.stations} stations × {args.years} years...")
+    rows = generate(args.out, args.stations, args.years, args.seed)
+    print(f"Wrote {rows:,} rows to {Path(args.out).resolve()}")
+
+
+if __name__ == "__main__":
+    main()
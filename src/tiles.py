@@ -0,0 +1,220 @@
+# ============================================================
+# tiles.py
+# XYZ (web-mercator, 256 px) PNG tile pyramid from the heatmap
+# prediction grid
+#   - The scattered grid is rasterized once per hour at the
+#     finest zoom with precomputed linear (Delaunay barycentric)
+#     weights: one sparse matrix product per hour
+#   - Coarser zooms are 2×2 NaN-aware means of the next finer
+#     raster, never re-interpolated
+#   - Values are quantized to a fixed per-pollutant colour scale
+#     and written as palette PNGs (index N_COLORS = transparent)
+#
+# Tiles are content-addressed: each distinct tile is encoded
+# once into blobs/<sha1>.png and every {hour}/{z}/{x}/{y}.png is
+# a hard link to its blob, so an unchanged tile costs a hash and
+# a link rather than an encode and a write. Tiles with no data
+# are not written. Where hard links are not supported the tile is
+# a copy; the store then notes it (COPY_MARKER) and prune() leaves
+# the blobs alone, since a copy does not raise the link count.
+# ============================================================
+
+import hashlib
+import io
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+from scipy import sparse
+from scipy.spatial import Delaunay
+
+# ---------------- CONFIG ----------------
+TILE_SIZE = 256
+N_COLORS = 255              # palette entries; index N_COLORS is transparent
+ALPHA = 200                 # opacity of data pixels
+# ---------------------------------------
+
+
+# ---------------- Web mercator ----------------
+
+def lonlat_to_pixel(lon, lat, z):
+    """Global pixel coordinates at zoom z (y grows southwards)."""
+    scale = TILE_SIZE * 2 ** z
+    x = (np.asarray(lon) + 180.0) / 360.0 * scale
+    s = np.sin(np.radians(lat))
+    y = (0.5 - np.log((1 + s) / (1 - s)) / (4 * np.pi)) * scale
+    return x, y
+
+
+def pixel_to_lonlat(x, y, z):
+    scale = TILE_SIZE * 2 ** z
+    lon = np.asarray(x) / scale * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * np.asarray(y) / scale))))
+    return lon, lat
+
+
+def tile_range(bbox, z):
+    """Inclusive tile range (x0, y0, x1, y1) covering bbox = (lon0, lat0, lon1, lat1)."""
+    x0, y1 = lonlat_to_pixel(bbox[0], bbox[1], z)
+    x1, y0 = lonlat_to_pixel(bbox[2], bbox[3], z)
+    return tuple(int(v // TILE_SIZE) for v in (x0, y0, x1, y1))
+
+
+# ---------------- Rasters ----------------
+
+def downsample(raster, origin):
+    """
+    Next coarser zoom: pad the raster (whose top-left tile is `origin`)
+    to even tile boundaries, then 2×2 NaN-aware means.
+    Returns (raster, origin) at the coarser zoom.
+    """
+    tx, ty = origin
+    h, w = raster.shape
+    left = (tx % 2) * TILE_SIZE
+    top = (ty % 2) * TILE_SIZE
+    right = (-(left + w)) % (2 * TILE_SIZE)
+    bottom = (-(top + h)) % (2 * TILE_SIZE)
+    padded = np.pad(raster, ((top, bottom), (left, right)), constant_values=np.nan)
+
+    valid = ~np.isnan(padded)
+    values = np.where(valid, padded, 0)
+    total = values[0::2, 0::2] + values[0::2, 1::2] + values[1::2, 0::2] + values[1::2, 1::2]
+    count = (valid[0::2, 0::2].astype(np.uint8) + valid[0::2, 1::2]
+             + valid[1::2, 0::2] + valid[1::2, 1::2])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out = np.where(count > 0, total / count, np.nan).astype(raster.dtype)
+    return out, (tx // 2, ty // 2)
+
+
+class TilePyramid:
+
+    def __init__(self, lon, lat, bbox, min_zoom, max_zoom):
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+
+        x0, y0, x1, y1 = tile_range(bbox, max_zoom)
+        self.origin = (x0, y0)
+        self.shape = ((y1 - y0 + 1) * TILE_SIZE, (x1 - x0 + 1) * TILE_SIZE)
+
+        # Pixel centres of the finest raster → barycentric weights on the grid
+        py, px = np.mgrid[0:self.shape[0], 0:self.shape[1]]
+        plon, plat = pixel_to_lonlat(x0 * TILE_SIZE + px.ravel() + 0.5,
+                                     y0 * TILE_SIZE + py.ravel() + 0.5, max_zoom)
+        pts = np.column_stack([lon, lat])
+        tri = Delaunay(pts)
+        xy = np.column_stack([plon, plat])
+        simplex = tri.find_simplex(xy)
+        inside = np.flatnonzero(simplex >= 0)
+
+        T = tri.transform[simplex[inside]]
+        b = np.einsum("nij,nj->ni", T[:, :2], xy[inside] - T[:, 2])
+        bary = np.column_stack([b, 1 - b.sum(axis=1)])
+
+        self.weights = sparse.csr_matrix(
+            (bary.ravel().astype(np.float32),
+             (np.repeat(inside, 3), tri.simplices[simplex[inside]].ravel())),
+            shape=(len(xy), len(pts))
+        )
+        self.outside = np.ones(len(xy), dtype=bool)
+        self.outside[inside] = False
+
+    def rasters(self, values):
+        """dict zoom → (raster, top-left tile) for one grid of values."""
+        r = self.weights @ np.asarray(values, dtype=np.float32)
+        r[self.outside] = np.nan
+        raster, origin = r.reshape(self.shape), self.origin
+
+        out = {self.max_zoom: (raster, origin)}
+        for z in range(self.max_zoom - 1, self.min_zoom - 1, -1):
+            raster, origin = downsample(raster, origin)
+            out[z] = (raster, origin)
+        return out
+
+    def tiles(self, values):
+        """Yield (z, x, y, 256×256 values) for every tile holding data."""
+        for z, (raster, (tx, ty)) in self.rasters(values).items():
+            h, w = raster.shape
+            for j in range(h // TILE_SIZE):
+                for i in range(w // TILE_SIZE):
+                    t = raster[j * TILE_SIZE:(j + 1) * TILE_SIZE, i * TILE_SIZE:(i + 1) * TILE_SIZE]
+                    if not np.isnan(t).all():
+                        yield z, tx + i, ty + j, t
+
+
+# ---------------- Colour / PNG ----------------
+
+def palette(cmap):
+    """RGB palette (N_COLORS + 1 entries, last = transparent) from a matplotlib colormap."""
+    rgb = (cmap(np.linspace(0, 1, N_COLORS))[:, :3] * 255).round().astype(np.uint8)
+    return np.vstack([rgb, [[0, 0, 0]]])
+
+
+def quantize(values, vmin, vmax):
+    """Values → palette indices on a fixed scale; NaN → transparent index."""
+    with np.errstate(invalid="ignore"):
+        idx = np.clip((values - vmin) / (vmax - vmin), 0, 1) * (N_COLORS - 1)
+    return np.where(np.isnan(values), N_COLORS, np.rint(np.nan_to_num(idx))).astype(np.uint8)
+
+
+def encode_png(levels, pal):
+    img = Image.fromarray(levels, mode="P")
+    img.putpalette(pal.ravel().tolist())
+    alpha = bytes([ALPHA] * N_COLORS + [0])
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", transparency=alpha)
+    return buf.getvalue()
+
+
+# ---------------- Content-addressed store ----------------
+
+COPY_MARKER = ".copied"
+
+
+class BlobStore:
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def link(self, levels, pal, dest):
+        """
+        Hard-link dest to the blob for `levels`, encoding it only if no
+        identical tile exists yet. Returns True when a new blob was written.
+        """
+        key = hashlib.sha1(pal.tobytes() + levels.tobytes()).hexdigest()
+        blob = self.root / f"{key}.png"
+
+        created = False
+        if not blob.exists():
+            tmp = blob.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_bytes(encode_png(levels, pal))
+            os.replace(tmp, blob)
+            created = True
+
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(blob, dest)
+        except OSError:
+            shutil.copyfile(blob, dest)
+            (self.root / COPY_MARKER).touch()
+        return created
+
+    def prune(self):
+        """
+        Delete blobs no tile links to any more; returns how many, or
+        None when tiles were copied since the last prune (link counts
+        say nothing then, and the blobs still save re-encoding).
+        """
+        marker = self.root / COPY_MARKER
+        if marker.exists():
+            marker.unlink()
+            return None
+
+        removed = 0
+        for blob in self.root.glob("*.png"):
+            if blob.stat().st_nlink == 1:
+                blob.unlink()
+                removed += 1
+        return removed
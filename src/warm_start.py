@@ -0,0 +1,97 @@
+# ============================================================
+# warm_start.py
+# Incremental retraining policy shared by 04a / 04b
+#   - AQI_TRAIN_MODE=incremental continues boosting the current
+#     registered model on the rows newer than its training window
+#   - Every AQI_FULL_CHECK_EVERY incremental refreshes a full
+#     retrain is run alongside; if the incremental model's
+#     holdout RMSE is worse by more than DRIFT_TOLERANCE, the
+#     full model is promoted instead
+#   - Falls back to a full retrain when there is no current
+#     model or the feature set changed
+#
+# Lineage is recorded in the registry manifest: mode, parent
+# version and incremental steps since the last guard check.
+# A skipped pollutant keeps its row from the previous metrics.csv.
+# ============================================================
+
+import os
+from pathlib import Path
+
+import pandas as pd
+
+# ---------------- CONFIG ----------------
+TRAIN_MODE = os.environ.get("AQI_TRAIN_MODE", "full")             # "full" | "incremental"
+FULL_CHECK_EVERY = int(os.environ.get("AQI_FULL_CHECK_EVERY", "7"))
+DRIFT_TOLERANCE = 0.05      # allowed relative RMSE excess over a full retrain
+INCREMENTAL_ROUNDS = 100    # boosting rounds added per refresh
+# ---------------------------------------
+
+
+def plan(registry, family, pollutant, features, train_rows):
+    """
+    How to train one model. Returns a dict with
+      mode     : "full" | "incremental" | "skip"
+      reason   : short explanation
+      parent   : current version (incremental / skip)
+      new_rows : boolean mask over train_rows (incremental)
+      check    : run a guard full retrain alongside (incremental)
+      steps    : incremental steps since the last guard check
+    """
+    if TRAIN_MODE != "incremental":
+        return {"mode": "full", "reason": f"AQI_TRAIN_MODE={TRAIN_MODE}"}
+    if not registry.has_model(family, pollutant):
+        return {"mode": "full", "reason": "no registered model"}
+
+    parent = registry.current_version(family, pollutant)
+    manifest = registry.manifest(family, pollutant, parent)
+    if manifest["features"] != list(features):
+        return {"mode": "full", "reason": "feature set changed"}
+
+    trained_to = pd.Timestamp(manifest["train_window"]["end"])
+    new_rows = (train_rows["datetime"] > trained_to).values
+    if not new_rows.any():
+        return {"mode": "skip", "reason": f"no rows after {trained_to}", "parent": parent}
+
+    steps = manifest.get("steps_since_check", 0) + 1
+    return {
+        "mode": "incremental",
+        "reason": f"{int(new_rows.sum()):,} new rows after {trained_to}",
+        "parent": parent,
+        "new_rows": new_rows,
+        "check": steps >= FULL_CHECK_EVERY,
+        "steps": steps,
+        "train_start": manifest["train_window"]["start"],
+    }
+
+
+def choose(plan, rmse):
+    """
+    Pick the model to register from the candidates' holdout RMSE
+    ({"incremental": ..., "full": ...}). Returns (mode, manifest fields).
+    """
+    if plan["mode"] == "full":
+        return "full", {"mode": "full", "parent": None, "steps_since_check": 0}
+
+    lineage = {"parent": plan["parent"]}
+    if "full" not in rmse:
+        return "incremental", {"mode": "incremental", "steps_since_check": plan["steps"], **lineage}
+
+    drifted = rmse["incremental"] > rmse["full"] * (1 + DRIFT_TOLERANCE)
+    mode = "full" if drifted else "incremental"
+    guard = {"incremental_rmse": rmse["incremental"], "full_rmse": rmse["full"], "drifted": bool(drifted)}
+    return mode, {"mode": mode, "steps_since_check": 0, "guard": guard, **lineage}
+
+
+def previous_metrics(path):
+    """Rows of a trainer's last metrics.csv by pollutant (carried forward on skip)."""
+    path = Path(path)
+    if not path.exists():
+        return {}
+    try:
+        prev = pd.read_csv(path)
+    except pd.errors.EmptyDataError:
+        return {}
+    if "pollutant" not in prev.columns:
+        return {}
+    return {row["pollutant"]: row for row in prev.to_dict("records")}